@@ -1,8 +1,12 @@
 import base64
+import logging
 import requests
 import datetime
 from clickhouse_connect import get_client
 from keys.keys import API_KEY, PASSWORD
+from cliniko_logging import get_logger, log
+
+logger = get_logger("appointments")
 
 def main():
     # ---------- Cliniko Setup ----------
@@ -18,11 +22,13 @@ def main():
     url = "https://api.au4.cliniko.com/v1/appointments"
     response = requests.get(url, headers=headers)
     if response.status_code != 200:
-        print("Error:", response.status_code, response.text)
+        log(logger, logging.ERROR, "request failed", status=response.status_code, body=response.text[:500])
         raise SystemExit("Failed to fetch data from Cliniko")
 
     data = response.json()
-    print(data)
+    log(logger, logging.INFO, "fetched appointments", count=len(data.get("appointments", [])),
+        total=data.get("total_entries", ""))
+    log(logger, logging.DEBUG, "appointments payload", payload=data)
     # for d in data['appointments']:
     #     print(d , end="\n----------------")
     # The relevant list of appointments
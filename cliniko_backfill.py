@@ -0,0 +1,146 @@
+import datetime
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from cliniko_logging import get_logger, log
+
+# Time-window sliced backfill.
+#
+# An endpoint's history is cut into disjoint [start, end) windows on a
+# timestamp field (created_at by default), halving windows until each holds
+# at most `max_rows` records according to the API's total_entries. The
+# windows are then synced concurrently. The plan and
+# each finished window are kept in a JSON checkpoint file, so an interrupted
+# backfill resumes with the windows that have not finished yet. The checkpoint
+# also keeps when the plan was made and when each window was first started:
+# the earliest of those bounds the watermark of a resumed backfill.
+
+logger = get_logger("backfill")
+
+def format_timestamp(value):
+    return value.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def parse_timestamp(value):
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+def plan_windows(start, end, count, max_rows, min_span):
+    """
+    Split [start, end) into windows holding at most `max_rows` records each,
+    halving any window for which `count(start, end)` is larger (down to
+    `min_span`). Empty windows are dropped. Boundaries are whole seconds so
+    `>=` / `<` filters on them never overlap or leave gaps.
+    Returns dicts with start, end (ISO strings) and total, in time order.
+    """
+    windows = []
+    stack = [(start.replace(microsecond=0), end)]
+    while stack:
+        window_start, window_end = stack.pop()
+        total = count(window_start, window_end)
+        if not total:
+            continue
+        span = window_end - window_start
+        if total > max_rows and span > min_span:
+            middle = window_start + datetime.timedelta(seconds=span.total_seconds() // 2)
+            stack.append((middle, window_end))
+            stack.append((window_start, middle))
+            continue
+        windows.append({"start": format_timestamp(window_start), "end": format_timestamp(window_end), "total": total})
+    return windows
+
+class BackfillCheckpoint:
+    """
+    Window plans and progress per endpoint, persisted to a JSON file after
+    every change. Thread-safe.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.state = json.load(f)
+
+    def plan(self, key):
+        with self.lock:
+            entry = self.state.get(key)
+            return entry["windows"] if entry else None
+
+    def save_plan(self, key, windows, planned_at):
+        with self.lock:
+            self.state[key] = {
+                "planned_at": format_timestamp(planned_at),
+                "windows": [dict(window, done=False, rows=0) for window in windows],
+            }
+            self._save()
+            return self.state[key]["windows"]
+
+    def mark_started(self, key, index):
+        with self.lock:
+            window = self.state[key]["windows"][index]
+            if "started_at" not in window:
+                window["started_at"] = format_timestamp(datetime.datetime.now(datetime.timezone.utc))
+                self._save()
+
+    def started_at(self, key):
+        """
+        Earliest of the plan time and the first start of each window, or None
+        for a plan saved without them. Records updated after it may have been
+        missed by the windows, so it bounds the backfill's watermark.
+        """
+        with self.lock:
+            entry = self.state.get(key) or {}
+            times = [entry.get("planned_at")] + [window.get("started_at") for window in entry.get("windows", [])]
+            times = [parse_timestamp(value) for value in times if value]
+            return min(times) if times else None
+
+    def mark_done(self, key, index, rows):
+        with self.lock:
+            window = self.state[key]["windows"][index]
+            window.update(done=True, rows=rows,
+                          finished_at=format_timestamp(datetime.datetime.now(datetime.timezone.utc)))
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(temporary, self.path)
+
+def run_windows(key, windows, sync_window, checkpoint, workers):
+    """
+    Call `sync_window(window)` for every unfinished window on up to `workers`
+    threads; it returns the window's fetch stats (with a `rows` count).
+    Returns the stats of the windows synced now. A failed window stays
+    unfinished; the first error is re-raised after the other windows ran.
+    """
+    pending = [(index, window) for index, window in enumerate(windows) if not window.get("done")]
+    log(logger, logging.INFO, "backfill windows", key=key, windows=len(windows), pending=len(pending))
+    results = []
+    error = None
+
+    def start(index, window):
+        checkpoint.mark_started(key, index)
+        return sync_window(window)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="cliniko-backfill") as executor:
+        futures = {executor.submit(start, index, window): (index, window) for index, window in pending}
+        for future in as_completed(futures):
+            index, window = futures[future]
+            try:
+                result = future.result()
+            except BaseException as e:
+                log(logger, logging.ERROR, "backfill window failed", key=key, start=window["start"],
+                    end=window["end"], error=repr(e))
+                error = error or e
+                continue
+            checkpoint.mark_done(key, index, result["rows"])
+            results.append(result)
+    if error is not None:
+        raise error
+    return results
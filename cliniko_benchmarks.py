@@ -0,0 +1,121 @@
+import argparse
+import json
+import time
+import tracemalloc
+
+import production_script_cliniko_instance1 as sync
+from cliniko_synthetic import make_records
+
+# Offline throughput benchmarks for the transform_* functions, fed with
+# synthetic Cliniko payloads so no API key or network is needed.
+#
+#   python cliniko_benchmarks.py                          # print results
+#   python cliniko_benchmarks.py --save-baseline base.json
+#   python cliniko_benchmarks.py --compare base.json      # exit 1 on regression
+
+DEFAULT_RECORDS = 20_000
+DEFAULT_TOLERANCE = 0.15  # Allowed fractional drop in rows/sec before flagging a regression
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def bench_transform(transform_fn, items, repeat=3):
+    """
+    Measure one transform over `items`:
+    - rows_per_sec: best of `repeat` timed passes over the whole list
+    - p50_us / p99_us: per-record latency from a separate, individually timed pass
+    - bytes_per_row: tracemalloc peak of a pass that keeps every row, per row
+    """
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in items:
+            transform_fn(item)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    clock = time.perf_counter_ns
+    latencies = []
+    for item in items:
+        started = clock()
+        transform_fn(item)
+        latencies.append(clock() - started)
+    latencies.sort()
+
+    tracemalloc.start()
+    rows = [transform_fn(item) for item in items]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del rows
+
+    return {
+        "rows": len(items),
+        "rows_per_sec": len(items) / best if best else 0.0,
+        "p50_us": percentile(latencies, 0.50) / 1000,
+        "p99_us": percentile(latencies, 0.99) / 1000,
+        "bytes_per_row": peak / len(items) if items else 0.0,
+    }
+
+def run_benchmarks(records=DEFAULT_RECORDS, endpoints=None):
+    results = {}
+    for endpoint in sync.ENDPOINTS:
+        if endpoints and endpoint.name not in endpoints:
+            continue
+        items = make_records(endpoint.name, records)
+        results[endpoint.transform.__name__] = bench_transform(endpoint.transform, items)
+    return results
+
+def print_results(results, baseline=None):
+    header = f"{'transform':<42}{'rows/s':>12}{'p50 us':>10}{'p99 us':>10}{'B/row':>10}"
+    if baseline:
+        header += f"{'vs base':>10}"
+    print(header)
+    for name, r in results.items():
+        line = (f"{name:<42}{r['rows_per_sec']:>12.0f}{r['p50_us']:>10.2f}"
+                f"{r['p99_us']:>10.2f}{r['bytes_per_row']:>10.0f}")
+        if baseline and name in baseline:
+            change = r["rows_per_sec"] / baseline[name]["rows_per_sec"] - 1
+            line += f"{change:>+10.1%}"
+        print(line)
+
+def find_regressions(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Names of transforms whose rows/sec dropped more than `tolerance` below baseline.
+    """
+    return [
+        name for name, r in results.items()
+        if name in baseline and r["rows_per_sec"] < baseline[name]["rows_per_sec"] * (1 - tolerance)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Cliniko transform functions offline.")
+    parser.add_argument("--records", type=int, default=DEFAULT_RECORDS,
+                        help="synthetic records per endpoint")
+    parser.add_argument("--endpoint", action="append",
+                        help="only benchmark this endpoint (repeatable)")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a saved JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.records, args.endpoint)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+    if baseline:
+        regressions = find_regressions(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import array
+import bisect
+
+# Compact sets of 64-bit record ids, for comparing millions of Cliniko ids
+# against ClickHouse without holding Python int sets.
+#
+# Uses pyroaring's BitMap64 when it is installed. Otherwise ids are stored in
+# the same layout as a roaring bitmap: the high 48 bits pick a container and
+# the low 16 bits go into a sorted uint16 array, switched to a 8 KiB bitmap
+# once it holds more than ARRAY_CONTAINER_MAX values.
+
+ARRAY_CONTAINER_MAX = 4096
+BITMAP_CONTAINER_BYTES = 1 << 13  # 65536 bits
+
+def roaring_available():
+    try:
+        from pyroaring import BitMap64  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+class IdBitmap:
+    """
+    Set of non-negative integer ids supporting add, membership, len and
+    ascending iteration.
+    """
+
+    def __init__(self, ids=(), use_roaring=None):
+        if use_roaring is None:
+            use_roaring = roaring_available()
+        if use_roaring:
+            from pyroaring import BitMap64
+
+            self._roaring = BitMap64()
+        else:
+            self._roaring = None
+            self._containers = {}  # high bits -> array("H") or bytearray
+            self._count = 0
+        self.update(ids)
+
+    def add(self, value):
+        if self._roaring is not None:
+            self._roaring.add(value)
+            return
+        high, low = value >> 16, value & 0xFFFF
+        container = self._containers.get(high)
+        if container is None:
+            self._containers[high] = array.array("H", (low,))
+            self._count += 1
+        elif isinstance(container, bytearray):
+            byte, bit = low >> 3, 1 << (low & 7)
+            if not container[byte] & bit:
+                container[byte] |= bit
+                self._count += 1
+        elif container[-1] < low:
+            # Ids mostly arrive in ascending order (keyset pagination), so appending is the fast path
+            container.append(low)
+            self._count += 1
+            self._maybe_convert(high, container)
+        else:
+            index = bisect.bisect_left(container, low)
+            if container[index] != low:
+                container.insert(index, low)
+                self._count += 1
+                self._maybe_convert(high, container)
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+
+    def __contains__(self, value):
+        if self._roaring is not None:
+            return value in self._roaring
+        container = self._containers.get(value >> 16)
+        if container is None:
+            return False
+        low = value & 0xFFFF
+        if isinstance(container, bytearray):
+            return bool(container[low >> 3] & (1 << (low & 7)))
+        index = bisect.bisect_left(container, low)
+        return index < len(container) and container[index] == low
+
+    def __len__(self):
+        if self._roaring is not None:
+            return len(self._roaring)
+        return self._count
+
+    def __iter__(self):
+        if self._roaring is not None:
+            yield from self._roaring
+            return
+        for high in sorted(self._containers):
+            container = self._containers[high]
+            base = high << 16
+            if isinstance(container, bytearray):
+                for byte_index, byte in enumerate(container):
+                    while byte:
+                        bit = byte & -byte
+                        yield base + (byte_index << 3) + bit.bit_length() - 1
+                        byte ^= bit
+            else:
+                for low in container:
+                    yield base + low
+
+    def max(self):
+        if not len(self):
+            return None
+        if self._roaring is not None:
+            return self._roaring.max()
+        high = max(self._containers)
+        container = self._containers[high]
+        if isinstance(container, bytearray):
+            byte_index = max(i for i, byte in enumerate(container) if byte)
+            low = (byte_index << 3) + container[byte_index].bit_length() - 1
+        else:
+            low = container[-1]
+        return (high << 16) + low
+
+    def nbytes(self):
+        """
+        Approximate memory held by the id data.
+        """
+        if self._roaring is not None:
+            return len(self._roaring.serialize())
+        return sum(
+            len(c) if isinstance(c, bytearray) else c.itemsize * len(c) for c in self._containers.values()
+        )
+
+    def _maybe_convert(self, high, container):
+        if len(container) <= ARRAY_CONTAINER_MAX:
+            return
+        bitmap = bytearray(BITMAP_CONTAINER_BYTES)
+        for low in container:
+            bitmap[low >> 3] |= 1 << (low & 7)
+        self._containers[high] = bitmap
@@ -0,0 +1,276 @@
+import datetime
+import gzip
+import json
+import logging
+import os
+import re
+import time
+
+from cliniko_logging import get_logger, log
+
+BULK_FORMATS = ("parquet", "jsonl")
+BULK_ROWS_PER_FILE = 1_000_000  # Rotate to a new part file after this many rows
+PARQUET_ROW_GROUP_SIZE = 100_000
+MANIFEST_NAME = "manifest.json"
+
+logger = get_logger("bulk_load")
+
+def default_bulk_format():
+    """
+    Parquet when pyarrow is installed, gzip-compressed JSONEachRow otherwise.
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return "jsonl"
+    return "parquet"
+
+class BulkFileWriter:
+    """
+    Stand-in for a ClickHouse client that writes inserted rows to local files.
+
+    Each table gets its own sub-directory of compressed part files plus a
+    manifest with the column names, so the files can be loaded later by
+    `load_bulk_directory` without re-running any transform.
+    `column_types` ({table: {column: ClickHouse type}}, see ddl_column_types)
+    types the Parquet columns that cannot be told from their values.
+    """
+
+    def __init__(self, directory, fmt=None, rows_per_file=BULK_ROWS_PER_FILE, column_types=None):
+        self.directory = directory
+        self.fmt = fmt or default_bulk_format()
+        if self.fmt not in BULK_FORMATS:
+            raise ValueError(f"Unknown bulk format: {self.fmt}")
+        self.rows_per_file = rows_per_file
+        self.column_types = column_types or {}
+        self.tables = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def insert(self, table, data, column_names):
+        writer = self.tables.get(table)
+        if writer is None:
+            writer_cls = _ParquetTableWriter if self.fmt == "parquet" else _JsonTableWriter
+            writer = writer_cls(os.path.join(self.directory, table), column_names, self.rows_per_file,
+                                self.column_types.get(table))
+            self.tables[table] = writer
+        writer.write(data)
+
+    def close(self):
+        for writer in self.tables.values():
+            writer.close()
+        self.tables = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class _TableWriter:
+    """
+    Shared part-file rotation and manifest handling for one table.
+    """
+    extension = ""
+    clickhouse_format = ""
+
+    def __init__(self, directory, columns, rows_per_file, types=None):
+        self.directory = directory
+        self.columns = list(columns)
+        self.rows_per_file = rows_per_file
+        self.types = types or {}  # column -> ClickHouse type
+        self.files = []
+        self.rows = 0
+        self.rows_in_file = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _next_path(self):
+        path = os.path.join(self.directory, f"part-{len(self.files):05d}.{self.extension}")
+        self.files.append(os.path.basename(path))
+        self.rows_in_file = 0
+        return path
+
+    def write(self, rows):
+        raise NotImplementedError
+
+    def close(self):
+        manifest = {
+            "columns": self.columns,
+            "format": self.clickhouse_format,
+            "files": self.files,
+            "rows": self.rows,
+        }
+        with open(os.path.join(self.directory, MANIFEST_NAME), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+class _JsonTableWriter(_TableWriter):
+    extension = "jsonl.gz"
+    clickhouse_format = "JSONEachRow"
+
+    def __init__(self, directory, columns, rows_per_file, types=None):
+        super().__init__(directory, columns, rows_per_file, types)
+        self.file = None
+
+    def write(self, rows):
+        for row in rows:
+            if self.file is None or self.rows_in_file >= self.rows_per_file:
+                if self.file is not None:
+                    self.file.close()
+                self.file = gzip.open(self._next_path(), "wt", encoding="utf-8")
+            self.file.write(json.dumps(dict(zip(self.columns, row)), default=_json_value))
+            self.file.write("\n")
+            self.rows_in_file += 1
+            self.rows += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        super().close()
+
+class _ParquetTableWriter(_TableWriter):
+    extension = "parquet"
+    clickhouse_format = "Parquet"
+
+    def __init__(self, directory, columns, rows_per_file, types=None):
+        super().__init__(directory, columns, rows_per_file, types)
+        self.writer = None
+        self.schema = None
+        self.buffer = []
+
+    def write(self, rows):
+        self.buffer.extend(rows)
+        if len(self.buffer) >= PARQUET_ROW_GROUP_SIZE:
+            self._flush()
+
+    def _flush(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        while self.buffer:
+            if self.writer is None or self.rows_in_file >= self.rows_per_file:
+                if self.writer is not None:
+                    self.writer.close()
+                if self.schema is None:
+                    self.schema = _infer_arrow_schema(self.columns, self.buffer, self.types)
+                self.writer = pq.ParquetWriter(self._next_path(), self.schema, compression="zstd")
+            take = min(len(self.buffer), self.rows_per_file - self.rows_in_file)
+            rows, self.buffer = self.buffer[:take], self.buffer[take:]
+            arrays = [
+                _arrow_array([row[i] for row in rows], field.type)
+                for i, field in enumerate(self.schema)
+            ]
+            self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+            self.rows_in_file += len(rows)
+            self.rows += len(rows)
+
+    def close(self):
+        self._flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        super().close()
+
+def _json_value(value):
+    """
+    JSON encoder fallback: datetimes become UTC 'YYYY-MM-DD hh:mm:ss.fff' strings,
+    which ClickHouse parses straight into DateTime64(3, 'UTC'), and dates become
+    'YYYY-MM-DD' strings for Date columns.
+    """
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc)
+        return value.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+def ddl_column_types(statements):
+    """
+    {table: {column: ClickHouse type}} from the CREATE TABLE statements among
+    `statements`.
+    """
+    types = {}
+    for statement in statements:
+        table = _CREATE_TABLE.search(statement)
+        if table is None:
+            continue
+        columns = types.setdefault(table.group(1), {})
+        body = statement[table.end():statement.find(") ENGINE", table.end())]
+        for match in _COLUMN_TYPE.finditer(body):
+            columns[match.group(1)] = match.group(2)
+    return types
+
+_CREATE_TABLE = re.compile(r"CREATE TABLE IF NOT EXISTS (\w+) \(")
+_COLUMN_TYPE = re.compile(r"^\s+(\w+)\s+([A-Z][\w(), ']*?),?\s*(?:--.*)?$", re.M)  # "    name    Type,  -- note"
+
+def _infer_arrow_schema(columns, rows, types=None):
+    """
+    Pick an Arrow type per column from the first non-None value.
+    The transforms only emit None for parsed datetimes, so a column that is
+    None in every buffered row is typed as a timestamp. UInt64 columns in
+    `types` (hashes, flag masks) are unsigned, since their values can pass
+    the signed 64-bit range.
+    """
+    import pyarrow as pa
+
+    types = types or {}
+    fields = []
+    for i, name in enumerate(columns):
+        sample = next((row[i] for row in rows if row[i] is not None), None)
+        if types.get(name) in ("UInt64", "Nullable(UInt64)"):
+            arrow_type = pa.uint64()
+        elif isinstance(sample, int):
+            arrow_type = pa.int64()
+        elif isinstance(sample, float):
+            arrow_type = pa.float64()
+        elif isinstance(sample, str):
+            arrow_type = pa.string()
+        elif isinstance(sample, (list, tuple)):
+            arrow_type = pa.list_(pa.string())
+        elif isinstance(sample, datetime.date) and not isinstance(sample, datetime.datetime):
+            arrow_type = pa.date32()
+        else:
+            arrow_type = pa.timestamp("ms", tz="UTC")
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+def _arrow_array(values, arrow_type):
+    import pyarrow as pa
+
+    if pa.types.is_list(arrow_type):
+        values = [[str(v) for v in value] if value is not None else [] for value in values]
+    return pa.array(values, type=arrow_type)
+
+def load_bulk_directory(client, directory, tables=None):
+    """
+    Load every table written by BulkFileWriter into ClickHouse, one streamed
+    insert per part file. `tables` optionally limits which tables are loaded.
+    """
+    from clickhouse_connect.driver.tools import insert_file
+
+    for table in sorted(os.listdir(directory)):
+        manifest_path = os.path.join(directory, table, MANIFEST_NAME)
+        if not os.path.exists(manifest_path) or (tables and table not in tables):
+            continue
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        settings = {}
+        compression = None
+        if manifest["format"] == "JSONEachRow":
+            settings["date_time_input_format"] = "best_effort"
+            settings["input_format_json_read_numbers_as_strings"] = 1
+            compression = "gzip"
+        for file_name in manifest["files"]:
+            started = time.perf_counter()
+            insert_file(
+                client,
+                table,
+                os.path.join(directory, table, file_name),
+                fmt=manifest["format"],
+                column_names=manifest["columns"],
+                settings=settings,
+                compression=compression,
+            )
+            log(logger, logging.INFO, "loaded bulk file", table=table, file=file_name,
+                seconds=time.perf_counter() - started)
+        log(logger, logging.INFO, "loaded table", table=table, rows=manifest["rows"])
@@ -0,0 +1,129 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+# Building blocks for syncing several endpoints at once:
+# - run_dag runs tasks as soon as their dependencies have finished
+# - RateLimiter is a token bucket shared by every thread calling the API
+# - SessionPool hands each worker thread its own (kept warm) HTTP session
+
+def topological_order(dependencies):
+    """
+    Task names ordered so every task comes after its dependencies. Ties keep
+    the order of `dependencies`. Raises ValueError on unknown names or cycles.
+    """
+    for name, needs in dependencies.items():
+        unknown = [need for need in needs if need not in dependencies]
+        if unknown:
+            raise ValueError(f"{name} depends on unknown task(s) {', '.join(unknown)}")
+    order = []
+    done = set()
+    remaining = list(dependencies)
+    while remaining:
+        ready = [name for name in remaining if all(need in done for need in dependencies[name])]
+        if not ready:
+            raise ValueError(f"Dependency cycle between {', '.join(remaining)}")
+        order.append(ready[0])
+        done.add(ready[0])
+        remaining.remove(ready[0])
+    return order
+
+def run_dag(tasks, dependencies, workers=1):
+    """
+    Run `tasks` (name -> zero-argument callable) respecting `dependencies`
+    (name -> names that must finish first) on up to `workers` threads.
+
+    Among ready tasks, the one listed first in `tasks` starts first, so list
+    latency-critical tasks early. Returns name -> result. After a failure no
+    new tasks start; running ones finish and the first error is re-raised.
+    """
+    dependencies = {name: tuple(need for need in dependencies.get(name, ()) if need in tasks) for name in tasks}
+    order = topological_order(dependencies)
+    results = {}
+    if workers <= 1:
+        for name in order:
+            results[name] = tasks[name]()
+        return results
+
+    priority = {name: index for index, name in enumerate(tasks)}
+    pending = set(tasks)
+    running = {}  # future -> name
+    error = None
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cliniko-sync") as executor:
+        while pending or running:
+            if error is None:
+                ready = sorted(
+                    (name for name in pending if all(need in results for need in dependencies[name])),
+                    key=priority.get,
+                )
+                for name in ready[:workers - len(running)]:
+                    pending.discard(name)
+                    running[executor.submit(tasks[name])] = name
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except BaseException as e:
+                    error = error or e
+    if error is not None:
+        raise error
+    return results
+
+class RateLimiter:
+    """
+    Token bucket allowing `per_minute` acquisitions per minute with bursts of
+    up to `burst`. Thread-safe; `per_minute=0` disables limiting.
+    """
+
+    def __init__(self, per_minute, burst=None):
+        self.per_minute = per_minute
+        self.burst = burst or max(1, per_minute // 20)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take one token, sleeping until it is available. Returns seconds waited.
+        """
+        if not self.per_minute:
+            return 0.0
+        per_second = self.per_minute / 60.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * per_second)
+            self.updated = now
+            # Reserve the token now, even if it is only available later
+            self.tokens -= 1
+            wait_seconds = -self.tokens / per_second if self.tokens < 0 else 0.0
+        if wait_seconds:
+            time.sleep(wait_seconds)
+        return wait_seconds
+
+class SessionPool:
+    """
+    Reusable HTTP sessions for worker threads. A session is used by one thread
+    at a time and goes back to the pool afterwards, so connections stay warm
+    across endpoints and daemon cycles.
+    """
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self.idle = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def session(self):
+        with self.lock:
+            session = self.idle.pop() if self.idle else None
+        if session is None:
+            session = self.session_factory()
+        try:
+            yield session
+        finally:
+            with self.lock:
+                self.idle.append(session)
@@ -0,0 +1,117 @@
+import datetime
+import sys
+import threading
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# In-memory copies of the dimension tables (practitioners, businesses and
+# appointment types in full, patients as pages reference them), used to
+# denormalize fact rows while they are inserted instead of joining at query time.
+#
+# Each cache keeps one dict from record id to a row position, and one list
+# per column indexed by that position, so a lookup is a single dict probe
+# and no per-record dict or tuple is kept around.
+#
+# TimeZoneMap is the business -> time zone lookup behind the local_date /
+# local_hour / local_weekday columns.
+
+class DimensionCache:
+    """
+    Columns of one dimension table looked up by record id.
+    """
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+        self.positions = {}  # id -> index into each column list
+        self.values = {column: [] for column in self.columns}
+        self.missing = set()  # ids looked up but not found, for caches filled on demand
+        self.lock = threading.Lock()
+
+    def load(self, rows):
+        """
+        Add `rows` of (id, *values in `columns` order); a known id is overwritten.
+        Safe to call while other threads look ids up.
+        """
+        with self.lock:
+            for record_id, *values in rows:
+                position = self.positions.get(record_id)
+                if position is None:
+                    # Values first, so a concurrent get never sees a position without them
+                    for column, value in zip(self.columns, values):
+                        self.values[column].append(_intern(value))
+                    self.positions[record_id] = len(self.positions)
+                else:
+                    for column, value in zip(self.columns, values):
+                        self.values[column][position] = _intern(value)
+        return self
+
+    def get(self, record_id, column, default=""):
+        position = self.positions.get(record_id)
+        if position is None:
+            return default
+        return self.values[column][position]
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, record_id):
+        return record_id in self.positions
+
+class TimeZoneMap:
+    """
+    Time zone of each business by id. Unknown businesses and zone names use
+    `default`.
+    """
+
+    def __init__(self, default="UTC"):
+        self.default = ZoneInfo(default)
+        self.zones = {}  # business id -> ZoneInfo
+        self.lock = threading.Lock()
+
+    def set(self, business_id, name):
+        try:
+            zone = ZoneInfo(name) if name else self.default
+        except (ZoneInfoNotFoundError, ValueError):
+            zone = self.default
+        with self.lock:
+            self.zones[business_id] = zone
+
+    def local_parts(self, value, business_id):
+        """
+        (local date, hour, ISO weekday 1-7) of `value` in the business's time
+        zone; naive values are taken as UTC. (None, 0, 0) when `value` is None.
+        """
+        if value is None:
+            return None, 0, 0
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        local = value.astimezone(self.zone(business_id))
+        return local.date(), local.hour, local.isoweekday()
+
+    def zone(self, business_id):
+        return self.zones.get(business_id, self.default)
+
+    def __len__(self):
+        return len(self.zones)
+
+class LoadOnce:
+    """
+    Calls `load()` on first use and hands every caller (from any thread) the
+    same result afterwards.
+    """
+
+    def __init__(self, load):
+        self.load = load
+        self.lock = threading.Lock()
+        self.value = None
+        self.loaded = False
+
+    def __call__(self):
+        with self.lock:
+            if not self.loaded:
+                self.value = self.load()
+                self.loaded = True
+            return self.value
+
+def _intern(value):
+    # Names and designations repeat across rows; share one string object each
+    return sys.intern(value) if isinstance(value, str) else value
@@ -0,0 +1,136 @@
+import json
+import re
+
+# Keyword flags derived from free-text fields (appointment and invoice notes,
+# communication content), stored as one UInt64 bitmask per field.
+#
+# A rule table of (flag name, keywords) is compiled into one Aho-Corasick
+# automaton, so each text is scanned once no matter how many rules there
+# are. Matching is case-insensitive and by substring, like `keyword in
+# text.lower()`. Bit n of a mask is the n-th rule; rules are only ever
+# appended, since reordering them changes the meaning of stored masks.
+#
+# Uses pyahocorasick when it is installed. Otherwise the keyword trie is
+# compiled into one regular expression whose alternatives share prefixes, so
+# the regex engine walks the trie in C instead of a per-character Python
+# loop; each search resumes one character after the previous match start, so
+# overlapping keywords are found too.
+
+MAX_FLAGS = 64  # Bits in the UInt64 mask columns
+
+# (flag name, keywords); append only. Keywords match inside words, so they
+# must not be short enough to turn up in ordinary ones ("dva" is in "advance")
+DEFAULT_FLAG_RULES = [
+    ("no_charge", ("no charge", "opening special")),
+    ("intro_offer", ("intro",)),
+    ("follow_up", ("follow up", "follow-up", "review in")),
+    ("referral", ("referred by", "referral")),
+    ("health_fund", ("health fund", "hicaps", "medicare", "veterans affairs", "veterans' affairs")),
+    ("workers_comp", ("workcover", "workers comp")),
+    ("late_cancellation", ("late cancel", "cancellation fee")),
+    ("telehealth", ("telehealth", "video call")),
+]
+
+def ahocorasick_available():
+    try:
+        import ahocorasick  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def load_flag_rules(path):
+    """
+    Rules from a JSON file holding a list of [name, [keywords...]] pairs.
+    """
+    with open(path, encoding="utf-8") as handle:
+        return [(name, tuple(keywords)) for name, keywords in json.load(handle)]
+
+class FlagMatcher:
+    """
+    Bitmask of the rules whose keywords occur in a text.
+    """
+
+    def __init__(self, rules, use_ahocorasick=None):
+        rules = list(rules)
+        if len(rules) > MAX_FLAGS:
+            raise ValueError(f"At most {MAX_FLAGS} flag rules fit in a mask, got {len(rules)}")
+        self.names = tuple(name for name, _ in rules)
+        if len(set(self.names)) != len(self.names):
+            raise ValueError("Flag rule names must be unique")
+        keyword_masks = {}  # lowercased keyword -> bits of every rule listing it
+        for bit, (_, keywords) in enumerate(rules):
+            for keyword in keywords:
+                keyword = keyword.lower()
+                if keyword:
+                    keyword_masks[keyword] = keyword_masks.get(keyword, 0) | (1 << bit)
+        self.all_bits = (1 << len(rules)) - 1
+        if use_ahocorasick is None:
+            use_ahocorasick = ahocorasick_available()
+        self._automaton = None
+        self._pattern = None
+        if use_ahocorasick and keyword_masks:
+            import ahocorasick
+
+            self._automaton = ahocorasick.Automaton()
+            for keyword, mask in keyword_masks.items():
+                self._automaton.add_word(keyword, mask)
+            self._automaton.make_automaton()
+        elif keyword_masks:
+            self._build(keyword_masks)
+
+    def mask(self, text):
+        """
+        Bits of every rule with a keyword in `text` (0 for empty or None).
+        """
+        if not text:
+            return 0
+        text = text.lower()
+        mask = 0
+        if self._automaton is not None:
+            for _, bits in self._automaton.iter(text):
+                mask |= bits
+            return mask
+        if self._pattern is None:
+            return 0
+        search, masks, all_bits = self._pattern.search, self._masks, self.all_bits
+        match = search(text)
+        while match is not None:
+            mask |= masks[match.group()]
+            if mask == all_bits:
+                break
+            match = search(text, match.start() + 1)
+        return mask
+
+    def flags(self, mask):
+        """
+        Names of the rules set in `mask`, in rule order.
+        """
+        return [name for bit, name in enumerate(self.names) if mask >> bit & 1]
+
+    def _build(self, keyword_masks):
+        trie = {}
+        for keyword in keyword_masks:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[""] = {}  # end of a keyword
+        self._pattern = re.compile(_trie_regex(trie))
+        # A search reports the longest keyword starting at a position; the
+        # shorter ones starting there are its prefixes, so fold their bits in
+        self._masks = {
+            keyword: _prefix_bits(keyword, keyword_masks) for keyword in keyword_masks
+        }
+
+def _trie_regex(node):
+    # Longer continuations come before the end-of-keyword alternative, so
+    # the regex prefers the longest keyword at each position
+    branches = [re.escape(char) + _trie_regex(child) for char, child in sorted(node.items()) if char]
+    if "" in node:
+        return f"(?:{'|'.join(branches)})?" if branches else ""
+    return branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+
+def _prefix_bits(keyword, keyword_masks):
+    bits = 0
+    for end in range(1, len(keyword) + 1):
+        bits |= keyword_masks.get(keyword[:end], 0)
+    return bits
@@ -0,0 +1,244 @@
+import logging
+import queue
+import threading
+import time
+
+from cliniko_logging import get_logger, log
+from cliniko_metrics import METRICS
+
+logger = get_logger("insert_pool")
+
+class ClickHouseInsertPool:
+    """
+    A pool of ClickHouse clients that run inserts on background threads.
+
+    The pool exposes the same `insert` / `command` surface as a single
+    clickhouse_connect client, so any fetcher that takes a `client` can hand
+    its batches to the pool instead.
+
+    - Each connection owns one client, one worker thread and a bounded queue,
+      so a fetcher blocks (instead of buffering unbounded memory) when every
+      connection is busy.
+    - Tables listed in `ordered_tables` are always routed to the same
+      connection, which keeps their batches in insertion order. Every other
+      batch goes to the least loaded connection.
+    - `command` and `query` run synchronously on a dedicated client, so DDL
+      never waits behind queued inserts.
+    - An insert failure is re-raised on the next `insert` into or `flush` of
+      the same table, or on the next full `flush` / `close`, so endpoints
+      synced in parallel only see their own failures.
+    - `flush(table)` waits for one table's batches only, so endpoints synced
+      in parallel do not wait on each other.
+    - Clients are created on first use, so building the pool does not open
+      any connections.
+    """
+
+    def __init__(self, client_factory, size=4, ordered_tables=(), max_pending=4):
+        if size < 1:
+            raise ValueError("Insert pool size must be at least 1")
+        self.client_factory = client_factory
+        self.ordered_tables = set(ordered_tables)
+        self._command_client = None
+        self._pending = {}  # table -> batches submitted but not yet inserted
+        self._pending_changed = threading.Condition()
+        self.connections = [
+            _InsertConnection(index, client_factory, max_pending, self._record_error, self._batch_done)
+            for index in range(size)
+        ]
+        self._errors = {}  # table -> first insert error not raised yet
+        self._failures = {}  # table -> batches that failed so far, raised or not
+        self._errors_lock = threading.Lock()
+
+    # ---------- Client surface ----------
+
+    @property
+    def command_client(self):
+        if self._command_client is None:
+            self._command_client = self.client_factory()
+        return self._command_client
+
+    def insert(self, table, data, column_names):
+        self._raise_pending_error(table)
+        if not data:
+            return
+        with self._pending_changed:
+            self._pending[table] = self._pending.get(table, 0) + 1
+        self._pick_connection(table).submit(table, list(data), column_names)
+
+    def command(self, cmd, *args, **kwargs):
+        return self.command_client.command(cmd, *args, **kwargs)
+
+    def query(self, query, *args, **kwargs):
+        return self.command_client.query(query, *args, **kwargs)
+
+    # ---------- Lifecycle ----------
+
+    def flush(self, table=None):
+        """
+        Block until every queued batch (or every batch for `table`) has been inserted.
+        """
+        if table is None:
+            for connection in self.connections:
+                connection.tasks.join()
+        else:
+            with self._pending_changed:
+                self._pending_changed.wait_for(lambda: not self._pending.get(table))
+        self._raise_pending_error(table)
+
+    def close(self):
+        """
+        Flush outstanding batches, stop the workers and close all clients.
+        """
+        try:
+            self.flush()
+        finally:
+            for connection in self.connections:
+                connection.stop()
+            for client in [self._command_client] + [c.client for c in self.connections]:
+                close = getattr(client, "close", None) if client is not None else None
+                if close:
+                    close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # ---------- Stats ----------
+
+    def stats(self):
+        """
+        Return insert latency/throughput counters for each connection.
+        """
+        return [connection.stats() for connection in self.connections]
+
+    def table_stats(self):
+        """
+        Return batches, rows and seconds spent inserting, summed per table.
+        """
+        totals = {}
+        for connection in self.connections:
+            with connection.lock:
+                for table, (batches, rows, seconds) in connection.tables.items():
+                    total = totals.setdefault(table, {"batches": 0, "rows": 0, "seconds": 0.0})
+                    total["batches"] += batches
+                    total["rows"] += rows
+                    total["seconds"] += seconds
+        return totals
+
+    def failed_batches(self, table):
+        """
+        Number of `table`'s batches whose insert failed since the pool started.
+        """
+        with self._errors_lock:
+            return self._failures.get(table, 0)
+
+    def log_stats(self):
+        for s in self.stats():
+            log(logger, logging.INFO, "insert connection stats", **s)
+
+    # ---------- Internals ----------
+
+    def _pick_connection(self, table):
+        if table in self.ordered_tables:
+            return self.connections[hash(table) % len(self.connections)]
+        return min(self.connections, key=lambda c: c.tasks.unfinished_tasks)
+
+    def _batch_done(self, table):
+        with self._pending_changed:
+            self._pending[table] -= 1
+            if not self._pending[table]:
+                self._pending_changed.notify_all()
+
+    def _record_error(self, table, error):
+        with self._errors_lock:
+            self._errors.setdefault(table, error)
+            self._failures[table] = self._failures.get(table, 0) + 1
+
+    def _raise_pending_error(self, table=None):
+        """
+        Raise the pending error of `table` (of any table when None).
+        """
+        with self._errors_lock:
+            if table is None:
+                table = next(iter(self._errors), None)
+            error = self._errors.pop(table, None)
+        if error is not None:
+            raise error
+
+class _InsertConnection:
+    """
+    One pooled client plus the worker thread that drains its queue.
+    """
+
+    def __init__(self, index, client_factory, max_pending, on_error, on_done):
+        self.index = index
+        self.client_factory = client_factory
+        self.client = None
+        self.tasks = queue.Queue(maxsize=max_pending)
+        self.on_error = on_error
+        self.on_done = on_done
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        self.busy_seconds = 0.0
+        self.max_latency = 0.0
+        self.errors = 0
+        self.tables = {}  # table -> (batches, rows, seconds)
+        self.thread = threading.Thread(
+            target=self._run, name=f"clickhouse-insert-{index}", daemon=True
+        )
+        self.thread.start()
+
+    def submit(self, table, data, column_names):
+        self.tasks.put((table, data, column_names))
+
+    def stop(self):
+        self.tasks.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                self.tasks.task_done()
+                return
+            table, data, column_names = task
+            try:
+                if self.client is None:
+                    self.client = self.client_factory()
+                started = time.perf_counter()
+                self.client.insert(table=table, data=data, column_names=column_names)
+            except Exception as e:
+                with self.lock:
+                    self.errors += 1
+                self.on_error(table, e)
+            else:
+                elapsed = time.perf_counter() - started
+                with self.lock:
+                    self.batches += 1
+                    self.rows += len(data)
+                    self.busy_seconds += elapsed
+                    self.max_latency = max(self.max_latency, elapsed)
+                    batches, rows, seconds = self.tables.get(table, (0, 0, 0.0))
+                    self.tables[table] = (batches + 1, rows + len(data), seconds + elapsed)
+                METRICS.observe("clickhouse_insert_seconds", elapsed, table=table)
+                METRICS.inc("clickhouse_rows_inserted_total", len(data), table=table)
+            finally:
+                self.on_done(table)
+                self.tasks.task_done()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "connection": self.index,
+                "batches": self.batches,
+                "rows": self.rows,
+                "errors": self.errors,
+                "queued": self.tasks.qsize(),
+                "busy_seconds": self.busy_seconds,
+                "rows_per_sec": self.rows / self.busy_seconds if self.busy_seconds else 0.0,
+                "avg_latency_ms": 1000 * self.busy_seconds / self.batches if self.batches else 0.0,
+                "max_latency_ms": 1000 * self.max_latency,
+            }
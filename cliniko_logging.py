@@ -0,0 +1,99 @@
+import logging
+import os
+import sys
+import time
+
+# Structured, level-controlled logging for the sync.
+#
+# Lines are logfmt (`ts=... level=info logger=cliniko msg="..." key=value`),
+# so they stay readable in cron logs and can be parsed by log shippers.
+# Set CLINIKO_LOG_LEVEL=DEBUG to see per-page/per-batch detail; the default
+# INFO level only emits rate-limited progress lines, so log volume does not
+# grow with page count.
+
+LOG_LEVEL = os.environ.get("CLINIKO_LOG_LEVEL", "INFO").upper()
+PROGRESS_INTERVAL_SECONDS = float(os.environ.get("CLINIKO_PROGRESS_INTERVAL", "10"))
+
+class LogfmtFormatter(logging.Formatter):
+    def format(self, record):
+        fields = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields.update(getattr(record, "fields", {}))
+        line = " ".join(f"{key}={_logfmt_value(value)}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+def _logfmt_value(value):
+    if isinstance(value, float):
+        value = f"{value:.3f}"
+    value = str(value)
+    if not value or any(c in value for c in ' "=\n'):
+        return '"' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+    return value
+
+def get_logger(name="cliniko"):
+    """
+    Return a logger under the shared `cliniko` root, configuring it on first use.
+    """
+    root = logging.getLogger("cliniko")
+    if not root.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(LogfmtFormatter())
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        root.propagate = False
+    return root if name == "cliniko" else root.getChild(name)
+
+def log(logger, level, msg, **fields):
+    """
+    Log `msg` with structured key=value fields, skipping formatting when the
+    level is disabled.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, msg, extra={"fields": fields})
+
+class ProgressReporter:
+    """
+    Rate-limited progress for one endpoint: at most one INFO line every
+    `interval` seconds with rows, rows/sec and (when the total is known) ETA,
+    plus a final summary from `finish`.
+    """
+
+    def __init__(self, logger, endpoint, interval=None):
+        self.logger = logger
+        self.endpoint = endpoint
+        self.interval = PROGRESS_INTERVAL_SECONDS if interval is None else interval
+        self.started = time.monotonic()
+        self.last_report = self.started
+        self.rows = 0
+        self.pages = 0
+        self.total = None
+
+    def update(self, rows, total=None):
+        self.rows += rows
+        self.pages += 1
+        if total is not None:
+            self.total = total
+        now = time.monotonic()
+        if now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        elapsed = now - self.started
+        rate = self.rows / elapsed if elapsed else 0.0
+        fields = {"endpoint": self.endpoint, "rows": self.rows, "pages": self.pages, "rows_per_sec": rate}
+        if self.total:
+            fields["total"] = self.total
+            fields["pct"] = 100.0 * self.rows / self.total
+            if rate:
+                fields["eta_sec"] = max(self.total - self.rows, 0) / rate
+        log(self.logger, logging.INFO, "sync progress", **fields)
+
+    def finish(self, **fields):
+        elapsed = time.monotonic() - self.started
+        log(self.logger, logging.INFO, "sync finished", endpoint=self.endpoint, rows=self.rows,
+            pages=self.pages, seconds=elapsed, rows_per_sec=self.rows / elapsed if elapsed else 0.0, **fields)
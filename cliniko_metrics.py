@@ -0,0 +1,167 @@
+import bisect
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# In-process counters and histograms for the sync hot path.
+#
+# Everything is recorded into the module-level METRICS registry. It can be
+# scraped in Prometheus text format from an optional local HTTP endpoint
+# (`METRICS.serve(port)`) and dumped as a JSON summary at the end of a run
+# (`METRICS.write_summary(path)`).
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTES_BUCKETS = (1_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000, 10_000_000)
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the q-th observation.
+        """
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+class MetricsRegistry:
+    """
+    Thread-safe registry of labelled counters and histograms.
+    Metrics must be declared with `counter` / `histogram` before use.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.definitions = {}  # name -> (kind, help, buckets)
+        self.values = {}  # (name, labels) -> float or _Histogram
+
+    def counter(self, name, help_text):
+        self.definitions[name] = ("counter", help_text, None)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.definitions[name] = ("histogram", help_text, tuple(buckets))
+
+    def inc(self, name, value=1, **labels):
+        if not value:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.values.get(key)
+            if histogram is None:
+                histogram = self.values[key] = _Histogram(self.definitions[name][2])
+            histogram.observe(value)
+
+    def reset(self):
+        with self.lock:
+            self.values = {}
+
+    # ---------- Export ----------
+
+    def render_prometheus(self):
+        lines = []
+        with self.lock:
+            for name, (kind, help_text, _) in sorted(self.definitions.items()):
+                series = [(labels, value) for (n, labels), value in self.values.items() if n == name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(series, key=lambda s: s[0]):
+                    if kind == "counter":
+                        lines.append(f"{name}{_labels(labels)} {value}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value.buckets, value.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {value.count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {value.sum}")
+                    lines.append(f"{name}_count{_labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """
+        Nested dict: metric -> label string -> value (counters) or
+        count/sum/mean/p50/p99/max (histograms, quantiles are bucket upper bounds).
+        """
+        result = {}
+        with self.lock:
+            for (name, labels), value in sorted(self.values.items(), key=lambda item: item[0]):
+                key = ",".join(f"{k}={v}" for k, v in labels) or "all"
+                if isinstance(value, _Histogram):
+                    value = {
+                        "count": value.count,
+                        "sum": value.sum,
+                        "mean": value.sum / value.count if value.count else 0.0,
+                        "p50": value.quantile(0.5),
+                        "p99": value.quantile(0.99),
+                        "max": value.max,
+                    }
+                result.setdefault(name, {})[key] = value
+        return result
+
+    def write_summary(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Serve /metrics in Prometheus text format from a background thread.
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                payload = registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+METRICS = MetricsRegistry()
+METRICS.histogram("cliniko_request_seconds", "Cliniko API page request latency, including retries.")
+METRICS.histogram("cliniko_response_bytes", "Cliniko API response body size.", BYTES_BUCKETS)
+METRICS.histogram("cliniko_transform_seconds", "Time spent transforming one page of records.")
+METRICS.counter("cliniko_rows_transformed_total", "Records transformed into ClickHouse rows.")
+METRICS.counter("cliniko_pages_total", "Cliniko API pages fetched.")
+METRICS.counter("cliniko_retries_total", "Cliniko API requests retried.")
+METRICS.counter("cliniko_rate_limited_total", "Cliniko API responses with status 429.")
+METRICS.histogram("clickhouse_insert_seconds", "ClickHouse insert latency per batch.")
+METRICS.counter("clickhouse_rows_inserted_total", "Rows inserted into ClickHouse.")
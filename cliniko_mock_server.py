@@ -0,0 +1,347 @@
+import argparse
+import bisect
+import datetime
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import cliniko_synthetic as synthetic
+
+# Local stand-in for the Cliniko API, serving synthetic datasets.
+#
+#   python cliniko_mock_server.py --port 8765 --size appointments=2000000 --rate-limit 200
+#   CLINIKO_URL_SHARD=http://127.0.0.1:8765/v1 python production_script_cliniko_instance1.py
+#
+# It speaks the parts of the API the sync relies on: `page`/`per_page`,
+# `links.next`, `total_entries`, `q[]=field:<op>value` filters and
+# `sort`/`order`, the per-record `/{parent}/{id}/attendees` lists, plus optional
+# 429 rate limiting, latency and error injection. As in Cliniko, archived and
+# deleted records are left out of a listing unless a filter names one of those
+# fields.
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 100
+FILTER_PATTERN = re.compile(r"^(\w+):(>=|<=|!=|>|<|=|~)(.*)$")
+# Filters on these fields map straight onto a range of record indexes
+INDEXED_FIELDS = ("id", "created_at", "updated_at")
+# Records with one of these set are only listed when a filter names one of them
+HIDDEN_FIELDS = ("archived_at", "deleted_at")
+
+class ClinikoStandIn(ThreadingHTTPServer):
+    """
+    HTTP server holding the dataset shape and fault-injection settings.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, sizes=None, rate_limit_per_minute=0, latency_ms=0.0,
+                 latency_jitter_ms=0.0, error_rate=0.0, deep_page_ms_per_1000=0.0, seed=0):
+        super().__init__(address, _Handler)
+        self.sizes = dict(synthetic.DEFAULT_SIZES)
+        self.sizes.update(sizes or {})
+        self.rate_limit_per_minute = rate_limit_per_minute
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.deep_page_ms_per_1000 = deep_page_ms_per_1000
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tokens = float(rate_limit_per_minute)
+        self.tokens_updated = time.monotonic()
+        self.requests = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.listed_indexes = {}  # entity -> sorted indexes of the records listed by default
+        self.listed_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def take_token(self):
+        """
+        Token bucket refilled at rate_limit_per_minute. Returns seconds to wait
+        (0 when the request may proceed).
+        """
+        with self.lock:
+            self.requests += 1
+            if not self.rate_limit_per_minute:
+                return 0.0
+            now = time.monotonic()
+            per_second = self.rate_limit_per_minute / 60.0
+            self.tokens = min(self.rate_limit_per_minute, self.tokens + (now - self.tokens_updated) * per_second)
+            self.tokens_updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            self.rate_limited += 1
+            return (1 - self.tokens) / per_second
+
+    def listed(self, entity):
+        """
+        Sorted indexes of the `entity` records a listing without an archived_at
+        or deleted_at filter returns. Every record is generated once per entity.
+        """
+        with self.listed_lock:
+            indexes = self.listed_indexes.get(entity)
+            if indexes is None:
+                indexes = [
+                    i for i in range(self.sizes.get(entity, 0))
+                    if not any(synthetic.make_record(entity, i, self.sizes).get(field) for field in HIDDEN_FIELDS)
+                ]
+                self.listed_indexes[entity] = indexes
+            return indexes
+
+    def should_fail(self):
+        with self.lock:
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.errors += 1
+                return True
+            return False
+
+    def injected_latency(self):
+        with self.lock:
+            jitter = self.random.uniform(0, self.latency_jitter_ms) if self.latency_jitter_ms else 0.0
+        return (self.latency_ms + jitter) / 1000.0
+
+    def serve_in_thread(self):
+        thread = threading.Thread(target=self.serve_forever, name="cliniko-stand-in", daemon=True)
+        thread.start()
+        return thread
+
+class _Handler(BaseHTTPRequestHandler):
+    server: ClinikoStandIn
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        wait = server.take_token()
+        if wait:
+            return self._send(429, {"message": "Too many requests"}, {"Retry-After": str(math.ceil(wait))})
+        latency = server.injected_latency()
+        if latency:
+            time.sleep(latency)
+        if server.should_fail():
+            return self._send(503, {"message": "Injected failure"})
+
+        url = urlsplit(self.path)
+        segments = [s for s in url.path.split("/") if s]
+        if segments and segments[0] == "v1":
+            segments = segments[1:]
+        params = parse_qs(url.query)
+        if len(segments) == 3 and segments[0] in synthetic.ATTENDEE_PARENTS and segments[2] == "attendees":
+            index = synthetic.record_index(int(segments[1])) if segments[1].isdigit() else -1
+            if not 0 <= index < server.sizes.get(segments[0], 0):
+                return self._send(404, {"message": f"Unknown record {segments[1]}"})
+            return self._send(200, self._attendees(segments[0], index, params))
+        if len(segments) != 1 or segments[0] not in synthetic.GENERATORS:
+            return self._send(404, {"message": f"Unknown path {url.path}"})
+        entity = segments[0]
+        try:
+            body = self._list(entity, params)
+        except ValueError as e:
+            return self._send(400, {"message": str(e)})
+        self._send(200, body)
+
+    def _list(self, entity, params):
+        server = self.server
+        size = server.sizes.get(entity, 0)
+        page = max(int(params.get("page", ["1"])[0]), 1)
+        per_page = min(max(int(params.get("per_page", [str(DEFAULT_PER_PAGE)])[0]), 1), MAX_PER_PAGE)
+        descending = params.get("order", ["asc"])[0] == "desc"
+        sort_field = params.get("sort", ["id"])[0].split(":")[0]
+        if sort_field not in INDEXED_FIELDS:
+            raise ValueError(f"Unsupported sort field {sort_field}")
+
+        low, high = 0, size
+        scan_filters = []
+        show_hidden = False
+        for raw_filter in params.get("q[]", []):
+            match = FILTER_PATTERN.match(raw_filter)
+            if not match:
+                raise ValueError(f"Invalid filter {raw_filter}")
+            field, op, value = match.groups()
+            show_hidden = show_hidden or field in HIDDEN_FIELDS
+            if field in INDEXED_FIELDS and op in ("=", ">", ">=", "<", "<="):
+                low, high = _narrow_range(field, op, value, low, high)
+            else:
+                scan_filters.append((field, op, value))
+
+        base_url = server.base_url
+        offset = (page - 1) * per_page
+        if server.deep_page_ms_per_1000:
+            time.sleep(server.deep_page_ms_per_1000 * offset / 1000 / 1000.0)
+        if show_hidden:
+            indexes = range(low, max(low, high))
+        else:
+            listed = server.listed(entity)
+            positions = range(bisect.bisect_left(listed, low), bisect.bisect_left(listed, max(low, high)))
+            indexes = _Listed(listed, positions)
+        if descending:
+            indexes = indexes[::-1]
+        if scan_filters:
+            # Non-indexed filters have to generate and test every candidate
+            matching = [
+                record for record in (synthetic.make_record(entity, i, server.sizes, base_url) for i in indexes)
+                if all(_matches(record, f) for f in scan_filters)
+            ]
+            total = len(matching)
+            records = matching[offset:offset + per_page]
+        else:
+            total = len(indexes)
+            records = [synthetic.make_record(entity, i, server.sizes, base_url)
+                       for i in indexes[offset:offset + per_page]]
+
+        query = {k: v for k, v in params.items() if k != "page"}
+        self_url = f"{base_url}/{entity}?{urlencode(dict(query, page=[page]), doseq=True)}"
+        links = {"self": self_url}
+        if offset + per_page < total:
+            links["next"] = f"{base_url}/{entity}?{urlencode(dict(query, page=[page + 1]), doseq=True)}"
+        if page > 1:
+            links["previous"] = f"{base_url}/{entity}?{urlencode(dict(query, page=[page - 1]), doseq=True)}"
+        return {entity: records, "total_entries": total, "links": links}
+
+    def _attendees(self, parent, index, params):
+        server = self.server
+        page = max(int(params.get("page", ["1"])[0]), 1)
+        per_page = min(max(int(params.get("per_page", [str(DEFAULT_PER_PAGE)])[0]), 1), MAX_PER_PAGE)
+        attendees = synthetic.make_attendees(parent, index, server.sizes, server.base_url)
+        offset = (page - 1) * per_page
+        list_url = f"{server.base_url}/{parent}/{synthetic.record_id(index)}/attendees"
+        links = {"self": f"{list_url}?{urlencode({'page': page, 'per_page': per_page})}"}
+        if offset + per_page < len(attendees):
+            links["next"] = f"{list_url}?{urlencode({'page': page + 1, 'per_page': per_page})}"
+        return {"attendees": attendees[offset:offset + per_page], "total_entries": len(attendees), "links": links}
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+def _parse_time(value):
+    parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+def _field_index(field, value):
+    """
+    Fractional record index at which `field` equals `value`.
+    """
+    if field == "id":
+        return float(synthetic.record_index(int(value)))
+    offset = (_parse_time(value) - synthetic.START).total_seconds()
+    if field == "updated_at":
+        offset -= synthetic.UPDATED_LAG_SECONDS
+    return offset / synthetic.CREATED_STEP_SECONDS
+
+def _narrow_range(field, op, value, low, high):
+    position = _field_index(field, value)
+    if op == "=":
+        if position != int(position):
+            return low, low
+        return max(low, int(position)), min(high, int(position) + 1)
+    if op in (">", ">="):
+        first = math.floor(position) + 1 if op == ">" else math.ceil(position)
+        return max(low, first), high
+    last = math.ceil(position) - 1 if op == "<" else math.floor(position)
+    return low, min(high, last + 1)
+
+class _Listed:
+    """
+    The listed indexes at `positions`, sliced and reversed without copying.
+    """
+
+    def __init__(self, listed, positions):
+        self.listed = listed
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __iter__(self):
+        return (self.listed[position] for position in self.positions)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return _Listed(self.listed, self.positions[key])
+        return self.listed[self.positions[key]]
+
+def _matches(record, condition):
+    field, op, value = condition
+    actual = record.get(field)
+    if op == "~":
+        return value.lower() in str(actual or "").lower()
+    if actual is None:
+        return op == "!=" and value != ""
+    if isinstance(actual, bool):
+        actual, value = str(actual).lower(), value.lower()
+    elif isinstance(actual, (int, float)):
+        value = float(value)
+    if op == "=":
+        return actual == value
+    if op == "!=":
+        return actual != value
+    if op == ">":
+        return actual > value
+    if op == ">=":
+        return actual >= value
+    if op == "<":
+        return actual < value
+    return actual <= value
+
+def parse_sizes(values):
+    sizes = {}
+    for value in values or []:
+        entity, _, count = value.partition("=")
+        if entity not in synthetic.GENERATORS:
+            raise SystemExit(f"Unknown entity {entity}")
+        sizes[entity] = int(count)
+    return sizes
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve synthetic Cliniko data for load testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--size", action="append", metavar="ENTITY=N",
+                        help="records for an entity, e.g. appointments=2000000 (repeatable)")
+    parser.add_argument("--rate-limit", type=int, default=0, metavar="PER_MINUTE",
+                        help="answer 429 above this many requests per minute (0 = unlimited)")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--deep-page-ms", type=float, default=0.0,
+                        help="extra latency per 1000 skipped records, to mimic deep offset pages")
+    args = parser.parse_args()
+
+    server = ClinikoStandIn(
+        (args.host, args.port),
+        sizes=parse_sizes(args.size),
+        rate_limit_per_minute=args.rate_limit,
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        error_rate=args.error_rate,
+        deep_page_ms_per_1000=args.deep_page_ms,
+    )
+    print(f"Serving synthetic Cliniko API at {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from cliniko_logging import get_logger, log
+
+# Per-endpoint profiling for a sync run (`--profile DIR`).
+#
+# For every endpoint two files are written into DIR:
+#   <endpoint>.prof       cProfile stats of the syncing thread
+#                         (open with `python -m pstats` or snakeviz)
+#   <endpoint>.collapsed  sampled stacks of the syncing thread *and* the
+#                         ClickHouse insert workers, one `frame;frame;... count`
+#                         line per stack (feed to flamegraph.pl or speedscope)
+# plus <endpoint>.txt with the top functions by cumulative time.
+#
+# cProfile only sees the thread it is enabled in, so the sampler is what shows
+# time spent inside `client.insert` on the pool threads.
+
+PROFILE_SAMPLE_INTERVAL_SECONDS = 0.005
+PROFILE_TOP_FUNCTIONS = 40  # Lines in the <endpoint>.txt summary
+# Threads sampled besides the one running the endpoint
+PROFILE_THREAD_PREFIXES = ("clickhouse-insert-",)
+
+logger = get_logger("profiling")
+
+class StackSampler:
+    """
+    Background thread that snapshots the stacks of selected threads every
+    `interval` seconds and counts identical stacks.
+    """
+
+    def __init__(self, thread_ids, thread_prefixes=PROFILE_THREAD_PREFIXES,
+                 interval=PROFILE_SAMPLE_INTERVAL_SECONDS):
+        self.thread_ids = set(thread_ids)
+        self.thread_prefixes = thread_prefixes
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="cliniko-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident, "")
+                if ident not in self.thread_ids and not name.startswith(self.thread_prefixes):
+                    continue
+                if _is_idle(frame):
+                    continue
+                self.stacks[(name,) + _stack(frame)] += 1
+            self.samples += 1
+
+    def write_collapsed(self, path):
+        with open(path, "w") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{';'.join(stack)} {count}\n")
+
+def _stack(frame):
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return tuple(reversed(frames))
+
+def _is_idle(frame):
+    """
+    True for worker threads parked on their queue, which would otherwise
+    dominate the samples without saying anything about the sync.
+    """
+    code = frame.f_code
+    return code.co_name == "wait" and os.path.basename(code.co_filename) == "threading.py" \
+        and frame.f_back is not None and frame.f_back.f_code.co_name == "get"
+
+class SyncProfiler:
+    """
+    Writes cProfile and collapsed-stack files for each endpoint profiled with
+    `profile(name)`.
+    """
+
+    def __init__(self, directory, interval=PROFILE_SAMPLE_INTERVAL_SECONDS):
+        self.directory = directory
+        self.interval = interval
+        os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def profile(self, name):
+        sampler = StackSampler([threading.get_ident()], interval=self.interval).start()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            sampler.stop()
+            self._write(name, profiler, sampler)
+
+    def _write(self, name, profiler, sampler):
+        base = os.path.join(self.directory, name)
+        profiler.dump_stats(f"{base}.prof")
+        sampler.write_collapsed(f"{base}.collapsed")
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        with open(f"{base}.txt", "w") as f:
+            f.write(text.getvalue())
+        log(logger, logging.INFO, "profile written", endpoint=name, path=base, samples=sampler.samples)
@@ -0,0 +1,100 @@
+import functools
+import hashlib
+import re
+
+# Ingest profiles: which heavy columns a tenant stores, and how.
+#
+# A profile maps table names to {column: action}:
+#   "drop"   the column is left out of the rows and the CREATE TABLE
+#   "hash"   the column is replaced by <column>_hash UInt64, the halfMD5 of
+#            the text (0 for empty text), so ClickHouse can compare it with
+#            halfMD5(...) of the original
+#   <int>    the text is cut to that many characters
+#
+# Projections run on the rows a transform returns, so values derived from the
+# full record (keyword flags, local times) are unaffected. The DDL of each
+# table is rewritten line by line to match.
+
+HASH_SUFFIX = "_hash"
+PROTECTED_COLUMNS = ("id", "created_at", "updated_at", "deleted_at", "archived_at")  # Used by sync bookkeeping
+
+def text_hash(value):
+    """
+    UInt64 equal to ClickHouse's halfMD5(value), or 0 for empty text.
+    """
+    if not value:
+        return 0
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+class ColumnProjection:
+    """
+    Drops, truncates or hashes columns of one table's rows.
+    """
+
+    def __init__(self, columns, rules):
+        unknown = [column for column in rules if column not in columns]
+        if unknown:
+            raise ValueError(f"Projection names unknown columns: {', '.join(unknown)}")
+        protected = [column for column in rules if column in PROTECTED_COLUMNS]
+        if protected:
+            raise ValueError(f"Projection cannot change columns: {', '.join(protected)}")
+        for column, action in rules.items():
+            if action not in ("drop", "hash") and not (isinstance(action, int) and action >= 0):
+                raise ValueError(f"Unknown projection for {column}: {action!r}")
+        self.rules = dict(rules)
+        self.kept = [position for position, column in enumerate(columns) if rules.get(column) != "drop"]
+        self.columns = [column + HASH_SUFFIX if rules.get(column) == "hash" else column
+                        for column in columns if rules.get(column) != "drop"]
+        # (position in the projected row, action) for the columns that change value
+        self.changes = [(kept, rules[columns[position]]) for kept, position in enumerate(self.kept)
+                        if columns[position] in rules]
+
+    def __call__(self, row):
+        row = [row[position] for position in self.kept]
+        for position, action in self.changes:
+            value = row[position]
+            if action == "hash":
+                row[position] = text_hash(value)
+            elif isinstance(value, str) and len(value) > action:
+                row[position] = value[:action]
+        return tuple(row)
+
+    def wrap(self, transform):
+        """
+        `transform` followed by this projection.
+        """
+        @functools.wraps(transform)
+        def projected(*args, **kwargs):
+            return self(transform(*args, **kwargs))
+        return projected
+
+    def statement(self, statement):
+        """
+        `statement` with the column lines of dropped and hashed columns rewritten.
+        """
+        lines = statement.split("\n")
+        kept = []
+        for line in lines:
+            match = _COLUMN_LINE.match(line)
+            action = self.rules.get(match.group(2)) if match else None
+            if action == "drop":
+                if not line.split("--")[0].rstrip().endswith(",") and kept:
+                    # The last column went; the one before it becomes the last
+                    kept[-1] = re.sub(r",(\s*(--.*)?)$", r"\1", kept[-1])
+                continue
+            if action == "hash":
+                indent, name, rest = match.groups()
+                width = len(name) + len(rest) - len(rest.lstrip())  # Keep the types aligned
+                comma = "," if rest.split("--")[0].rstrip().endswith(",") else ""
+                line = f"{indent}{(name + HASH_SUFFIX).ljust(width - 1)} UInt64{comma}  -- halfMD5 of the {name} text"
+            kept.append(line)
+        return "\n".join(kept)
+
+    def alter_clauses(self):
+        """
+        ADD COLUMN clauses for the hash columns, for tables created before them.
+        """
+        return [f"ADD COLUMN IF NOT EXISTS {column}{HASH_SUFFIX} UInt64"
+                for column, action in self.rules.items() if action == "hash"]
+
+_COLUMN_LINE = re.compile(r"^(\s+)(\w+)(\s+[A-Z].*)$")  # "    name    Type...", as in the CREATE TABLE blocks
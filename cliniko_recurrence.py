@@ -0,0 +1,55 @@
+import calendar
+import datetime
+
+# Expansion of Cliniko repeat rules into concrete occurrences.
+#
+# A repeating booking or block is one record holding its first occurrence
+# plus a repeat_rule of {repeat_type, repeating_interval, number_of_repeats}.
+# Occurrence n starts n * interval days / weeks / months after the first,
+# at the same wall-clock time in the business's time zone (so a 9:00 weekly
+# booking stays at 9:00 across daylight-saving changes). number_of_repeats
+# counts the occurrences after the first one.
+
+REPEAT_TYPES = ("daily", "weekly", "monthly")
+
+def add_months(value, months):
+    """
+    `value` moved by `months` calendar months, clamping the day to the
+    target month's length (Jan 31 + 1 month = Feb 28/29).
+    """
+    month_index = value.month - 1 + months
+    year, month = value.year + month_index // 12, month_index % 12 + 1
+    return value.replace(year=year, month=month, day=min(value.day, calendar.monthrange(year, month)[1]))
+
+def repeat_offset(local_start, repeat_type, step):
+    """
+    Naive local start of the occurrence `step` intervals after `local_start`.
+    """
+    if repeat_type == "daily":
+        return local_start + datetime.timedelta(days=step)
+    if repeat_type == "weekly":
+        return local_start + datetime.timedelta(weeks=step)
+    return add_months(local_start, step)
+
+def expand_series(starts_at, ends_at, zone, repeat_type="", repeats=0, interval=1, horizon=None):
+    """
+    Occurrences of one series as (number, starts_at, ends_at) in UTC,
+    number 0 being the record itself. Occurrences starting after `horizon`
+    are left out. Returns (occurrences, complete), where complete is False
+    when the horizon cut the series short. Unknown repeat types and
+    non-positive intervals expand to the first occurrence only.
+    """
+    if starts_at is None:
+        return [], True
+    duration = (ends_at - starts_at) if ends_at is not None else datetime.timedelta(0)
+    if repeat_type not in REPEAT_TYPES or interval < 1:
+        repeats = 0
+    local_start = starts_at.astimezone(zone).replace(tzinfo=None)
+    occurrences = []
+    for number in range(repeats + 1):
+        local = repeat_offset(local_start, repeat_type, number * interval) if number else local_start
+        starts = local.replace(tzinfo=zone).astimezone(datetime.timezone.utc)
+        if horizon is not None and starts > horizon:
+            return occurrences, False
+        occurrences.append((number, starts, starts + duration))
+    return occurrences, True
@@ -0,0 +1,121 @@
+import logging
+import threading
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from cliniko_logging import get_logger, log
+
+# Per-parent sub-resource fetching (e.g. the attendees of each group
+# appointment), which the API only serves one parent at a time.
+#
+# The parent endpoint's fetcher hands every page of parents to `submit`.
+# Parents whose updated_at matches the cache are skipped; the rest are
+# fetched on a small thread pool (the requests still go through the shared
+# rate limiter), their rows batched into regular-sized inserts. `close`
+# waits for the remaining work and only then records the fetched parents in
+# the cache, so a failed sync re-fetches them next time.
+
+SUBRESOURCE_WORKERS = 4  # Parents fetched in parallel per sub-resource
+SUBRESOURCE_MAX_IN_FLIGHT = 64  # Parents queued before submit blocks the parent fetch
+
+logger = get_logger("subresources")
+
+class SubresourceFetcher:
+    """
+    Fetches one sub-resource for a stream of parents.
+
+    - `cached(parents)` returns the ids among `parents` ((id, updated_at)
+      pairs) whose sub-resource is already stored for that updated_at
+    - `fetch(parent_id)` returns the parent's records (runs on the pool)
+    - `transform(parent_id, record)` turns a record into a row
+    - `insert(rows)` stores a batch of rows
+    - `mark(parents)` records the (id, updated_at) pairs fetched by this run
+    - `flush()` waits until inserted rows have landed, before `mark`
+    """
+
+    def __init__(self, name, cached, fetch, transform, insert, mark, flush=None, batch_size=800,
+                 workers=SUBRESOURCE_WORKERS, max_in_flight=SUBRESOURCE_MAX_IN_FLIGHT):
+        self.name = name
+        self.cached = cached
+        self.fetch = fetch
+        self.transform = transform
+        self.insert = insert
+        self.mark = mark
+        self.flush = flush
+        self.batch_size = batch_size
+        self.max_in_flight = max(max_in_flight, workers)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"cliniko-{name}")
+        self.running = set()
+        self.fetched = []  # (id, updated_at) of parents fetched so far
+        self.batch = []
+        self.lock = threading.Lock()
+        self.error = None
+        self.stats = {"parents": 0, "cached": 0, "fetched": 0, "rows": 0}
+
+    def submit(self, parents):
+        """
+        Queue every parent not in the cache. Blocks while too many are in flight.
+        """
+        self._raise_error()
+        parents = list(parents)
+        cached = self.cached(parents) if parents else set()
+        self.stats["parents"] += len(parents)
+        self.stats["cached"] += len(cached)
+        for parent_id, updated_at in parents:
+            if parent_id in cached:
+                continue
+            while len(self.running) >= self.max_in_flight:
+                self._reap(FIRST_COMPLETED)
+            self.running.add(self.executor.submit(self._fetch_one, parent_id, updated_at))
+
+    def close(self):
+        """
+        Wait for queued parents, insert the last rows and update the cache.
+        Re-raises the first fetch error (after which the cache is not updated).
+        """
+        try:
+            while self.running:
+                self._reap()
+        finally:
+            self.executor.shutdown(wait=True)
+        self._raise_error()
+        if self.batch:
+            self.insert(self.batch)
+            self.batch = []
+        if self.flush is not None:
+            self.flush()
+        if self.fetched:
+            self.mark(self.fetched)
+        log(logger, logging.INFO, "sub-resource sync complete", subresource=self.name, **self.stats)
+        return self.stats
+
+    def abort(self):
+        """
+        Drop queued parents after the parent fetch failed; nothing is cached.
+        """
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.running = set()
+
+    def _fetch_one(self, parent_id, updated_at):
+        rows = [self.transform(parent_id, record) for record in self.fetch(parent_id)]
+        full = None
+        with self.lock:
+            self.fetched.append((parent_id, updated_at))
+            self.stats["fetched"] += 1
+            self.stats["rows"] += len(rows)
+            self.batch.extend(rows)
+            if len(self.batch) >= self.batch_size:
+                full, self.batch = self.batch, []
+        if full:
+            self.insert(full)
+
+    def _reap(self, return_when=ALL_COMPLETED):
+        finished, self.running = wait(self.running, return_when=return_when)
+        for future in finished:
+            error = future.exception()
+            if error is not None and self.error is None:
+                self.error = error
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
@@ -0,0 +1,169 @@
+import argparse
+import datetime
+import json
+import resource
+import threading
+import time
+
+import production_script_cliniko_instance1 as sync
+from cliniko_concurrency import RateLimiter
+from cliniko_metrics import METRICS
+from cliniko_mock_server import ClinikoStandIn, parse_sizes
+
+# End-to-end sync benchmark: runs the full `main()` flow against the local
+# Cliniko stand-in and either a local ClickHouse server or an in-process
+# RecordingSink, then writes per-table stage timings as JSON.
+#
+#   python cliniko_sync_bench.py --size appointments=200000 --output run.json
+#   python cliniko_sync_bench.py --clickhouse-host localhost --latency-ms 20
+
+STAGES = ("http_seconds", "decode_seconds", "transform_seconds", "insert_wait_seconds", "insert_seconds")
+
+class _EmptyResult:
+    result_rows = []
+    result_set = []
+
+class RecordingSink:
+    """
+    In-process stand-in for a ClickHouse client.
+    Implements the `command` / `query` / `insert` surface the sync uses and
+    records what it was asked to do. SELECT commands return None, so the sync
+    behaves like it is talking to an empty database.
+    """
+
+    def __init__(self, keep_rows=False):
+        self.keep_rows = keep_rows
+        self.lock = threading.Lock()
+        self.commands = []
+        self.inserted = {}  # table -> row count
+        self.rows = {}  # table -> rows, only when keep_rows is set
+
+    def command(self, cmd, *args, **kwargs):
+        with self.lock:
+            self.commands.append(cmd)
+        return None
+
+    def query(self, query, *args, **kwargs):
+        with self.lock:
+            self.commands.append(query)
+        return _EmptyResult()
+
+    def insert(self, table, data, column_names):
+        with self.lock:
+            self.inserted[table] = self.inserted.get(table, 0) + len(data)
+            if self.keep_rows:
+                self.rows.setdefault(table, []).extend(data)
+
+    def close(self):
+        pass
+
+def peak_rss_bytes():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def run_benchmark(server, client_factory, pool_size=sync.INSERT_POOL_SIZE, workers=sync.SYNC_WORKERS):
+    """
+    Run `sync.main` against `server` and return a JSON-serialisable report.
+    The client-side rate limiter is matched to the server's limit.
+    """
+    sync.URL_SHARD = server.base_url
+    sync.INSERT_POOL_SIZE = pool_size
+    sync.SYNC_WORKERS = workers
+    sync.API_RATE_LIMITER = RateLimiter(server.rate_limit_per_minute)
+    sync.METRICS_SUMMARY_PATH = ""  # The metrics summary goes into the report instead
+    METRICS.reset()
+    stats = {}
+    started = time.perf_counter()
+    sync.main(client_factory=client_factory, stats=stats)
+    wall = time.perf_counter() - started
+
+    tables = {}
+    totals = {stage: 0.0 for stage in STAGES}
+    totals.update(rows=0, pages=0, bytes=0, retries=0, rate_limited=0)
+    for name, s in stats.items():
+        tables[name] = dict(s, rows_per_sec=s["rows"] / s["wall_seconds"] if s["wall_seconds"] else 0.0)
+        for key in totals:
+            totals[key] += s.get(key, 0)
+    totals["rows_per_sec"] = totals["rows"] / wall if wall else 0.0
+    return {
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "wall_seconds": wall,
+        "peak_rss_bytes": peak_rss_bytes(),
+        "insert_pool_size": pool_size,
+        "sync_workers": workers,
+        "server": {
+            "sizes": server.sizes,
+            "latency_ms": server.latency_ms,
+            "rate_limit_per_minute": server.rate_limit_per_minute,
+            "error_rate": server.error_rate,
+            "requests": server.requests,
+            "rate_limited": server.rate_limited,
+            "errors": server.errors,
+        },
+        "totals": totals,
+        "tables": tables,
+        "metrics": METRICS.summary(),
+    }
+
+def print_report(report):
+    print(f"{'endpoint':<32}{'rows':>10}{'rows/s':>10}" + "".join(f"{s.split('_seconds')[0]:>13}" for s in STAGES))
+    for name, t in report["tables"].items():
+        print(f"{name:<32}{t['rows']:>10}{t['rows_per_sec']:>10.0f}"
+              + "".join(f"{t.get(s, 0.0):>13.2f}" for s in STAGES))
+    totals = report["totals"]
+    print(f"Total: {totals['rows']} rows in {report['wall_seconds']:.1f}s "
+          f"({totals['rows_per_sec']:.0f} rows/s), peak RSS {report['peak_rss_bytes'] / 2**20:.0f} MiB")
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end Cliniko sync benchmark.")
+    parser.add_argument("--size", action="append", metavar="ENTITY=N",
+                        help="records served for an entity (repeatable)")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=0, metavar="PER_MINUTE")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--pool-size", type=int, default=sync.INSERT_POOL_SIZE)
+    parser.add_argument("--workers", type=int, default=sync.SYNC_WORKERS, help="endpoints synced in parallel")
+    parser.add_argument("--clickhouse-host", help="insert into this ClickHouse server instead of a RecordingSink")
+    parser.add_argument("--clickhouse-port", type=int, default=8123)
+    parser.add_argument("--clickhouse-user", default="default")
+    parser.add_argument("--clickhouse-password", default="")
+    parser.add_argument("--output", metavar="PATH", help="write the JSON report here")
+    args = parser.parse_args()
+
+    server = ClinikoStandIn(
+        ("127.0.0.1", 0),
+        sizes=parse_sizes(args.size),
+        rate_limit_per_minute=args.rate_limit,
+        latency_ms=args.latency_ms,
+        error_rate=args.error_rate,
+    )
+    server.serve_in_thread()
+    if args.clickhouse_host:
+        from clickhouse_connect import get_client
+
+        def client_factory():
+            return get_client(
+                host=args.clickhouse_host,
+                port=args.clickhouse_port,
+                username=args.clickhouse_user,
+                password=args.clickhouse_password,
+            )
+    else:
+        sink = RecordingSink()
+
+        def client_factory():
+            return sink
+    try:
+        report = run_benchmark(server, client_factory, args.pool_size, args.workers)
+    finally:
+        server.shutdown()
+        server.server_close()
+    report["sink"] = "clickhouse" if args.clickhouse_host else "recording"
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, default=str)  # max_updated_at is a datetime
+        print(f"Report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
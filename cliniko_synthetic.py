@@ -0,0 +1,376 @@
+import datetime
+import random
+import zlib
+
+# Synthetic Cliniko API payloads for benchmarks and the local API stand-in.
+#
+# Records are generated on demand from (entity, index): the same index always
+# produces the same record, so a dataset of millions of rows never has to be
+# held in memory. Within an entity, `id`, `created_at` and `updated_at` all
+# increase with the index, which lets the stand-in server answer range
+# filters on those fields without scanning.
+
+DEFAULT_BASE_URL = "https://api.au4.cliniko.com/v1"
+START = datetime.datetime(2019, 1, 1, tzinfo=datetime.timezone.utc)
+CREATED_STEP_SECONDS = 60  # created_at of record i is START + i minutes
+UPDATED_LAG_SECONDS = 3600  # updated_at trails created_at by an hour
+ID_BASE = 1_000_000_000_000  # Cliniko ids are large 64-bit integers
+
+DEFAULT_SIZES = {
+    "appointment_types": 15,
+    "bookings": 5_000,
+    "availability_blocks": 500,
+    "unavailable_blocks": 500,
+    "practitioners": 20,
+    "practitioner_reference_numbers": 20,
+    "invoices": 10_000,
+    "invoice_items": 20_000,
+    "patients": 5_000,
+    "communications": 5_000,
+    "businesses": 3,
+    "appointments": 20_000,
+    "group_appointments": 500,
+}
+
+WORDS = (
+    "patient reported improvement in lower back pain after session review "
+    "follow up booked next week exercises provided home program shoulder "
+    "mobility assessment treatment plan discussed referral letter sent gp "
+    "notes updated consent obtained massage dry needling taping advice"
+).split()
+NOTE_PHRASES = ("no charge", "opening special", "intro offer", "intro session", "")
+REPEAT_TYPES = ("daily", "weekly", "monthly")
+TIME_ZONES = ("Australia/Sydney", "Australia/Perth", "Pacific/Auckland")
+# Entities serving `/{entity}/{id}/attendees`
+ATTENDEE_PARENTS = ("group_appointments", "bookings")
+MAX_ATTENDEES = 16  # Attendee ids of a parent come from a block of this size
+
+def record_id(index):
+    return ID_BASE + index
+
+def record_index(record_id_value):
+    return record_id_value - ID_BASE
+
+def created_at(index):
+    return START + datetime.timedelta(seconds=index * CREATED_STEP_SECONDS)
+
+def updated_at(index):
+    return created_at(index) + datetime.timedelta(seconds=UPDATED_LAG_SECONDS)
+
+def format_datetime(value):
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def make_record(entity, index, sizes=None, base_url=DEFAULT_BASE_URL):
+    """
+    Build record `index` of `entity` shaped like the Cliniko list endpoint.
+    """
+    sizes = sizes or DEFAULT_SIZES
+    rng = random.Random(zlib.crc32(f"{entity}:{index}".encode("utf-8")))
+    record = GENERATORS[entity](rng, index, sizes, base_url)
+    record["id"] = str(record_id(index))
+    record["created_at"] = format_datetime(created_at(index))
+    record["updated_at"] = format_datetime(updated_at(index))
+    record.setdefault("links", {"self": f"{base_url}/{entity}/{record['id']}"})
+    return record
+
+def make_records(entity, count, sizes=None, base_url=DEFAULT_BASE_URL):
+    return [make_record(entity, i, sizes, base_url) for i in range(count)]
+
+def make_attendees(parent, parent_index, sizes=None, base_url=DEFAULT_BASE_URL):
+    """
+    Attendees of record `parent_index` of `parent` (one of ATTENDEE_PARENTS).
+    Booking attendees are the booking's patient_ids; group appointments get
+    up to max_attendees random patients. They change with their parent.
+    """
+    sizes = sizes or DEFAULT_SIZES
+    parent_record = make_record(parent, parent_index, sizes, base_url)
+    rng = random.Random(zlib.crc32(f"{parent}:{parent_index}:attendees".encode("utf-8")))
+    if parent == "bookings":
+        patients = [record_index(int(patient_id)) for patient_id in parent_record["patient_ids"]]
+    else:
+        patients = [_ref(rng, sizes, "patients") for _ in range(rng.randint(0, parent_record["max_attendees"]))]
+    # Attendee ids sit above every entity's own ids, one block per parent entity
+    first_id = ID_BASE * (2 + ATTENDEE_PARENTS.index(parent)) + parent_index * MAX_ATTENDEES
+    attendees = []
+    for position, patient in enumerate(patients[:MAX_ATTENDEES]):
+        attendee_id = str(first_id + position)
+        attendees.append({
+            "id": attendee_id,
+            "arrived": rng.random() < 0.8,
+            "cancelled_at": _maybe_datetime(rng, parent_index, 0.05),
+            "cancellation_note": "",
+            "notes": _note(rng) if rng.random() < 0.2 else "",
+            "archived_at": None,
+            "deleted_at": None,
+            "created_at": parent_record["created_at"],
+            "updated_at": parent_record["updated_at"],
+            "patient": _link(base_url, "patients", patient),
+            parent[:-1]: {"links": {"self": parent_record["links"]["self"]}},
+            "links": {"self": f"{base_url}/attendees/{attendee_id}"},
+        })
+    return attendees
+
+# ---------- Helpers ----------
+
+def _link(base_url, entity, index):
+    return {"links": {"self": f"{base_url}/{entity}/{record_id(index)}"}}
+
+def _ref(rng, sizes, entity):
+    return rng.randrange(max(sizes.get(entity, 1), 1))
+
+def _text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+def _note(rng):
+    return f"{_text(rng, rng.randint(5, 40))} {rng.choice(NOTE_PHRASES)}".strip()
+
+def _money(rng, low=20, high=400):
+    return f"{rng.uniform(low, high):.2f}"
+
+def _slot(rng, index, max_minutes=90):
+    starts = created_at(index) + datetime.timedelta(days=rng.randint(0, 60), minutes=15 * rng.randint(0, 40))
+    return starts, starts + datetime.timedelta(minutes=15 * rng.randint(1, max_minutes // 15))
+
+def _maybe_datetime(rng, index, probability):
+    if rng.random() >= probability:
+        return None
+    return format_datetime(created_at(index) + datetime.timedelta(days=rng.randint(1, 30)))
+
+def _repeat_rule(rng):
+    if rng.random() < 0.5:
+        return None
+    return {
+        "number_of_repeats": rng.randint(1, 20),
+        "repeat_type": rng.choice(REPEAT_TYPES),
+        "repeating_interval": rng.randint(1, 4),
+    }
+
+# ---------- Entity Generators ----------
+
+def _appointment_type(rng, index, sizes, base_url):
+    return {
+        "add_deposit_to_account_credit": rng.random() < 0.2,
+        "appointment_confirmation_template_ids": [str(rng.randint(1, 99)) for _ in range(rng.randint(0, 3))],
+        "appointment_follow_up_template_ids": [],
+        "appointment_reminder_template_ids": [str(rng.randint(1, 99))],
+        "archived_at": _maybe_datetime(rng, index, 0.1),
+        "category": rng.choice(("Initial", "Standard", "Review")),
+        "color": f"#{rng.randrange(0xFFFFFF):06x}",
+        "deposit_price": _money(rng, 0, 50),
+        "description": _text(rng, 12),
+        "duration_in_minutes": rng.choice((15, 30, 45, 60, 90)),
+        "max_attendees": rng.choice((1, 1, 1, 8)),
+        "name": f"Appointment type {index}",
+        "online_bookings_lead_time_hours": rng.randint(0, 48),
+        "online_payments_enabled": rng.random() < 0.5,
+        "online_payments_mode": rng.choice(("disabled", "optional", "required")),
+        "show_in_online_bookings": rng.random() < 0.7,
+        "telehealth_enabled": rng.random() < 0.3,
+    }
+
+def _booking(rng, index, sizes, base_url):
+    starts, ends = _slot(rng, index)
+    return {
+        "archived_at": _maybe_datetime(rng, index, 0.05),
+        "deleted_at": _maybe_datetime(rng, index, 0.02),
+        "starts_at": format_datetime(starts),
+        "ends_at": format_datetime(ends),
+        "notes": _note(rng),
+        "patient_ids": [str(record_id(_ref(rng, sizes, "patients"))) for _ in range(rng.randint(0, 3))],
+        "max_attendees": rng.choice((1, 1, 6)),
+        "telehealth_url": "",
+        "repeat_rule": _repeat_rule(rng) or {},
+        "practitioner": _link(base_url, "practitioners", _ref(rng, sizes, "practitioners")),
+        "business": _link(base_url, "businesses", _ref(rng, sizes, "businesses")),
+    }
+
+def _availability_block(rng, index, sizes, base_url):
+    starts, ends = _slot(rng, index, max_minutes=480)
+    return {
+        "starts_at": format_datetime(starts),
+        "ends_at": format_datetime(ends),
+        "repeat_rule": _repeat_rule(rng) or {},
+        "practitioner": _link(base_url, "practitioners", _ref(rng, sizes, "practitioners")),
+        "business": _link(base_url, "businesses", _ref(rng, sizes, "businesses")),
+    }
+
+def _unavailable_block(rng, index, sizes, base_url):
+    record = _availability_block(rng, index, sizes, base_url)
+    record.update({
+        "archived_at": _maybe_datetime(rng, index, 0.05),
+        "deleted_at": _maybe_datetime(rng, index, 0.02),
+        "notes": _text(rng, 6),
+    })
+    return record
+
+def _practitioner(rng, index, sizes, base_url):
+    first, last = f"First{index}", f"Last{index}"
+    return {
+        "active": rng.random() < 0.9,
+        "description": _text(rng, 20),
+        "designation": rng.choice(("Physiotherapist", "Osteopath", "Massage Therapist")),
+        "display_name": f"{first} {last}",
+        "first_name": first,
+        "label": "",
+        "last_name": last,
+        "show_in_online_bookings": True,
+        "title": rng.choice(("Dr", "Mr", "Ms", "")),
+    }
+
+def _practitioner_reference_number(rng, index, sizes, base_url):
+    return {
+        "name": rng.choice(("Medicare", "DVA", "WorkCover")),
+        "reference_number": f"{rng.randrange(10**9):09d}",
+        "practitioner": _link(base_url, "practitioners", index % max(sizes.get("practitioners", 1), 1)),
+    }
+
+def _invoice(rng, index, sizes, base_url):
+    net = rng.uniform(40, 400)
+    tax = net * 0.1 if rng.random() < 0.3 else 0.0
+    return {
+        "archived_at": _maybe_datetime(rng, index, 0.02),
+        "closed_at": _maybe_datetime(rng, index, 0.8),
+        "deleted_at": _maybe_datetime(rng, index, 0.01),
+        "discounted_amount": f"{net * rng.choice((0, 0, 0.1)):.2f}",
+        "net_amount": f"{net:.2f}",
+        "issue_date": created_at(index).date().isoformat(),
+        "number": index + 1,
+        "online_payment_url": "",
+        "notes": _note(rng),
+        "status": rng.choice((10, 20, 30)),
+        "status_description": rng.choice(("Open", "Paid", "Void")),
+        "tax_amount": f"{tax:.2f}",
+        "total_amount": f"{net + tax:.2f}",
+        "business": _link(base_url, "businesses", _ref(rng, sizes, "businesses")),
+        "patient": _link(base_url, "patients", _ref(rng, sizes, "patients")),
+        "practitioner": _link(base_url, "practitioners", _ref(rng, sizes, "practitioners")),
+    }
+
+def _invoice_item(rng, index, sizes, base_url):
+    unit = rng.uniform(20, 200)
+    rate = rng.choice((0.0, 0.1))
+    return {
+        "archived_at": None,
+        "deleted_at": _maybe_datetime(rng, index, 0.01),
+        "code": f"ITEM{rng.randint(1, 50):03d}",
+        "concession_type_name": rng.choice(("", "Pensioner", "Student")),
+        "discounted_amount": "0.00",
+        "name": _text(rng, 3),
+        "tax_amount": f"{unit * rate:.2f}",
+        "tax_name": "GST" if rate else "",
+        "tax_rate": f"{rate * 100:.1f}",
+        "total_including_tax": f"{unit * (1 + rate):.2f}",
+        "unit_price": f"{unit:.2f}",
+        "invoice": _link(base_url, "invoices", _ref(rng, sizes, "invoices")),
+    }
+
+def _patient(rng, index, sizes, base_url):
+    return {
+        "accepted_email_marketing": rng.random() < 0.4,
+        "accepted_privacy_policy": True,
+        "accepted_sms_marketing": rng.random() < 0.3,
+        "address_1": f"{rng.randint(1, 300)} Example Street",
+        "address_2": "",
+        "address_3": "",
+        "appointment_notes": _note(rng),
+        "archived_at": _maybe_datetime(rng, index, 0.05),
+        "city": rng.choice(("Sydney", "Melbourne", "Perth", "Auckland")),
+        "date_of_birth": f"{rng.randint(1940, 2015)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "email": f"patient{index}@example.com",
+        "first_name": f"Patient{index}",
+        "last_name": f"Surname{index % 997}",
+        "notes": _note(rng),
+    }
+
+def _communication(rng, index, sizes, base_url):
+    return {
+        "archived_at": None,
+        "category": rng.choice(("email", "sms", "letter", "phone")),
+        "category_code": rng.randint(1, 4),
+        "confidential": rng.random() < 0.1,
+        # Large free-text bodies are what make this endpoint heavy
+        "content": _text(rng, rng.randint(300, 1500)),
+        "direction_code": rng.randint(1, 2),
+        "direction_description": rng.choice(("Inbound", "Outbound")),
+        "from": "clinic@example.com",
+        "to": f"patient{_ref(rng, sizes, 'patients')}@example.com",
+        "type": rng.choice(("Email", "SMS")),
+        "type_code": rng.randint(1, 5),
+        "patient": _link(base_url, "patients", _ref(rng, sizes, "patients")),
+    }
+
+def _business(rng, index, sizes, base_url):
+    time_zone_identifier = TIME_ZONES[index % len(TIME_ZONES)]
+    return {
+        "additional_information": _text(rng, 200),
+        "additional_invoice_information": _text(rng, 30),
+        "address_1": f"{rng.randint(1, 300)} Clinic Road",
+        "address_2": "",
+        "business_name": f"Clinic {index}",
+        "business_registration_name": "ABN",
+        "business_registration_value": f"{rng.randrange(10**11):011d}",
+        "city": time_zone_identifier.split("/")[1],
+        "country": "Australia",
+        "deleted_at": None,
+        "display_name": f"Clinic {index}",
+        "email_reply_to": f"clinic{index}@example.com",
+        "label": "",
+        "post_code": f"{rng.randint(2000, 7000)}",
+        "show_in_online_bookings": True,
+        "state": "",
+        "time_zone": time_zone_identifier.split("/")[1],
+        "time_zone_identifier": time_zone_identifier,
+        "website_address": f"https://clinic{index}.example.com",
+    }
+
+def _appointment(rng, index, sizes, base_url):
+    starts, ends = _slot(rng, index)
+    record = {
+        "appointment_type": _link(base_url, "appointment_types", _ref(rng, sizes, "appointment_types")),
+        "archived_at": _maybe_datetime(rng, index, 0.02),
+        "business": _link(base_url, "businesses", _ref(rng, sizes, "businesses")),
+        "cancelled_at": _maybe_datetime(rng, index, 0.1),
+        "cancellation_reason": rng.choice((None, 10, 20, 50)),
+        "cancellation_reason_description": rng.choice(("", "Feeling better", "Illness")),
+        "deleted_at": _maybe_datetime(rng, index, 0.01),
+        "did_not_arrive": rng.random() < 0.05,
+        "starts_at": format_datetime(starts),
+        "ends_at": format_datetime(ends),
+        "notes": _note(rng),
+        "patient": _link(base_url, "patients", _ref(rng, sizes, "patients")),
+        "practitioner": _link(base_url, "practitioners", _ref(rng, sizes, "practitioners")),
+        "repeated_from": {"links": {}},
+    }
+    if index and rng.random() < 0.1:
+        record["repeated_from"] = _link(base_url, "appointments", rng.randrange(index))
+    return record
+
+def _group_appointment(rng, index, sizes, base_url):
+    starts, ends = _slot(rng, index)
+    return {
+        "archived_at": _maybe_datetime(rng, index, 0.02),
+        "starts_at": format_datetime(starts),
+        "ends_at": format_datetime(ends),
+        "notes": _note(rng),
+        "telehealth_url": "",
+        "max_attendees": rng.randint(4, 12),
+        "appointment_type": _link(base_url, "appointment_types", _ref(rng, sizes, "appointment_types")),
+        "business": _link(base_url, "businesses", _ref(rng, sizes, "businesses")),
+        "practitioner": _link(base_url, "practitioners", _ref(rng, sizes, "practitioners")),
+    }
+
+GENERATORS = {
+    "appointment_types": _appointment_type,
+    "bookings": _booking,
+    "availability_blocks": _availability_block,
+    "unavailable_blocks": _unavailable_block,
+    "practitioners": _practitioner,
+    "practitioner_reference_numbers": _practitioner_reference_number,
+    "invoices": _invoice,
+    "invoice_items": _invoice_item,
+    "patients": _patient,
+    "communications": _communication,
+    "businesses": _business,
+    "appointments": _appointment,
+    "group_appointments": _group_appointment,
+}
@@ -0,0 +1,77 @@
+import datetime
+import threading
+
+# Practitioner utilisation per local day, computed on ingest.
+#
+# For one (practitioner, business, day) the working time is the union of
+# availability blocks minus the union of unavailable blocks, and the booked
+# time is the union of appointments. All three interval sets are merged in
+# a single sweep over their sorted start/end events, so overlapping blocks
+# or double bookings are never counted twice. Intervals belong to the local
+# day they start on and are clipped at that day's end.
+
+AVAILABLE, UNAVAILABLE, BOOKED = range(3)
+
+class TouchedDays:
+    """
+    Thread-safe set of (practitioner_id, business_id, local_date) keys whose
+    utilisation has to be recomputed.
+    """
+
+    def __init__(self):
+        self.keys = set()
+        self.lock = threading.Lock()
+
+    def add(self, keys):
+        keys = [key for key in keys if key[2] is not None]
+        with self.lock:
+            self.keys.update(keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+def day_bounds(local_date, zone):
+    """
+    UTC start and end of `local_date` in `zone`.
+    """
+    start = datetime.datetime.combine(local_date, datetime.time(), tzinfo=zone)
+    end = datetime.datetime.combine(local_date + datetime.timedelta(days=1), datetime.time(), tzinfo=zone)
+    return start.astimezone(datetime.timezone.utc), end.astimezone(datetime.timezone.utc)
+
+def sweep(intervals, day_start=None, day_end=None):
+    """
+    Minutes per state for `intervals`, a list of (kind, start, end) with kind
+    AVAILABLE, UNAVAILABLE or BOOKED, clipped to [day_start, day_end).
+    Returns available (available and not unavailable), unavailable (inside
+    availability), booked, and booked_available (booked inside available time).
+    """
+    events = []
+    for kind, start, end in intervals:
+        if start is None or end is None:
+            continue
+        if day_start is not None:
+            start = max(start, day_start)
+        if day_end is not None:
+            end = min(end, day_end)
+        if end > start:
+            events.append((start, 1, kind))
+            events.append((end, -1, kind))
+    events.sort()
+    depth = [0, 0, 0]
+    seconds = {"available": 0.0, "unavailable": 0.0, "booked": 0.0, "booked_available": 0.0}
+    previous = None
+    for time, delta, kind in events:
+        if previous is not None and time > previous:
+            span = (time - previous).total_seconds()
+            working = depth[AVAILABLE] > 0 and depth[UNAVAILABLE] == 0
+            if working:
+                seconds["available"] += span
+            elif depth[AVAILABLE] > 0:
+                seconds["unavailable"] += span
+            if depth[BOOKED] > 0:
+                seconds["booked"] += span
+                if working:
+                    seconds["booked_available"] += span
+        depth[kind] += delta
+        previous = time
+    return {name: round(value / 60) for name, value in seconds.items()}
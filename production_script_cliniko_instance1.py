@@ -1,10 +1,195 @@
+import argparse
 import base64
-import requests
 import datetime
-from clickhouse_connect import get_client
+import functools
+import hashlib
+import logging
+import os
+import random
+import signal
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from typing import Callable, NamedTuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 from keys.keys import API_KEY, PASSWORD, HOST_CLICKHOUSE, CLIENT_NAME, CLIENT_INSTANCE, URL_SHARD
+from cliniko_insert_pool import ClickHouseInsertPool
+from cliniko_logging import ProgressReporter, get_logger, log
+from cliniko_metrics import METRICS
+from cliniko_profiling import SyncProfiler
+from cliniko_bitmap import IdBitmap
+from cliniko_backfill import BackfillCheckpoint, format_timestamp, parse_timestamp, plan_windows, run_windows
+from cliniko_concurrency import RateLimiter, SessionPool, run_dag, topological_order
+from cliniko_subresources import SubresourceFetcher
+from cliniko_dimensions import DimensionCache, LoadOnce, TimeZoneMap
+from cliniko_recurrence import expand_series
+from cliniko_utilisation import AVAILABLE, BOOKED, UNAVAILABLE, TouchedDays, day_bounds, sweep
+from cliniko_flags import DEFAULT_FLAG_RULES, FlagMatcher, load_flag_rules
+from cliniko_projection import ColumnProjection
+from cliniko_bulk_load import BULK_FORMATS, BulkFileWriter, ddl_column_types, load_bulk_directory
+
+logger = get_logger("sync")
+
+# Point the sync at another API host (e.g. cliniko_mock_server.py) without editing keys.py
+URL_SHARD = os.environ.get("CLINIKO_URL_SHARD", URL_SHARD)
 
 BATCH_SIZE = 800  # For batch inserts
+MAX_RETRIES = 5  # Retries for rate-limited (429) and transient 5xx/connection failures
+RETRY_BACKOFF_SECONDS = 1.0  # Doubles on every retry unless the API sends Retry-After
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+# "keyset": walk each endpoint with sort=id&q[]=id:>last_id, so every page costs the
+# same at any depth and records updated mid-walk cannot shift between pages.
+# "offset": follow the API's links.next (page=N).
+PAGINATION = "keyset"
+KEYSET_PER_PAGE = 100
+# Client-side cap shared by every sync thread, so parallel endpoints stay under
+# Cliniko's per-key limit instead of bouncing off 429s (0 = off)
+API_RATE_LIMIT_PER_MINUTE = int(os.environ.get("CLINIKO_RATE_LIMIT_PER_MINUTE", "200"))
+API_RATE_LIMITER = RateLimiter(API_RATE_LIMIT_PER_MINUTE)
+SYNC_WORKERS = 4  # Endpoints fetched in parallel, following ENDPOINTS dependencies
+METRICS_PORT = 0  # Serve Prometheus metrics on this local port during a run (0 = off)
+METRICS_SUMMARY_PATH = f"cliniko_metrics_{CLIENT_NAME}.json"  # JSON metrics dump written after each run
+# Daemon mode (--daemon): seconds between incremental syncs of each endpoint.
+# Endpoints not listed use DEFAULT_SYNC_INTERVAL_SECONDS.
+ENDPOINT_SYNC_INTERVALS = {
+    "appointments": 5 * 60,
+    "bookings": 5 * 60,
+    "availability_blocks": 60 * 60,
+    "unavailable_blocks": 60 * 60,
+    "invoices": 15 * 60,
+    "invoice_items": 15 * 60,
+    "patients": 15 * 60,
+    "communications": 15 * 60,
+    "practitioners": 6 * 60 * 60,
+    "appointment_types": 24 * 60 * 60,
+    "practitioner_reference_numbers": 24 * 60 * 60,
+    "businesses": 24 * 60 * 60,
+}
+DEFAULT_SYNC_INTERVAL_SECONDS = 60 * 60
+# Tenants are phase-shifted by up to this many seconds (derived from CLIENT_NAME) so
+# daemons started together do not hit the API at the same moment; each run also gets
+# up to 10% of its interval (capped at this value) of random jitter.
+DAEMON_JITTER_SECONDS = 60
+# Held while syncing so a cron one-shot and a daemon for the same tenant never overlap
+RUN_LOCK_PATH = f"cliniko_sync_{CLIENT_NAME}.lock"
+# Shared by every tenant: one row per (run, endpoint) with fetch stats and watermarks
+SYNC_RUNS_TABLE = "cliniko_sync_runs"
+# A run's watermark is its start time minus this overlap (see record_sync_run)
+WATERMARK_OVERLAP = datetime.timedelta(minutes=5)
+# Backfill mode (--backfill): endpoints are split into windows on this timestamp
+# field, halved until each holds at most BACKFILL_MAX_WINDOW_ROWS records, and the
+# windows of an endpoint are synced BACKFILL_WORKERS at a time
+BACKFILL_WINDOW_FIELD = "created_at"
+BACKFILL_MAX_WINDOW_ROWS = 20_000
+BACKFILL_MIN_WINDOW = datetime.timedelta(hours=1)
+BACKFILL_WORKERS = 4
+BACKFILL_PER_PAGE = 100
+# Window plans and finished windows; delete it to re-plan a backfill from scratch
+BACKFILL_CHECKPOINT_PATH = f"cliniko_backfill_{CLIENT_NAME}.json"
+# Reconciliation (--reconcile): ids still in ClickHouse that Cliniko no longer returns,
+# live, archived or deleted, were hard-deleted and get a tombstone (plus deleted_at
+# where the table has one)
+TOMBSTONES_TABLE = f"{CLIENT_NAME}_cliniko_tombstones"
+# Records with these fields set are also synced (q[]=<field>:>epoch) so they stay current
+RECONCILE_FILTER_FIELDS = ("archived_at", "deleted_at")
+# Refuse to tombstone more than this share of a table in one pass, unless only a
+# handful of ids are missing
+RECONCILE_MAX_DELETE_FRACTION = 0.05
+RECONCILE_GUARD_MIN_IDS = 100
+RECONCILE_ID_PAGE = 100_000  # ClickHouse ids read per query
+RECONCILE_MUTATION_CHUNK = 10_000  # ids per ALTER TABLE ... UPDATE deleted_at
+# Consistency check (--check): id ranges are compared by (count, max(updated_at)),
+# split CHECK_FANOUT ways while they differ, and re-fetched once a differing range
+# holds at most CHECK_LEAF_ROWS records
+CHECK_FANOUT = 8
+CHECK_LEAF_ROWS = 1_000
+# Sub-resources (Endpoint.subresources) are fetched once per parent record; the
+# parent's updated_at at fetch time is kept here so unchanged parents are skipped
+SUBRESOURCE_CACHE_TABLE = f"{CLIENT_NAME}_cliniko_subresource_cache"
+SUBRESOURCE_PER_PAGE = 100
+PROFILE_DIR = ""  # Write per-endpoint cProfile and collapsed-stack files here ('' = off)
+INSERT_POOL_SIZE = 4  # Number of parallel ClickHouse insert connections
+# Endpoint tables (e.g. "appointments") whose batches must be inserted in fetch order.
+# ReplacingMergeTree(id) keeps the last inserted row for a duplicate id, so list a
+# table here if the same id can show up in more than one batch of a single run.
+INSERT_POOL_ORDERED_TABLES = ()
+# Create the pre-aggregated dashboard tables (materialized views) during schema bootstrap
+ENABLE_MATERIALIZED_VIEWS = True
+# Create dictGet lookups for dimension tables during schema bootstrap
+ENABLE_DICTIONARIES = True
+DICTIONARY_LIFETIME = (300, 600)  # Min/max seconds between background refreshes
+# Named collection, defined in the ClickHouse server config, with the credentials the
+# dictionaries read their source tables with (a read-only user is enough); keeps the
+# password out of the DDL, system.dictionaries and the query log
+DICTIONARY_SOURCE_COLLECTION = os.environ.get("CLINIKO_DICTIONARY_SOURCE_COLLECTION", "cliniko_dictionary_source")
+# Endpoints backing a dictionary; each sync of these reloads `{table}_dict`
+DICTIONARY_ENDPOINTS = ("practitioners", "businesses", "appointment_types")
+# Dimension columns held in memory while writing the enriched tables
+# (Endpoint.enriched): endpoint -> {column: SQL expression over its table}
+ENRICHMENT_DIMENSIONS = {
+    "practitioners": {"name": "display_name", "designation": "designation"},
+    "appointment_types": {"name": "name", "category": "category", "duration_in_minutes": "duration_in_minutes"},
+    "businesses": {"name": "business_name"},
+}
+# Dimensions too large to load whole, and possibly still syncing: only the ids each
+# page links to are looked up. endpoint -> (link field, {column: SQL expression})
+PAGE_DIMENSIONS = {
+    "patients": ("patient", {"name": "trim(concat(first_name, ' ', last_name))"}),
+}
+
+# Local-time columns (local_date, local_hour, local_weekday) use the time zone of
+# the record's business; businesses not synced yet fall back to this zone
+LOCAL_TIME_ZONE_FALLBACK = "UTC"
+# Business id -> time zone, seeded from ClickHouse at the start of a run and
+# updated by transform_business as businesses are fetched
+BUSINESS_TIME_ZONES = TimeZoneMap(LOCAL_TIME_ZONE_FALLBACK)
+# Brings tables created before the local-time columns up to date (see schema_statements)
+LOCAL_TIME_ALTER = """
+        ADD COLUMN IF NOT EXISTS local_date Nullable(Date),
+        ADD COLUMN IF NOT EXISTS local_hour UInt8,
+        ADD COLUMN IF NOT EXISTS local_weekday UInt8,
+        ADD INDEX IF NOT EXISTS local_date_idx local_date TYPE minmax GRANULARITY 4"""
+LINKED_IDS_ALTER = """
+        ADD COLUMN IF NOT EXISTS practitioner_id UInt64,
+        ADD COLUMN IF NOT EXISTS business_id UInt64"""
+# Daily practitioner utilisation (see cliniko_utilisation), recomputed after each
+# sync for the (practitioner, business, local day) keys its rows touched
+UTILISATION_TABLE = f"{CLIENT_NAME}_cliniko_practitioner_utilisation"
+UTILISATION_KEYS_PER_QUERY = 1_000
+# Endpoint -> the interval kind its records add (blocks through their occurrences)
+UTILISATION_SOURCES = {"availability_blocks": AVAILABLE, "unavailable_blocks": UNAVAILABLE, "appointments": BOOKED}
+
+# Keyword flags scanned out of appointment and invoice notes (note_flags) and
+# communication content (content_flags), one bit per rule (see cliniko_flags);
+# each rule also gets a flag_<name> alias column. CLINIKO_FLAG_RULES_PATH
+# replaces the default rules with a JSON file of [name, [keywords...]] pairs
+FLAG_RULES_PATH = os.environ.get("CLINIKO_FLAG_RULES_PATH", "")
+FLAG_RULES = load_flag_rules(FLAG_RULES_PATH) if FLAG_RULES_PATH else DEFAULT_FLAG_RULES
+TEXT_FLAGS = FlagMatcher(FLAG_RULES)
+
+# Ingest profiles (see cliniko_projection): table -> {column: "drop", "hash" or a
+# maximum length in characters}, applied to the transformed rows and the DDL.
+# CLINIKO_INGEST_PROFILE picks the tenant's profile
+INGEST_PROFILES = {
+    "full": {},
+    "lean": {
+        "communications": {"content": "hash"},
+        "patients": {"notes": "hash", "appointment_notes": "hash"},
+        "businesses": {"additional_information": "drop", "additional_invoice_information": "drop"},
+        "invoices": {"notes": 200},
+        "group_appointments": {"notes": 200},
+        "appointments_enriched": {"notes": 200},
+    },
+}
+INGEST_PROFILE = os.environ.get("CLINIKO_INGEST_PROFILE", "full")
+
+# Repeating bookings and blocks are expanded into `<table>_occurrences` up to this
+# far ahead; series cut short are extended when a later sync fetches them again
+OCCURRENCE_HORIZON = datetime.timedelta(days=365)
+# Version for records without updated_at (ReplacingMergeTree versions cannot be NULL)
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
 
 # Helper conversion functions
 def safe_str(val):
@@ -38,9 +223,17 @@ def parse_datetime(dt_string):
             dt_string = dt_string[:-1] + '+00:00'
         return datetime.datetime.fromisoformat(dt_string)
     except ValueError:
-        print(f"Warning: Could not parse datetime: {dt_string}")
+        log(logger, logging.WARNING, "could not parse datetime", value=dt_string)
         return None
 
+def as_utc(value):
+    """
+    Treat naive datetimes (as returned for UTC columns) as UTC.
+    """
+    if value is None or value.tzinfo:
+        return value
+    return value.replace(tzinfo=datetime.timezone.utc)
+
 def bool_to_uint8(value):
     """
     Convert a boolean True/False to 1/0.
@@ -48,6 +241,12 @@ def bool_to_uint8(value):
     """
     return 1 if value is True else 0
 
+def linked_id(item, field):
+    """
+    Id of the record `item[field]` links to, e.g. linked_id(appointment, "patient").
+    """
+    return safe_int(extract_last_segment(safe_str(item.get(field, {}).get("links", {}).get("self", ""))))
+
 def extract_last_segment(url: str) -> str:
     """
     Given a URL, split it by '/' (removing any trailing slash) and return the last segment.
@@ -94,7 +293,7 @@ def transform_booking(item):
     """
     Transforms booking data from Cliniko API.
     """
-    repeat_rule = item.get("repeat_rule", {})
+    repeat_rule = item.get("repeat_rule") or {}  # null for one-off records
     return (
         safe_int(item.get("id")),  # Changed from safe_str to safe_int
         safe_str(CLIENT_INSTANCE),
@@ -117,7 +316,7 @@ def transform_availability_block(item):
     """
     Transforms availability block data from Cliniko API.
     """
-    repeat_rule = item.get("repeat_rule", {})
+    repeat_rule = item.get("repeat_rule") or {}  # null for one-off records
     return (
         safe_int(item.get("id")),  # Changed type here
         safe_str(CLIENT_INSTANCE),
@@ -127,14 +326,16 @@ def transform_availability_block(item):
         parse_datetime(item.get("updated_at")),
         safe_int(repeat_rule.get("number_of_repeats")),
         safe_str(repeat_rule.get("repeat_type")),
-        safe_int(repeat_rule.get("repeating_interval"))
+        safe_int(repeat_rule.get("repeating_interval")),
+        linked_id(item, "practitioner"),
+        linked_id(item, "business")
     )
 
 def transform_unavailable_block(item):
     """
     Transforms unavailable block data from Cliniko API.
     """
-    repeat_rule = item.get("repeat_rule", {})
+    repeat_rule = item.get("repeat_rule") or {}  # null for one-off records
     return (
         safe_int(item.get("id")),  # Changed
         safe_str(CLIENT_INSTANCE),
@@ -147,7 +348,9 @@ def transform_unavailable_block(item):
         parse_datetime(item.get("updated_at")),
         safe_int(repeat_rule.get("number_of_repeats")),
         safe_str(repeat_rule.get("repeat_type")),
-        safe_int(repeat_rule.get("repeating_interval"))
+        safe_int(repeat_rule.get("repeating_interval")),
+        linked_id(item, "practitioner"),
+        linked_id(item, "business")
     )
 
 def transform_practitioner(item):
@@ -186,15 +389,20 @@ def transform_practitioner_reference_number(item):
 def transform_invoice(item):
     """
     Transforms invoice data from Cliniko API.
+    Local-time columns are for created_at in the invoice's business time zone;
+    note_flags are the TEXT_FLAGS found in the notes.
     """
     def as_float(s):
         return safe_float(s)
+    business_url = safe_str(item.get("business", {}).get("links", {}).get("self", ""))
+    business_id = safe_int(extract_last_segment(business_url))
+    created_at = parse_datetime(item.get("created_at"))
     return (
         safe_int(item.get("id")),  # Changed
         safe_str(CLIENT_INSTANCE),
         parse_datetime(item.get("archived_at")),
         parse_datetime(item.get("closed_at")),
-        parse_datetime(item.get("created_at")),
+        created_at,
         parse_datetime(item.get("deleted_at")),
         as_float(item.get("discounted_amount")),
         as_float(item.get("net_amount")),
@@ -202,11 +410,14 @@ def transform_invoice(item):
         safe_int(item.get("number")),
         safe_str(item.get("online_payment_url")),
         safe_str(item.get("notes")),
+        TEXT_FLAGS.mask(item.get("notes")),
         safe_int(item.get("status")),
         safe_str(item.get("status_description")),
         as_float(item.get("tax_amount")),
         as_float(item.get("total_amount")),
-        parse_datetime(item.get("updated_at"))
+        parse_datetime(item.get("updated_at")),
+        business_id,
+        *BUSINESS_TIME_ZONES.local_parts(created_at, business_id)
     )
 
 def transform_invoice_item(item):
@@ -261,7 +472,8 @@ def transform_patient(patient):
 def transform_communication(item):
     """
     Transforms communication data from Cliniko API.
-    Maps sender and recipient to from_address and to_address.
+    Maps sender and recipient to from_address and to_address; content_flags
+    are the TEXT_FLAGS found in the content.
     """
     from_address = safe_str(item.get("from"))
     to_address = safe_str(item.get("to"))
@@ -275,6 +487,7 @@ def transform_communication(item):
         safe_int(item.get("category_code")),
         bool_to_uint8(item.get("confidential")),
         safe_str(item.get("content")),
+        TEXT_FLAGS.mask(item.get("content")),
         parse_datetime(item.get("created_at")),
         safe_int(item.get("direction_code")),
         safe_str(item.get("direction_description")),
@@ -288,7 +501,9 @@ def transform_communication(item):
 def transform_business(item):
     """
     Transforms business data from Cliniko API.
+    Also records the business's time zone in BUSINESS_TIME_ZONES.
     """
+    BUSINESS_TIME_ZONES.set(safe_int(item.get("id")), item.get("time_zone_identifier"))
     return (
         safe_int(item.get("id")),  # Changed
         safe_str(CLIENT_INSTANCE),
@@ -320,7 +535,9 @@ def transform_business(item):
 def transform_individual_appointment(item):
     """
     Transforms individual appointment data from Cliniko API.
-    Extracts IDs from nested URL links.
+    Extracts IDs from nested URL links. Local-time columns are for starts_at
+    in the appointment's business time zone; note_flags are the TEXT_FLAGS
+    found in the notes (which are not stored themselves).
     """
     appointment_type_url = safe_str(item.get("appointment_type", {}).get("links", {}).get("self", ""))
     business_url = safe_str(item.get("business", {}).get("links", {}).get("self", ""))
@@ -333,6 +550,7 @@ def transform_individual_appointment(item):
     patient_id = safe_int(extract_last_segment(patient_url))
     practitioner_id = safe_int(extract_last_segment(practitioner_url))
     repeated_from_id = safe_int(extract_last_segment(repeated_from_url))
+    starts_at = parse_datetime(item.get("starts_at"))
     
     return (
         appointment_type_id,
@@ -349,8 +567,10 @@ def transform_individual_appointment(item):
         patient_id,
         practitioner_id,
         repeated_from_id,
-        parse_datetime(item.get("starts_at")),
-        parse_datetime(item.get("updated_at"))
+        starts_at,
+        parse_datetime(item.get("updated_at")),
+        *BUSINESS_TIME_ZONES.local_parts(starts_at, business_id),
+        TEXT_FLAGS.mask(item.get("notes"))
     )
 
 def transform_group_appointment(item):
@@ -370,49 +590,769 @@ def transform_group_appointment(item):
         safe_int(item.get("max_attendees"))
     )
 
+def transform_attendee(item, parent, parent_id):
+    """
+    Transforms an attendee of a group appointment or booking
+    (`/{parent}/{parent_id}/attendees`).
+    """
+    patient_url = safe_str(item.get("patient", {}).get("links", {}).get("self", ""))
+    return (
+        safe_int(item.get("id")),
+        safe_str(CLIENT_INSTANCE),
+        parent,
+        parent_id,
+        safe_int(extract_last_segment(patient_url)),
+        bool_to_uint8(item.get("arrived")),
+        parse_datetime(item.get("cancelled_at")),
+        safe_str(item.get("cancellation_note")),
+        safe_str(item.get("notes")),
+        parse_datetime(item.get("archived_at")),
+        parse_datetime(item.get("deleted_at")),
+        parse_datetime(item.get("created_at")),
+        parse_datetime(item.get("updated_at"))
+    )
+
+def transform_enriched_appointment(item, dimensions):
+    """
+    Individual appointment with the names of its patient, practitioner,
+    appointment type and business looked up in `dimensions` (see load_dimensions).
+    """
+    patient_id = linked_id(item, "patient")
+    practitioner_id = linked_id(item, "practitioner")
+    appointment_type_id = linked_id(item, "appointment_type")
+    business_id = linked_id(item, "business")
+    starts_at = parse_datetime(item.get("starts_at"))
+    patients = dimensions["patients"]
+    practitioners = dimensions["practitioners"]
+    appointment_types = dimensions["appointment_types"]
+    return (
+        safe_int(item.get("id")),
+        safe_str(CLIENT_INSTANCE),
+        starts_at,
+        parse_datetime(item.get("ends_at")),
+        parse_datetime(item.get("created_at")),
+        parse_datetime(item.get("updated_at")),
+        parse_datetime(item.get("archived_at")),
+        parse_datetime(item.get("cancelled_at")),
+        parse_datetime(item.get("deleted_at")),
+        bool_to_uint8(item.get("did_not_arrive")),
+        bool_to_uint8(item.get("patient_arrived")),
+        patient_id,
+        patients.get(patient_id, "name"),
+        practitioner_id,
+        practitioners.get(practitioner_id, "name"),
+        practitioners.get(practitioner_id, "designation"),
+        appointment_type_id,
+        appointment_types.get(appointment_type_id, "name"),
+        appointment_types.get(appointment_type_id, "category"),
+        appointment_types.get(appointment_type_id, "duration_in_minutes", 0),
+        business_id,
+        dimensions["businesses"].get(business_id, "name"),
+        safe_str(item.get("notes")),
+        *BUSINESS_TIME_ZONES.local_parts(starts_at, business_id),
+        TEXT_FLAGS.mask(item.get("notes"))
+    )
+
 # --- Generic Fetcher Function ---
 
-def fetch_and_insert_data(session, client, base_url, transform_fn, table, columns):
+def new_fetch_stats():
+    """
+    Per-endpoint counters filled in by fetch_and_insert_data.
+    """
+    return {
+        "pages": 0,
+        "rows": 0,
+        "bytes": 0,
+        "retries": 0,
+        "rate_limited": 0,
+        "wall_seconds": 0.0,
+        "http_seconds": 0.0,
+        "decode_seconds": 0.0,
+        "transform_seconds": 0.0,
+        "insert_wait_seconds": 0.0,
+        "throttle_seconds": 0.0,  # Waiting on API_RATE_LIMITER, included in http_seconds
+        "max_updated_at": None,  # Latest updated_at seen, the cap on the watermark after this fetch
+        "last_id": 0,  # Keyset cursor: highest id fetched, pass as after_id to resume
+    }
+
+def merge_fetch_stats(total, stats):
+    """
+    Add one fetch's stats into `total` (see new_fetch_stats).
+    """
+    for key, value in stats.items():
+        if key in ("max_updated_at", "last_id"):
+            if value is not None and (total[key] is None or value > total[key]):
+                total[key] = value
+        else:
+            total[key] += value
+    return total
+
+def keyset_url(base_url, after_id):
+    """
+    `base_url` (which may carry its own q[] filters) sorted by id, starting
+    after `after_id`.
+    """
+    parts = urlsplit(base_url)
+    params = [(k, v) for k, v in parse_qsl(parts.query) if k not in ("sort", "order", "per_page", "page")]
+    params += [("sort", "id"), ("order", "asc"), ("per_page", KEYSET_PER_PAGE), ("q[]", f"id:>{after_id}")]
+    return urlunsplit(parts._replace(query=urlencode(params)))
+
+def get_with_retry(session, url, stats=None):
+    """
+    GET `url`, retrying 429s, transient 5xx responses and connection errors.
+    Waits for the Retry-After header when present, otherwise backs off
+    exponentially. The last response is returned once retries run out.
+    """
+    import requests
+
+    for attempt in range(MAX_RETRIES + 1):
+        delay = RETRY_BACKOFF_SECONDS * 2 ** attempt
+        throttled = API_RATE_LIMITER.acquire()
+        if stats is not None:
+            stats["throttle_seconds"] += throttled
+        try:
+            response = session.get(url)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == MAX_RETRIES:
+                raise
+            log(logger, logging.WARNING, "request failed, retrying", error=e, delay=delay, url=url)
+        else:
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt == MAX_RETRIES:
+                return response
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                delay = float(retry_after)
+            if stats is not None and response.status_code == 429:
+                stats["rate_limited"] += 1
+            log(logger, logging.WARNING, "retryable response, retrying",
+                status=response.status_code, delay=delay, url=url)
+        if stats is not None:
+            stats["retries"] += 1
+        time.sleep(delay)
+
+def fetch_json(session, url, missing_ok=False):
+    """
+    Parsed JSON of a 200 response; anything else ends the run, except a 404
+    with `missing_ok`, which returns None.
+    """
+    response = get_with_retry(session, url)
+    if missing_ok and response.status_code == 404:
+        return None
+    if response.status_code != 200:
+        log(logger, logging.ERROR, "request failed", status=response.status_code, url=url, body=response.text[:500])
+        raise SystemExit("Failed to fetch data from Cliniko")
+    return response.json()
+
+def page_items(data):
+    """
+    The records of one list response (the array next to `links`), or None
+    when the response has no record key at all.
+    """
+    keys = [k for k in data.keys() if k not in ("links", "total_entries")]
+    if not keys:
+        return None
+    items = data.get(keys[0]) or []
+    return [items] if isinstance(items, dict) else items
+
+def fetch_and_insert_data(session, client, base_url, transform_fn, table, columns, stats=None, after_id=0,
+                          ids=None, on_page=None):
     """
     Generic fetcher that:
-    - Uses Cliniko pagination via `links.next`
+    - Pages by id cursor (PAGINATION = "keyset", resumable from `after_id`)
+      or follows Cliniko's `links.next`
     - Collects data in batches
     - Inserts into ClickHouse (which uses ReplacingMergeTree to replace duplicates)
+    `client` can be a single ClickHouse client or a ClickHouseInsertPool; both
+    expose the same `insert` call. Record ids are added to `ids` (an IdBitmap)
+    when one is passed, and `on_page` is called with each page's raw records.
+    Per-stage timings and counters are accumulated into `stats` (see
+    new_fetch_stats), which is also returned, and recorded in METRICS.
     """
-    next_url = base_url
+    if stats is None:
+        stats = new_fetch_stats()
+    endpoint = table.replace(f"{CLIENT_NAME}_cliniko_", "", 1)
+    updated_at_index = columns.index("updated_at") if "updated_at" in columns else None
+    clock = time.perf_counter
+    started = clock()
+
+    def insert(rows, message):
+        insert_started = clock()
+        client.insert(table=table, data=rows, column_names=columns)
+        stats["insert_wait_seconds"] += clock() - insert_started
+        log(logger, logging.DEBUG, message, table=table, rows=len(rows))
+
+    progress = ProgressReporter(logger, endpoint)
+    keyset = PAGINATION == "keyset"
+    if keyset:
+        stats["last_id"] = max(stats["last_id"], after_id)
+        next_url = keyset_url(base_url, stats["last_id"])
+    else:
+        next_url = base_url
     batch = []
     while next_url:
-        response = session.get(next_url)
+        request_started = clock()
+        retries, rate_limited = stats["retries"], stats["rate_limited"]
+        response = get_with_retry(session, next_url, stats)
+        request_seconds = clock() - request_started
+        stats["http_seconds"] += request_seconds
+        METRICS.observe("cliniko_request_seconds", request_seconds, endpoint=endpoint)
+        METRICS.inc("cliniko_retries_total", stats["retries"] - retries, endpoint=endpoint)
+        METRICS.inc("cliniko_rate_limited_total", stats["rate_limited"] - rate_limited, endpoint=endpoint)
         if response.status_code != 200:
-            print("Error:", response.status_code, response.text)
+            log(logger, logging.ERROR, "request failed", status=response.status_code,
+                url=next_url, body=response.text[:500])
             raise SystemExit("Failed to fetch data from Cliniko")
+        decode_started = clock()
         data = response.json()
-        top_keys = [k for k in data.keys() if k not in ("links", "total_entries")]
-        if not top_keys:
-            print(f"No data found in response for {table}.")
+        stats["decode_seconds"] += clock() - decode_started
+        stats["pages"] += 1
+        stats["bytes"] += len(response.content)
+        METRICS.inc("cliniko_pages_total", endpoint=endpoint)
+        METRICS.observe("cliniko_response_bytes", len(response.content), endpoint=endpoint)
+        items = page_items(data)
+        if items is None:
+            log(logger, logging.INFO, "no data in response", table=table)
             break
-        array_key = top_keys[0]
-        items = data.get(array_key, [])
-        if isinstance(items, dict):
-            items = [items]
-        for item in items:
-            row = transform_fn(item)
-            batch.append(row)
-            if len(batch) >= BATCH_SIZE:
-                client.insert(table=table, data=batch, column_names=columns)
-                print(f"Inserted batch of {len(batch)} rows into {table}.")
-                batch = []
+        if ids is not None:
+            ids.update(safe_int(item.get("id")) for item in items)
+        if on_page is not None:
+            on_page(items)
+        transform_started = clock()
+        rows = [transform_fn(item) for item in items]
+        transform_seconds = clock() - transform_started
+        batch.extend(rows)
+        if updated_at_index is not None:
+            page_max = max((row[updated_at_index] for row in rows if row[updated_at_index] is not None), default=None)
+            if page_max is not None and (stats["max_updated_at"] is None or page_max > stats["max_updated_at"]):
+                stats["max_updated_at"] = page_max
+        stats["transform_seconds"] += transform_seconds
+        stats["rows"] += len(items)
+        METRICS.observe("cliniko_transform_seconds", transform_seconds, endpoint=endpoint)
+        METRICS.inc("cliniko_rows_transformed_total", len(items), endpoint=endpoint)
+        while len(batch) >= BATCH_SIZE:
+            insert(batch[:BATCH_SIZE], "inserted batch")
+            batch = batch[BATCH_SIZE:]
         next_url = data.get("links", {}).get("next")
-        if next_url:
-            print(f"Fetching next page: {next_url}")
-        else:
-            print(f"No more pages found for {table}.")
+        total = data.get("total_entries")
+        if keyset:
+            if items:
+                stats["last_id"] = max(stats["last_id"], max(safe_int(item.get("id")) for item in items))
+            # links.next still says whether more rows match; the cursor says where they start
+            next_url = keyset_url(base_url, stats["last_id"]) if next_url and items else None
+            if total is not None:
+                # total_entries only counts rows past the cursor, this page included
+                total += progress.rows
+        log(logger, logging.DEBUG, "fetched page", table=table, rows=len(items), next=next_url or "")
+        progress.update(len(items), total)
     if batch:
-        client.insert(table=table, data=batch, column_names=columns)
-        print(f"Inserted final batch of {len(batch)} rows into {table}.")
+        insert(batch, "inserted final batch")
+    stats["wall_seconds"] += clock() - started
+    progress.finish(table=table, bytes=stats["bytes"], retries=stats["retries"])
+    return stats
+
+# ---------- Column Lists (insert order for each transform) ----------
+
+appointment_type_cols = [
+    "id",
+    "client_instance",
+    "add_deposit_to_account_credit",
+    "appointment_confirmation_template_ids",
+    "appointment_follow_up_template_ids",
+    "appointment_reminder_template_ids",
+    "archived_at",
+    "category",
+    "color",
+    "created_at",
+    "deposit_price",
+    "description",
+    "duration_in_minutes",
+    "max_attendees",
+    "name",
+    "online_bookings_lead_time_hours",
+    "online_payments_enabled",
+    "online_payments_mode",
+    "show_in_online_bookings",
+    "telehealth_enabled",
+    "updated_at"
+]
+
+booking_cols = [
+    "id",
+    "client_instance",
+    "archived_at",
+    "created_at",
+    "deleted_at",
+    "ends_at",
+    "starts_at",
+    "notes",
+    "patient_ids",
+    "max_attendees",
+    "telehealth_url",
+    "updated_at",
+    "repeat_number",
+    "repeat_type",
+    "repeat_interval"
+]
+
+availability_block_cols = [
+    "id",
+    "client_instance",
+    "created_at",
+    "ends_at",
+    "starts_at",
+    "updated_at",
+    "repeat_number",
+    "repeat_type",
+    "repeat_interval",
+    "practitioner_id",
+    "business_id"
+]
+
+unavailable_block_cols = [
+    "id",
+    "client_instance",
+    "archived_at",
+    "created_at",
+    "deleted_at",
+    "ends_at",
+    "notes",
+    "starts_at",
+    "updated_at",
+    "repeat_number",
+    "repeat_type",
+    "repeat_interval",
+    "practitioner_id",
+    "business_id"
+]
+
+practitioner_cols = [
+    "id",
+    "client_instance",
+    "active",
+    "description",
+    "designation",
+    "display_name",
+    "first_name",
+    "label",
+    "last_name",
+    "show_in_online_bookings",
+    "title",
+    "created_at",
+    "updated_at"
+]
+
+practitioner_ref_cols = [
+    "id",
+    "client_instance",
+    "created_at",
+    "name",
+    "reference_number",
+    "updated_at"
+]
+
+invoice_cols = [
+    "id",
+    "client_instance",
+    "archived_at",
+    "closed_at",
+    "created_at",
+    "deleted_at",
+    "discounted_amount",
+    "net_amount",
+    "issue_date",
+    "number",
+    "online_payment_url",
+    "notes",
+    "note_flags",
+    "status",
+    "status_description",
+    "tax_amount",
+    "total_amount",
+    "updated_at",
+    "business_id",
+    "local_date",
+    "local_hour",
+    "local_weekday"
+]
+
+invoice_item_cols = [
+    "id",
+    "client_instance",
+    "archived_at",
+    "created_at",
+    "deleted_at",
+    "code",
+    "concession_type_name",
+    "discounted_amount",
+    "name",
+    "tax_amount",
+    "tax_name",
+    "tax_rate",
+    "total_including_tax",
+    "unit_price",
+    "updated_at"
+]
+
+patient_cols = [
+    "id",
+    "client_instance",
+    "accepted_email_marketing",
+    "accepted_privacy_policy",
+    "accepted_sms_marketing",
+    "address_1",
+    "address_2",
+    "address_3",
+    "appointment_notes",
+    "archived_at",
+    "city",
+    "created_at",
+    "date_of_birth",
+    "email",
+    "first_name",
+    "last_name",
+    "notes",
+    "updated_at"
+]
+
+communication_cols = [
+    "id",
+    "client_instance",
+    "archived_at",
+    "category",
+    "category_code",
+    "confidential",
+    "content",
+    "content_flags",
+    "created_at",
+    "direction_code",
+    "direction_description",
+    "from_address",
+    "to_address",
+    "comm_type",
+    "comm_type_code",
+    "updated_at"
+]
+
+business_cols = [
+    "id",
+    "client_instance",
+    "additional_information",
+    "additional_invoice_information",
+    "address_1",
+    "address_2",
+    "business_name",
+    "business_registration_name",
+    "business_registration_value",
+    "city",
+    "country",
+    "created_at",
+    "deleted_at",
+    "display_name",
+    "email_reply_to",
+    "label",
+    "post_code",
+    "show_in_online_bookings",
+    "state",
+    "time_zone",
+    "time_zone_identifier",
+    "updated_at",
+    "website_address"
+]
+
+individual_appointment_cols = [
+    "appointment_type_id",
+    "archived_at",
+    "business_id",
+    "cancelled_at",
+    "cancellation_reason",
+    "cancellation_reason_description",
+    "created_at",
+    "deleted_at",
+    "did_not_arrive",
+    "ends_at",
+    "id",
+    "patient_id",
+    "practitioner_id",
+    "repeated_from_id",
+    "starts_at",
+    "updated_at",
+    "local_date",
+    "local_hour",
+    "local_weekday",
+    "note_flags"
+]
+
+group_appointment_cols = [
+    "id",
+    "client_instance",
+    "archived_at",
+    "created_at",
+    "updated_at",
+    "starts_at",
+    "ends_at",
+    "notes",
+    "telehealth_url",
+    "max_attendees"
+]
+
+appointment_enriched_cols = [
+    "id",
+    "client_instance",
+    "starts_at",
+    "ends_at",
+    "created_at",
+    "updated_at",
+    "archived_at",
+    "cancelled_at",
+    "deleted_at",
+    "did_not_arrive",
+    "patient_arrived",
+    "patient_id",
+    "patient_name",
+    "practitioner_id",
+    "practitioner_name",
+    "role",
+    "appointment_type_id",
+    "appointment_type_name",
+    "appointment_type_category",
+    "duration_in_minutes",
+    "business_id",
+    "business_name",
+    "notes",
+    "local_date",
+    "local_hour",
+    "local_weekday",
+    "note_flags"
+]
+
+attendee_cols = [
+    "id",
+    "client_instance",
+    "parent_type",
+    "parent_id",
+    "patient_id",
+    "arrived",
+    "cancelled_at",
+    "cancellation_note",
+    "notes",
+    "archived_at",
+    "deleted_at",
+    "created_at",
+    "updated_at"
+]
+
+occurrence_cols = [
+    "series_id",
+    "occurrence",
+    "client_instance",
+    "practitioner_id",
+    "business_id",
+    "starts_at",
+    "ends_at",
+    "local_date",
+    "local_hour",
+    "local_weekday",
+    "series_updated_at",
+    "series_complete",
+    "expanded_at",
+    "is_deleted"
+]
+
+utilisation_cols = [
+    "practitioner_id",
+    "business_id",
+    "local_date",
+    "available_minutes",
+    "unavailable_minutes",
+    "booked_minutes",
+    "booked_available_minutes",
+    "appointments",
+    "computed_at"
+]
+
+sync_run_cols = [
+    "run_id",
+    "tenant",
+    "client_instance",
+    "endpoint",
+    "started_at",
+    "finished_at",
+    "pages",
+    "rows",
+    "bytes",
+    "retries",
+    "rate_limited",
+    "watermark_before",
+    "watermark_after",
+    "outcome",
+    "error",
+]
+
+# ---------- Endpoint Registry ----------
+
+class Subresource(NamedTuple):
+    """
+    A list served per parent record at `{URL_SHARD}/{parent}/{id}/{name}`,
+    stored in `{CLIENT_NAME}_cliniko_{name}` with the parent's endpoint name
+    and id. Only parents for which `applies(record)` is true are fetched.
+    """
+    name: str
+    transform: Callable  # (record, parent endpoint name, parent id) -> row
+    columns: list
+    applies: Callable = lambda record: True
+
+    @property
+    def table(self):
+        return f"{CLIENT_NAME}_cliniko_{self.name}"
+
+def has_attendees(record):
+    """
+    Bookings list their attendees in patient_ids, so bookings without any are
+    skipped; group appointments always are fetched.
+    """
+    return "patient_ids" not in record or bool(record["patient_ids"])
+
+ATTENDEES = Subresource("attendees", transform_attendee, attendee_cols, has_attendees)
+
+class EnrichedTable(NamedTuple):
+    """
+    A denormalized copy of an endpoint's records in `{CLIENT_NAME}_cliniko_{name}`,
+    written while the endpoint is fetched. `transform(record, dimensions)`
+    gets the ENRICHMENT_DIMENSIONS caches of the run.
+    """
+    name: str
+    transform: Callable
+    columns: list
+
+    @property
+    def table(self):
+        return f"{CLIENT_NAME}_cliniko_{self.name}"
+
+APPOINTMENTS_ENRICHED = EnrichedTable("appointments_enriched", transform_enriched_appointment,
+                                      appointment_enriched_cols)
+
+class Endpoint(NamedTuple):
+    """
+    One Cliniko list endpoint and where its rows go.
+    The API path is `{URL_SHARD}/{name}` and the table is `{CLIENT_NAME}_cliniko_{name}`.
+    `depends_on` names endpoints that must finish syncing before this one starts.
+    `subresources` are fetched for every new or changed record during a sync,
+    and `enriched` tables are written alongside the endpoint's own table.
+    With `occurrences`, repeat rules are expanded into `{table}_occurrences`.
+    """
+    name: str
+    transform: Callable
+    columns: list
+    enabled: bool = True
+    depends_on: tuple = ()
+    subresources: tuple = ()
+    enriched: tuple = ()
+    occurrences: bool = False
+
+    @property
+    def url(self):
+        return f"{URL_SHARD}/{self.name}"
+
+    @property
+    def table(self):
+        return f"{CLIENT_NAME}_cliniko_{self.name}"
+
+    @property
+    def occurrences_table(self):
+        return f"{self.table}_occurrences"
+
+    def incremental_url(self, updated_since):
+        """
+        List URL limited to records updated at or after `updated_since`.
+        """
+        since = updated_since.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        return f"{self.url}?{urlencode({'q[]': f'updated_at:>={since}'})}"
+
+# Endpoints looked up by the fact endpoints (dictionaries, joins); they have no
+# dependencies and run first
+DIMENSIONS = ("businesses", "practitioners", "appointment_types")
+
+# Among endpoints that are ready to run, earlier ones start first, so the list is
+# in priority order: dimensions, then appointments (the freshest data that matters).
+ENDPOINTS = [
+    Endpoint("businesses", transform_business, business_cols),
+    Endpoint("practitioners", transform_practitioner, practitioner_cols),
+    Endpoint("appointment_types", transform_appointment_type, appointment_type_cols),
+    Endpoint("appointments", transform_individual_appointment, individual_appointment_cols,
+             depends_on=DIMENSIONS, enriched=(APPOINTMENTS_ENRICHED,)),
+    Endpoint("bookings", transform_booking, booking_cols, depends_on=DIMENSIONS, subresources=(ATTENDEES,),
+             occurrences=True),
+    Endpoint("availability_blocks", transform_availability_block, availability_block_cols,
+             depends_on=("businesses", "practitioners"), occurrences=True),
+    Endpoint("unavailable_blocks", transform_unavailable_block, unavailable_block_cols,
+             depends_on=("businesses", "practitioners"), occurrences=True),
+    Endpoint("invoices", transform_invoice, invoice_cols, depends_on=("businesses", "practitioners")),
+    Endpoint("invoice_items", transform_invoice_item, invoice_item_cols),
+    Endpoint("patients", transform_patient, patient_cols),
+    Endpoint("communications", transform_communication, communication_cols),
+    Endpoint("practitioner_reference_numbers", transform_practitioner_reference_number, practitioner_ref_cols,
+             depends_on=("practitioners",)),
+    Endpoint("group_appointments", transform_group_appointment, group_appointment_cols,
+             depends_on=DIMENSIONS, subresources=(ATTENDEES,)),
+]
+
+def ingest_projections(profile):
+    """
+    ColumnProjection per table name for the INGEST_PROFILES entry `profile`.
+    Tables are endpoints and their enriched tables.
+    """
+    if profile not in INGEST_PROFILES:
+        raise ValueError(f"Unknown ingest profile: {profile}")
+    tables = {endpoint.name: endpoint for endpoint in ENDPOINTS}
+    tables.update({enriched.name: enriched for endpoint in ENDPOINTS for enriched in endpoint.enriched})
+    projections = {}
+    for name, rules in INGEST_PROFILES[profile].items():
+        if name not in tables:
+            raise ValueError(f"Ingest profile {profile} names unknown table: {name}")
+        projections[name] = ColumnProjection(tables[name].columns, rules)
+    return projections
+
+def project_table(table, projections):
+    """
+    `table` (an Endpoint or EnrichedTable) with its projection applied to its
+    transform and columns.
+    """
+    if isinstance(table, Endpoint) and table.enriched:
+        table = table._replace(enriched=tuple(project_table(enriched, projections) for enriched in table.enriched))
+    projection = projections.get(table.name)
+    if projection is None:
+        return table
+    return table._replace(transform=projection.wrap(table.transform), columns=projection.columns)
+
+PROJECTIONS = ingest_projections(INGEST_PROFILE)
+ENDPOINTS = [project_table(endpoint, PROJECTIONS) for endpoint in ENDPOINTS]
+
+# requests and clickhouse_connect are imported on first use so short
+# incremental runs don't pay their import cost before doing any work.
+
+def make_clickhouse_client():
+    from clickhouse_connect import get_client
+
+    return get_client(
+        host=HOST_CLICKHOUSE,
+        username='default',
+        password=PASSWORD,
+        secure=True
+    )
+
+def make_insert_pool(client_factory=None):
+    """
+    ClickHouseInsertPool over `client_factory` (default: make_clickhouse_client).
+    """
+    return ClickHouseInsertPool(
+        client_factory or make_clickhouse_client,
+        size=INSERT_POOL_SIZE,
+        ordered_tables=[f"{CLIENT_NAME}_cliniko_{name}" for name in INSERT_POOL_ORDERED_TABLES]
+    )
+
+def make_cliniko_session():
+    import requests
 
-def main():
-    # ---------- Cliniko Setup ----------
     auth_string = f"{API_KEY}:".encode("utf-8")
     auth_base64 = base64.b64encode(auth_string).decode("utf-8")
     headers = {
@@ -422,18 +1362,27 @@ def main():
     }
     session = requests.Session()
     session.headers.update(headers)
+    return session
 
-    # ---------- ClickHouse Setup ----------
-    client = get_client(
-        host=HOST_CLICKHOUSE,
-        username='default',
-        password=PASSWORD,
-        secure=True
-    )
+def flag_columns_alter(mask_column):
+    """
+    ALTER clauses adding `mask_column` and one flag_<name> alias per FLAG_RULES entry.
+    """
+    clauses = [f"ADD COLUMN IF NOT EXISTS {mask_column} UInt64"]
+    clauses += [f"ADD COLUMN IF NOT EXISTS flag_{name} UInt8 ALIAS bitTest({mask_column}, {bit})"
+                for bit, name in enumerate(TEXT_FLAGS.names)]
+    return ",\n        ".join(clauses)
 
+def schema_statements():
+    """
+    Every DDL statement the sync relies on, in the order it must run.
+    Columns added to a table after its first release also get an
+    `ADD COLUMN IF NOT EXISTS`, so existing tables are brought up to date.
+    """
+    statements = []
     # ---------- Create Tables in ClickHouse using ReplacingMergeTree ----------
     # Appointment Types
-    client.command(f"""
+    statements.append(f"""
     CREATE TABLE IF NOT EXISTS {CLIENT_NAME}_cliniko_appointment_types (
         id                                        UInt64,
         client_instance                           String,
@@ -460,7 +1409,7 @@ def main():
     ORDER BY id
     """)
     # Bookings
-    client.command(f"""
+    statements.append(f"""
     CREATE TABLE IF NOT EXISTS {CLIENT_NAME}_cliniko_bookings (
         id                    UInt64,
         client_instance       String,
@@ -481,7 +1430,7 @@ def main():
     ORDER BY id
     """)
     # Availability Blocks
-    client.command(f"""
+    statements.append(f"""
     CREATE TABLE IF NOT EXISTS {CLIENT_NAME}_cliniko_availability_blocks (
         id                  UInt64,
         client_instance     String,
@@ -491,12 +1440,15 @@ def main():
         updated_at          Nullable(DateTime64(3, 'UTC')),
         repeat_number       UInt32,
         repeat_type         String,
-        repeat_interval     UInt32
+        repeat_interval     UInt32,
+        practitioner_id     UInt64,
+        business_id         UInt64
     ) ENGINE = ReplacingMergeTree(id)
     ORDER BY id
     """)
+    statements.append(f"ALTER TABLE {CLIENT_NAME}_cliniko_availability_blocks {LINKED_IDS_ALTER}")
     # Unavailable Blocks
-    client.command(f"""
+    statements.append(f"""
     CREATE TABLE IF NOT EXISTS {CLIENT_NAME}_cliniko_unavailable_blocks (
         id                UInt64,
         client_instance   String,
@@ -509,12 +1461,15 @@ def main():
         updated_at        Nullable(DateTime64(3, 'UTC')),
         repeat_number     UInt32,
         repeat_type       String,
-        repeat_interval   UInt32
+        repeat_interval   UInt32,
+        practitioner_id   UInt64,
+        business_id       UInt64
     ) ENGINE = ReplacingMergeTree(id)
     ORDER BY id
     """)
+    statements.append(f"ALTER TABLE {CLIENT_NAME}_cliniko_unavailable_blocks {LINKED_IDS_ALTER}")
     # Practitioners
-    client.command(f"""
+    statements.append(f"""
     CREATE TABLE IF NOT EXISTS {CLIENT_NAME}_cliniko_practitioners (
         id                      UInt64,
         client_instance         String,
@@ -533,7 +1488,7 @@ def main():
     ORDER BY id
     """)
     # Practitioner Reference Numbers
-    client.command(f"""
+    statements.append(f"""
     CREATE TABLE IF NOT EXISTS {CLIENT_NAME}_cliniko_practitioner_reference_numbers (
         id                UInt64,
         client_instance   String,
@@ -545,7 +1500,7 @@ def main():
     ORDER BY id
     """)
     # Invoices
-    client.command(f"""
+    statements.append(f"""
     CREATE TABLE IF NOT EXISTS {CLIENT_NAME}_cliniko_invoices (
         id                   UInt64,
         client_instance      String,
@@ -559,16 +1514,27 @@ def main():
         number               Int32,
         online_payment_url   String,
         notes                String,
+        note_flags           UInt64,  -- Bit n = FLAG_RULES[n] found in notes
         status               Int32,
         status_description   String,
         tax_amount           Float64,
         total_amount         Float64,
-        updated_at           Nullable(DateTime64(3, 'UTC'))
+        updated_at           Nullable(DateTime64(3, 'UTC')),
+        business_id          UInt64,
+        local_date           Nullable(Date),  -- created_at in the business's time zone
+        local_hour           UInt8,
+        local_weekday        UInt8            -- 1 = Monday ... 7 = Sunday
     ) ENGINE = ReplacingMergeTree(id)
     ORDER BY id
     """)
+    statements.append(f"""
+    ALTER TABLE {CLIENT_NAME}_cliniko_invoices
+        ADD COLUMN IF NOT EXISTS business_id UInt64,
+        {LOCAL_TIME_ALTER}
+    """)
+    statements.append(f"ALTER TABLE {CLIENT_NAME}_cliniko_invoices {flag_columns_alter('note_flags')}")
     # Invoice Items
-    client.command(f"""
+    statements.append(f"""
     CREATE TABLE IF NOT EXISTS {CLIENT_NAME}_cliniko_invoice_items (
         id                     UInt64,
         client_instance        String,
@@ -589,7 +1555,7 @@ def main():
     ORDER BY id
     """)
     # Patients
-    client.command(f"""
+    statements.append(f"""
     CREATE TABLE IF NOT EXISTS {CLIENT_NAME}_cliniko_patients (
         id                     UInt64,
         client_instance        String,
@@ -613,7 +1579,7 @@ def main():
     ORDER BY id
     """)
     # Communications
-    client.command(f"""
+    statements.append(f"""
     CREATE TABLE IF NOT EXISTS {CLIENT_NAME}_cliniko_communications (
         id                       UInt64,
         client_instance          String,
@@ -622,6 +1588,7 @@ def main():
         category_code            UInt32,
         confidential             UInt8,
         content                  String,
+        content_flags            UInt64,  -- Bit n = FLAG_RULES[n] found in content
         created_at               Nullable(DateTime64(3, 'UTC')),
         direction_code           UInt32,
         direction_description    String,
@@ -633,8 +1600,9 @@ def main():
     ) ENGINE = ReplacingMergeTree(id)
     ORDER BY id
     """)
+    statements.append(f"ALTER TABLE {CLIENT_NAME}_cliniko_communications {flag_columns_alter('content_flags')}")
     # Businesses
-    client.command(f"""
+    statements.append(f"""
     CREATE TABLE IF NOT EXISTS {CLIENT_NAME}_cliniko_businesses (
         id                              UInt64,
         client_instance                 String,
@@ -663,7 +1631,7 @@ def main():
     ORDER BY id
     """)
     # --- New Tables for Individual and Group Appointments ---
-    client.command(f"""
+    statements.append(f"""
         CREATE TABLE IF NOT EXISTS {CLIENT_NAME}_cliniko_appointments (
             appointment_type_id                  Int64,
             archived_at                          Nullable(DateTime64(3, 'UTC')),
@@ -680,11 +1648,17 @@ def main():
             practitioner_id                      Int64,
             repeated_from_id                     Int64,
             starts_at                            Nullable(DateTime64(3, 'UTC')),
-            updated_at                           Nullable(DateTime64(3, 'UTC'))
+            updated_at                           Nullable(DateTime64(3, 'UTC')),
+            local_date                           Nullable(Date),  -- starts_at in the business's time zone
+            local_hour                           UInt8,
+            local_weekday                        UInt8,           -- 1 = Monday ... 7 = Sunday
+            note_flags                           UInt64           -- Bit n = FLAG_RULES[n] found in notes
         ) ENGINE = ReplacingMergeTree(id)
         ORDER BY id
         """)
-    client.command(f"""
+    statements.append(f"ALTER TABLE {CLIENT_NAME}_cliniko_appointments {LOCAL_TIME_ALTER}")
+    statements.append(f"ALTER TABLE {CLIENT_NAME}_cliniko_appointments {flag_columns_alter('note_flags')}")
+    statements.append(f"""
     CREATE TABLE IF NOT EXISTS {CLIENT_NAME}_cliniko_group_appointments (
         id                    UInt64,
         client_instance       String,
@@ -699,357 +1673,1489 @@ def main():
     ) ENGINE = ReplacingMergeTree(id)
     ORDER BY id
     """)
-    
-    # ---------- Fetch and Insert Calls ----------
-    appointment_types_url = f"{URL_SHARD}/appointment_types"
-    appointment_type_cols = [
-        "id",
-        "client_instance",
-        "add_deposit_to_account_credit",
-        "appointment_confirmation_template_ids",
-        "appointment_follow_up_template_ids",
-        "appointment_reminder_template_ids",
-        "archived_at",
-        "category",
-        "color",
-        "created_at",
-        "deposit_price",
-        "description",
-        "duration_in_minutes",
-        "max_attendees",
-        "name",
-        "online_bookings_lead_time_hours",
-        "online_payments_enabled",
-        "online_payments_mode",
-        "show_in_online_bookings",
-        "telehealth_enabled",
-        "updated_at"
-    ]
-    fetch_and_insert_data(
-        session,
-        client,
-        appointment_types_url,
-        transform_appointment_type,
-        f"{CLIENT_NAME}_cliniko_appointment_types",
-        appointment_type_cols
-    )
-    bookings_url = f"{URL_SHARD}/bookings"
-    booking_cols = [
-        "id",
-        "client_instance",
-        "archived_at",
-        "created_at",
-        "deleted_at",
-        "ends_at",
-        "starts_at",
-        "notes",
-        "patient_ids",
-        "max_attendees",
-        "telehealth_url",
-        "updated_at",
-        "repeat_number",
-        "repeat_type",
-        "repeat_interval"
-    ]
-    fetch_and_insert_data(
-        session,
-        client,
-        bookings_url,
-        transform_booking,
-        f"{CLIENT_NAME}_cliniko_bookings",
-        booking_cols
-    )
-    availability_blocks_url = f"{URL_SHARD}/availability_blocks"
-    availability_block_cols = [
-        "id",
-        "client_instance",
-        "created_at",
-        "ends_at",
-        "starts_at",
-        "updated_at",
-        "repeat_number",
-        "repeat_type",
-        "repeat_interval"
-    ]
-    fetch_and_insert_data(
-        session,
-        client,
-        availability_blocks_url,
-        transform_availability_block,
-        f"{CLIENT_NAME}_cliniko_availability_blocks",
-        availability_block_cols
-    )
-    unavailable_blocks_url = f"{URL_SHARD}/unavailable_blocks"
-    unavailable_block_cols = [
-        "id",
-        "client_instance",
-        "archived_at",
-        "created_at",
-        "deleted_at",
-        "ends_at",
-        "notes",
-        "starts_at",
-        "updated_at",
-        "repeat_number",
-        "repeat_type",
-        "repeat_interval"
-    ]
-    fetch_and_insert_data(
-        session,
-        client,
-        unavailable_blocks_url,
-        transform_unavailable_block,
-        f"{CLIENT_NAME}_cliniko_unavailable_blocks",
-        unavailable_block_cols
-    )
-    practitioners_url = f"{URL_SHARD}/practitioners"
-    practitioner_cols = [
-        "id",
-        "client_instance",
-        "active",
-        "description",
-        "designation",
-        "display_name",
-        "first_name",
-        "label",
-        "last_name",
-        "show_in_online_bookings",
-        "title",
-        "created_at",
-        "updated_at"
-    ]
-    fetch_and_insert_data(
-        session,
-        client,
-        practitioners_url,
-        transform_practitioner,
-        f"{CLIENT_NAME}_cliniko_practitioners",
-        practitioner_cols
-    )
-    practitioner_ref_url = f"{URL_SHARD}/practitioner_reference_numbers"
-    practitioner_ref_cols = [
-        "id",
-        "client_instance",
-        "created_at",
-        "name",
-        "reference_number",
-        "updated_at"
+    # Appointments with their dimension names filled in, for reports that should not join
+    statements.append(f"""
+    CREATE TABLE IF NOT EXISTS {CLIENT_NAME}_cliniko_appointments_enriched (
+        id                          UInt64,
+        client_instance             String,
+        starts_at                   Nullable(DateTime64(3, 'UTC')),
+        ends_at                     Nullable(DateTime64(3, 'UTC')),
+        created_at                  Nullable(DateTime64(3, 'UTC')),
+        updated_at                  Nullable(DateTime64(3, 'UTC')),
+        archived_at                 Nullable(DateTime64(3, 'UTC')),
+        cancelled_at                Nullable(DateTime64(3, 'UTC')),
+        deleted_at                  Nullable(DateTime64(3, 'UTC')),
+        did_not_arrive              UInt8,
+        patient_arrived             UInt8,
+        patient_id                  UInt64,
+        patient_name                String,
+        practitioner_id             UInt64,
+        practitioner_name           LowCardinality(String),
+        role                        LowCardinality(String),  -- Practitioner designation
+        appointment_type_id         UInt64,
+        appointment_type_name       LowCardinality(String),
+        appointment_type_category   LowCardinality(String),
+        duration_in_minutes         UInt32,
+        business_id                 UInt64,
+        business_name               LowCardinality(String),
+        notes                       String,
+        local_date                  Nullable(Date),  -- starts_at in the business's time zone
+        local_hour                  UInt8,
+        local_weekday               UInt8,           -- 1 = Monday ... 7 = Sunday
+        note_flags                  UInt64           -- Bit n = FLAG_RULES[n] found in notes
+    ) ENGINE = ReplacingMergeTree(id)
+    ORDER BY id
+    """)
+    statements.append(f"ALTER TABLE {CLIENT_NAME}_cliniko_appointments_enriched {LOCAL_TIME_ALTER}")
+    statements.append(f"ALTER TABLE {CLIENT_NAME}_cliniko_appointments_enriched {flag_columns_alter('note_flags')}")
+    # Concrete occurrences of repeating bookings and blocks (see occurrence_rows).
+    # The latest expansion of a series replaces earlier ones; read with FINAL and
+    # is_deleted = 0 to skip occurrences a series no longer has
+    for endpoint in ENDPOINTS:
+        if not endpoint.occurrences:
+            continue
+        statements.append(f"""
+    CREATE TABLE IF NOT EXISTS {endpoint.occurrences_table} (
+        series_id             UInt64,
+        occurrence            UInt32,  -- 0 is the record itself, n the n-th repeat
+        client_instance       String,
+        practitioner_id       UInt64,
+        business_id           UInt64,
+        starts_at             Nullable(DateTime64(3, 'UTC')),
+        ends_at               Nullable(DateTime64(3, 'UTC')),
+        local_date            Nullable(Date),  -- starts_at in the business's time zone
+        local_hour            UInt8,
+        local_weekday         UInt8,
+        series_updated_at     DateTime64(3, 'UTC'),
+        series_complete       UInt8,  -- 0 when OCCURRENCE_HORIZON cut the series short
+        expanded_at           DateTime64(3, 'UTC'),
+        is_deleted            UInt8,
+        INDEX starts_at_idx starts_at TYPE minmax GRANULARITY 4
+    ) ENGINE = ReplacingMergeTree(expanded_at, is_deleted)
+    ORDER BY (series_id, occurrence)
+    """)
+    statements.append(f"""
+    CREATE TABLE IF NOT EXISTS {UTILISATION_TABLE} (
+        practitioner_id           UInt64,
+        business_id               UInt64,
+        local_date                Date,
+        available_minutes         UInt32,  -- availability minus unavailable blocks
+        unavailable_minutes       UInt32,  -- unavailable blocks inside availability
+        booked_minutes            UInt32,  -- appointments, overlaps counted once
+        booked_available_minutes  UInt32,  -- booked time inside available time
+        appointments              UInt32,
+        computed_at               DateTime64(3, 'UTC')
+    ) ENGINE = ReplacingMergeTree(computed_at)
+    ORDER BY (practitioner_id, local_date, business_id)
+    """)
+    statements.append(f"""
+    CREATE TABLE IF NOT EXISTS {CLIENT_NAME}_cliniko_attendees (
+        id                    UInt64,
+        client_instance       String,
+        parent_type           LowCardinality(String),  -- 'group_appointments' or 'bookings'
+        parent_id             UInt64,
+        patient_id            UInt64,
+        arrived               UInt8,
+        cancelled_at          Nullable(DateTime64(3, 'UTC')),
+        cancellation_note     String,
+        notes                 String,
+        archived_at           Nullable(DateTime64(3, 'UTC')),
+        deleted_at            Nullable(DateTime64(3, 'UTC')),
+        created_at            Nullable(DateTime64(3, 'UTC')),
+        updated_at            Nullable(DateTime64(3, 'UTC'))
+    ) ENGINE = ReplacingMergeTree(id)
+    ORDER BY id
+    """)
+    statements.append(f"""
+    CREATE TABLE IF NOT EXISTS {SUBRESOURCE_CACHE_TABLE} (
+        subresource           LowCardinality(String),  -- '<parent>/<name>', e.g. 'bookings/attendees'
+        parent_id             UInt64,
+        parent_updated_at     Nullable(DateTime64(3, 'UTC')),
+        fetched_at            DateTime64(3, 'UTC')
+    ) ENGINE = ReplacingMergeTree(fetched_at)
+    ORDER BY (subresource, parent_id)
+    """)
+    statements.append(f"""
+    CREATE TABLE IF NOT EXISTS {TOMBSTONES_TABLE} (
+        entity        LowCardinality(String),
+        id            UInt64,
+        detected_at   DateTime64(3, 'UTC')
+    ) ENGINE = ReplacingMergeTree(detected_at)
+    ORDER BY (entity, id)
+    """)
+    statements.append(f"""
+    CREATE TABLE IF NOT EXISTS {SYNC_RUNS_TABLE} (
+        run_id            UUID,
+        tenant            LowCardinality(String),
+        client_instance   LowCardinality(String),
+        endpoint          LowCardinality(String),
+        started_at        DateTime64(3, 'UTC'),
+        finished_at       DateTime64(3, 'UTC'),
+        pages             UInt32,
+        rows              UInt64,
+        bytes             UInt64,
+        retries           UInt32,
+        rate_limited      UInt32,
+        watermark_before  Nullable(DateTime64(3, 'UTC')),
+        watermark_after   Nullable(DateTime64(3, 'UTC')),
+        outcome           LowCardinality(String),  -- 'success' or 'failed'
+        error             String
+    ) ENGINE = MergeTree
+    PARTITION BY toYYYYMM(started_at)
+    ORDER BY (tenant, endpoint, started_at)
+    """)
+    # Ingest profile: rewrite the projected tables' columns, and add hash columns
+    # to tables created before them (dropped columns stay, filled with defaults)
+    for name, projection in PROJECTIONS.items():
+        table = f"{CLIENT_NAME}_cliniko_{name}"
+        statements = [projection.statement(statement) if f"CREATE TABLE IF NOT EXISTS {table} (" in statement
+                      else statement for statement in statements]
+        if projection.alter_clauses():
+            statements.append(f"ALTER TABLE {table} {', '.join(projection.alter_clauses())}")
+    if ENABLE_MATERIALIZED_VIEWS:
+        statements.extend(materialized_view_statements())
+    if ENABLE_DICTIONARIES:
+        statements.extend(dictionary_statements())
+    return statements
+
+def dictionary_statements():
+    """
+    In-memory ClickHouse dictionaries over the dimension tables, so reports can
+    resolve appointment ids with dictGet instead of joining, e.g.
+        dictGet('{CLIENT_NAME}_cliniko_practitioners_dict', 'display_name', toUInt64(practitioner_id))
+    They refresh every DICTIONARY_LIFETIME seconds and are reloaded explicitly
+    after each sync of their source table. They connect through the
+    DICTIONARY_SOURCE_COLLECTION named collection, which must exist on the server.
+    """
+    min_lifetime, max_lifetime = DICTIONARY_LIFETIME
+    dictionaries = [
+        ("practitioners", [
+            ("id", "UInt64"),
+            ("display_name", "String"),
+            ("first_name", "String"),
+            ("last_name", "String"),
+            ("designation", "String"),
+            ("active", "UInt8"),
+        ]),
+        ("businesses", [
+            ("id", "UInt64"),
+            ("business_name", "String"),
+            ("display_name", "String"),
+            ("city", "String"),
+            ("country", "String"),
+            ("time_zone_identifier", "String"),
+        ]),
+        ("appointment_types", [
+            ("id", "UInt64"),
+            ("name", "String"),
+            ("category", "String"),
+            ("color", "String"),
+            ("duration_in_minutes", "UInt32"),
+        ]),
     ]
-    fetch_and_insert_data(
-        session,
-        client,
-        practitioner_ref_url,
-        transform_practitioner_reference_number,
-        f"{CLIENT_NAME}_cliniko_practitioner_reference_numbers",
-        practitioner_ref_cols
+    statements = []
+    for name, attributes in dictionaries:
+        definition = ",\n        ".join(f"{column:<22}{column_type}" for column, column_type in attributes)
+        columns = ", ".join(column for column, _ in attributes)
+        statements.append(f"""
+    CREATE OR REPLACE DICTIONARY {CLIENT_NAME}_cliniko_{name}_dict (
+        {definition}
     )
-    invoices_url = f"{URL_SHARD}/invoices"
-    invoice_cols = [
-        "id",
-        "client_instance",
-        "archived_at",
-        "closed_at",
-        "created_at",
-        "deleted_at",
-        "discounted_amount",
-        "net_amount",
-        "issue_date",
-        "number",
-        "online_payment_url",
-        "notes",
-        "status",
-        "status_description",
-        "tax_amount",
-        "total_amount",
-        "updated_at"
-    ]
-    fetch_and_insert_data(
-        session,
-        client,
-        invoices_url,
-        transform_invoice,
-        f"{CLIENT_NAME}_cliniko_invoices",
-        invoice_cols
+    PRIMARY KEY id
+    SOURCE(CLICKHOUSE(
+        NAME {DICTIONARY_SOURCE_COLLECTION}
+        QUERY 'SELECT {columns} FROM {CLIENT_NAME}_cliniko_{name} FINAL'
+    ))
+    LAYOUT(HASHED())
+    LIFETIME(MIN {min_lifetime} MAX {max_lifetime})
+    """)
+    return statements
+
+def daily_aggregate_selects():
+    """
+    {raw table: (aggregate table, SELECT of the states it is fed)} for the
+    pre-aggregated dashboard tables.
+
+    States are versioned by the later of updated_at and deleted_at, so a row
+    whose deleted_at reconcile has set (see mark_deleted) outranks the version
+    it was first inserted with.
+    """
+    version = "greatest(ifNull(updated_at, toDateTime64(0, 3, 'UTC')), ifNull(deleted_at, toDateTime64(0, 3, 'UTC')))"
+    appointments = f"""
+    SELECT
+        toDate(assumeNotNull(starts_at))                            AS day,
+        id,
+        argMaxState(practitioner_id, {version})                     AS practitioner_id,
+        argMaxState(business_id, {version})                         AS business_id,
+        argMaxState(did_not_arrive, {version})                      AS did_not_arrive,
+        argMaxState(toUInt8(cancelled_at IS NOT NULL), {version})   AS cancelled,
+        argMaxState(toUInt8(deleted_at IS NOT NULL), {version})     AS is_deleted,
+        maxState({version})                                         AS version
+    FROM {CLIENT_NAME}_cliniko_appointments
+    WHERE starts_at IS NOT NULL
+    GROUP BY day, id
+    """
+    invoices = f"""
+    SELECT
+        coalesce(toDateOrNull(issue_date), toDate(created_at), toDate(0))   AS day,
+        id,
+        argMaxState(net_amount, {version})                                  AS net_amount,
+        argMaxState(tax_amount, {version})                                  AS tax_amount,
+        argMaxState(total_amount, {version})                                AS total_amount,
+        argMaxState(toUInt8(deleted_at IS NOT NULL), {version})             AS is_deleted
+    FROM {CLIENT_NAME}_cliniko_invoices
+    GROUP BY day, id
+    """
+    return {
+        f"{CLIENT_NAME}_cliniko_appointments": (f"{CLIENT_NAME}_cliniko_appointments_daily_agg", appointments),
+        f"{CLIENT_NAME}_cliniko_invoices": (f"{CLIENT_NAME}_cliniko_invoices_daily_agg", invoices),
+    }
+
+def materialized_view_statements():
+    """
+    Pre-aggregated dashboard tables that ClickHouse keeps up to date on insert.
+
+    The raw tables are ReplacingMergeTree and every sync re-inserts rows it has
+    seen before, so the aggregates must be safe to feed duplicates. Both keep
+    argMax states per (day, record id), so a re-synced or edited record
+    contributes its latest values once, and the views roll those up:
+    - an appointment moved to another day leaves its old (day, id) row behind,
+      so the appointments view keeps only the latest version of each id;
+    - reverted DNAs and cancellations, and deletions, replace the earlier
+      state instead of adding to it.
+    Each target table is back-filled from the raw table the first time it is
+    created (the INSERT is a no-op once the target has rows).
+    """
+    selects = daily_aggregate_selects()
+    statements = []
+    # Daily appointment counts, DNAs and cancellations per practitioner
+    _, appointments_daily_select = selects[f"{CLIENT_NAME}_cliniko_appointments"]
+    statements.append(f"""
+    CREATE TABLE IF NOT EXISTS {CLIENT_NAME}_cliniko_appointments_daily_agg (
+        day                Date,
+        id                 Int64,
+        practitioner_id    AggregateFunction(argMax, Int64, DateTime64(3, 'UTC')),
+        business_id        AggregateFunction(argMax, Int64, DateTime64(3, 'UTC')),
+        did_not_arrive     AggregateFunction(argMax, UInt8, DateTime64(3, 'UTC')),
+        cancelled          AggregateFunction(argMax, UInt8, DateTime64(3, 'UTC')),
+        is_deleted         AggregateFunction(argMax, UInt8, DateTime64(3, 'UTC')),
+        version            AggregateFunction(max, DateTime64(3, 'UTC'))
+    ) ENGINE = AggregatingMergeTree
+    ORDER BY (day, id)
+    """)
+    statements.append(f"""
+    CREATE MATERIALIZED VIEW IF NOT EXISTS {CLIENT_NAME}_cliniko_appointments_daily_mv
+    TO {CLIENT_NAME}_cliniko_appointments_daily_agg AS
+    {appointments_daily_select}
+    """)
+    statements.append(f"""
+    INSERT INTO {CLIENT_NAME}_cliniko_appointments_daily_agg
+    SELECT * FROM ({appointments_daily_select})
+    WHERE (SELECT count() FROM {CLIENT_NAME}_cliniko_appointments_daily_agg) = 0
+    """)
+    statements.append(f"""
+    CREATE VIEW IF NOT EXISTS {CLIENT_NAME}_cliniko_appointments_daily AS
+    SELECT
+        day,
+        practitioner_id,
+        business_id,
+        count()                         AS appointments,
+        sum(dna)                        AS did_not_arrive,
+        sum(cancel)                     AS cancelled,
+        did_not_arrive / appointments   AS dna_rate
+    FROM (
+        SELECT
+            argMax(booked_day, latest)      AS day,
+            argMax(practitioner, latest)    AS practitioner_id,
+            argMax(business, latest)        AS business_id,
+            argMax(dna_flag, latest)        AS dna,
+            argMax(cancel_flag, latest)     AS cancel,
+            argMax(deleted, latest)         AS is_deleted
+        FROM (
+            SELECT
+                day                             AS booked_day,
+                id,
+                argMaxMerge(practitioner_id)    AS practitioner,
+                argMaxMerge(business_id)        AS business,
+                argMaxMerge(did_not_arrive)     AS dna_flag,
+                argMaxMerge(cancelled)          AS cancel_flag,
+                argMaxMerge(is_deleted)         AS deleted,
+                maxMerge(version)               AS latest
+            FROM {CLIENT_NAME}_cliniko_appointments_daily_agg
+            GROUP BY day, id
+        )
+        GROUP BY id
     )
-    invoice_items_url = f"{URL_SHARD}/invoice_items"
-    invoice_item_cols = [
-        "id",
-        "client_instance",
-        "archived_at",
-        "created_at",
-        "deleted_at",
-        "code",
-        "concession_type_name",
-        "discounted_amount",
-        "name",
-        "tax_amount",
-        "tax_name",
-        "tax_rate",
-        "total_including_tax",
-        "unit_price",
-        "updated_at"
-    ]
-    fetch_and_insert_data(
-        session,
-        client,
-        invoice_items_url,
-        transform_invoice_item,
-        f"{CLIENT_NAME}_cliniko_invoice_items",
-        invoice_item_cols
+    WHERE is_deleted = 0
+    GROUP BY day, practitioner_id, business_id
+    """)
+    # Daily invoice net/tax/total amounts (latest version of each invoice)
+    _, invoices_daily_select = selects[f"{CLIENT_NAME}_cliniko_invoices"]
+    statements.append(f"""
+    CREATE TABLE IF NOT EXISTS {CLIENT_NAME}_cliniko_invoices_daily_agg (
+        day                Date,
+        id                 UInt64,
+        net_amount         AggregateFunction(argMax, Float64, DateTime64(3, 'UTC')),
+        tax_amount         AggregateFunction(argMax, Float64, DateTime64(3, 'UTC')),
+        total_amount       AggregateFunction(argMax, Float64, DateTime64(3, 'UTC')),
+        is_deleted         AggregateFunction(argMax, UInt8, DateTime64(3, 'UTC'))
+    ) ENGINE = AggregatingMergeTree
+    ORDER BY (day, id)
+    """)
+    statements.append(f"""
+    CREATE MATERIALIZED VIEW IF NOT EXISTS {CLIENT_NAME}_cliniko_invoices_daily_mv
+    TO {CLIENT_NAME}_cliniko_invoices_daily_agg AS
+    {invoices_daily_select}
+    """)
+    statements.append(f"""
+    INSERT INTO {CLIENT_NAME}_cliniko_invoices_daily_agg
+    SELECT * FROM ({invoices_daily_select})
+    WHERE (SELECT count() FROM {CLIENT_NAME}_cliniko_invoices_daily_agg) = 0
+    """)
+    statements.append(f"""
+    CREATE VIEW IF NOT EXISTS {CLIENT_NAME}_cliniko_invoices_daily AS
+    SELECT
+        day,
+        count()            AS invoices,
+        sum(net)           AS net_amount,
+        sum(tax)           AS tax_amount,
+        sum(total)         AS total_amount
+    FROM (
+        SELECT
+            day,
+            id,
+            argMaxMerge(net_amount)    AS net,
+            argMaxMerge(tax_amount)    AS tax,
+            argMaxMerge(total_amount)  AS total,
+            argMaxMerge(is_deleted)    AS deleted
+        FROM {CLIENT_NAME}_cliniko_invoices_daily_agg
+        GROUP BY day, id
     )
-    patients_url = f"{URL_SHARD}/patients"
-    patient_cols = [
-        "id",
-        "client_instance",
-        "accepted_email_marketing",
-        "accepted_privacy_policy",
-        "accepted_sms_marketing",
-        "address_1",
-        "address_2",
-        "address_3",
-        "appointment_notes",
-        "archived_at",
-        "city",
-        "created_at",
-        "date_of_birth",
-        "email",
-        "first_name",
-        "last_name",
-        "notes",
-        "updated_at"
-    ]
-    fetch_and_insert_data(
-        session,
-        client,
-        patients_url,
-        transform_patient,
-        f"{CLIENT_NAME}_cliniko_patients",
-        patient_cols
+    WHERE deleted = 0
+    GROUP BY day
+    """)
+    return statements
+
+def schema_fingerprint(statements):
+    return hashlib.sha256("\n".join(statements).encode("utf-8")).hexdigest()
+
+def ensure_schema(client):
+    """
+    Run the schema DDL only when it differs from what was last applied.
+
+    The fingerprint of the DDL is stored in a schema-version table, so an
+    unchanged schema costs one query instead of a CREATE per table. Editing
+    any statement changes the fingerprint and re-applies all of them (they
+    are all idempotent).
+    """
+    from clickhouse_connect.driver.exceptions import DatabaseError
+
+    statements = schema_statements()
+    fingerprint = schema_fingerprint(statements)
+    version_table = f"{CLIENT_NAME}_cliniko_schema_version"
+    try:
+        applied = client.command(f"SELECT argMax(fingerprint, applied_at) FROM {version_table}")
+    except DatabaseError:
+        applied = None  # Version table does not exist yet
+    if applied == fingerprint:
+        log(logger, logging.INFO, "schema up to date, skipping DDL", fingerprint=fingerprint[:12])
+        return False
+    log(logger, logging.INFO, "applying schema DDL", statements=len(statements), fingerprint=fingerprint[:12])
+    for statement in statements:
+        client.command(statement)
+    client.command(f"""
+    CREATE TABLE IF NOT EXISTS {version_table} (
+        fingerprint  String,
+        applied_at   DateTime64(3, 'UTC') DEFAULT now64(3)
+    ) ENGINE = MergeTree
+    ORDER BY applied_at
+    """)
+    client.command(f"INSERT INTO {version_table} (fingerprint) VALUES ('{fingerprint}')")
+    return True
+
+def sync_endpoints(session, client, endpoints=None, reload_dictionaries=True, stats=None, profiler=None,
+                   record_runs=True, incremental=False, workers=1):
+    """
+    Fetch every enabled endpoint and hand its rows to `client`.
+    `client` only needs an `insert` method, so it can be a ClickHouse client,
+    a ClickHouseInsertPool or a BulkFileWriter (pass reload_dictionaries=False
+    and record_runs=False for clients without `command` / `query`).
+    When `stats` is a dict, each endpoint's fetch stats are stored under its name.
+    With a SyncProfiler, each endpoint runs under its own profile; queued
+    inserts are flushed inside it so their cost lands in the right file.
+    With record_runs, one SYNC_RUNS_TABLE row is written per endpoint, also
+    when it fails; an endpoint only counts as successful once the rows of all
+    its tables have been inserted. With incremental, endpoints that have a watermark only
+    fetch records updated since it.
+    Endpoints run in dependency order (Endpoint.depends_on), up to `workers`
+    at a time. `session` is either one session shared by every worker or a
+    SessionPool handing each worker its own.
+    Afterwards enriched rows get the patient names that were not synced yet
+    when they were written (see fill_patient_names), and the utilisation of
+    every day the fetched rows touched is recomputed, also when an endpoint
+    failed.
+    """
+    run_id = uuid.uuid4()
+    watermarks = load_watermarks(client) if record_runs else {}
+    sessions = session if isinstance(session, SessionPool) else SessionPool(lambda: session)
+    dimensions = LoadOnce(functools.partial(load_dimensions, client))
+    touched = None
+    if hasattr(client, "query"):
+        load_business_time_zones(client)
+        touched = TouchedDays()
+    if profiler is not None:
+        workers = 1  # cProfile cannot profile several threads at once
+
+    def sync_one(endpoint):
+        started_at = datetime.datetime.now(datetime.timezone.utc)
+        endpoint_stats = new_fetch_stats()
+        url = endpoint.url
+        if incremental and endpoint.name in watermarks:
+            url = endpoint.incremental_url(watermarks[endpoint.name])
+        try:
+            with sessions.session() as endpoint_session:
+                if profiler is None:
+                    sync_endpoint(endpoint_session, client, endpoint, endpoint_stats, url, sessions, dimensions,
+                                  touched)
+                    flush_endpoint(client, endpoint)
+                else:
+                    with profiler.profile(endpoint.name):
+                        sync_endpoint(endpoint_session, client, endpoint, endpoint_stats, url, sessions, dimensions,
+                                      touched)
+                        flush_endpoint(client, endpoint)
+        except BaseException as e:
+            if record_runs:
+                record_sync_run(client, run_id, endpoint, endpoint_stats, started_at,
+                                watermarks.get(endpoint.name), "failed", repr(e))
+            raise
+        if record_runs:
+            record_sync_run(client, run_id, endpoint, endpoint_stats, started_at,
+                            watermarks.get(endpoint.name), "success")
+        if stats is not None:
+            stats[endpoint.name] = endpoint_stats
+        if reload_dictionaries:
+            reload_endpoint_dictionary(client, endpoint)
+
+    selected = [endpoint for endpoint in endpoints or ENDPOINTS if endpoint.enabled]
+    try:
+        run_dag(
+            {endpoint.name: functools.partial(sync_one, endpoint) for endpoint in selected},
+            {endpoint.name: endpoint.depends_on for endpoint in selected},
+            workers,
+        )
+        fill_patient_names(client, selected, dimensions)
+    finally:
+        if touched:
+            refresh_utilisation(client, touched.keys)
+
+def flush_table(client, table):
+    """
+    Wait until `table`'s queued batches are inserted, for clients that queue.
+    """
+    flush = getattr(client, "flush", None)
+    if flush:
+        flush(table)
+
+def endpoint_tables(endpoint):
+    """
+    Every table a sync of `endpoint` writes: its own, then its sub-resource,
+    enriched and occurrence tables.
+    """
+    tables = [endpoint.table]
+    tables += [subresource.table for subresource in endpoint.subresources]
+    tables += [enriched.table for enriched in endpoint.enriched]
+    if endpoint.occurrences:
+        tables.append(endpoint.occurrences_table)
+    return tables
+
+def flush_endpoint(client, endpoint):
+    """
+    flush_table for every table of `endpoint`; raises the first insert error.
+    """
+    for table in endpoint_tables(endpoint):
+        flush_table(client, table)
+
+def failed_batches(client, endpoint):
+    """
+    Failed inserts into `endpoint`'s tables so far, for clients that queue.
+    """
+    failed = getattr(client, "failed_batches", None)
+    return sum(failed(table) for table in endpoint_tables(endpoint)) if failed else 0
+
+def sync_endpoint(session, client, endpoint, stats=None, url=None, sessions=None, dimensions=None, touched=None,
+                  ids=None):
+    """
+    Fetch one endpoint, plus its sub-resources for every fetched record that
+    changed since they were last fetched, and write its enriched and
+    occurrence tables.
+    Sub-resource requests take their sessions from `sessions` (a
+    SessionPool), or share `session`. `dimensions` returns the run's
+    dimension caches (see load_dimensions); they are loaded here otherwise.
+    Utilisation days the fetched records affect are added to `touched`, and
+    the fetched ids to `ids` (an IdBitmap) when one is passed.
+    """
+    sessions = sessions or SessionPool(lambda: session)
+    fetchers = [(subresource, subresource_fetcher(client, sessions, endpoint, subresource))
+                for subresource in endpoint.subresources]
+    # The dimension caches are read from ClickHouse, which a BulkFileWriter cannot do
+    enriched = endpoint.enriched if hasattr(client, "query") else ()
+    if len(enriched) < len(endpoint.enriched):
+        log(logger, logging.INFO, "client cannot query, skipping enriched tables", endpoint=endpoint.name)
+    dimensions = dimensions or LoadOnce(functools.partial(load_dimensions, client))
+    horizon = datetime.datetime.now(datetime.timezone.utc) + OCCURRENCE_HORIZON
+    if endpoint.name not in UTILISATION_SOURCES:
+        touched = None
+    derived = {}  # table -> (columns, rows not inserted yet)
+
+    def add_derived(table, columns, rows, final=False):
+        pending = derived.setdefault(table, (columns, []))[1]
+        pending.extend(rows)
+        if pending and (final or len(pending) >= BATCH_SIZE):
+            client.insert(table=table, data=pending, column_names=columns)
+            derived[table] = (columns, [])
+
+    def on_page(items):
+        for subresource, fetcher in fetchers:
+            fetcher.submit(
+                (safe_int(item.get("id")), parse_datetime(item.get("updated_at")))
+                for item in items if subresource.applies(item)
+            )
+        if enriched:
+            lookup_page_dimensions(client, dimensions(), items)
+        for table in enriched:
+            caches = dimensions()
+            add_derived(table.table, table.columns, [table.transform(item, caches) for item in items])
+        if endpoint.occurrences:
+            add_derived(endpoint.occurrences_table, occurrence_cols,
+                        occurrence_rows(client, endpoint, items, horizon, touched))
+        elif touched is not None:
+            touched.add(appointment_days(client, endpoint, items))
+
+    try:
+        result = fetch_and_insert_data(
+            session,
+            client,
+            url or endpoint.url,
+            endpoint.transform,
+            endpoint.table,
+            endpoint.columns,
+            stats,
+            ids=ids,
+            on_page=on_page if fetchers or enriched or endpoint.occurrences or touched is not None else None
+        )
+    except BaseException:
+        for _, fetcher in fetchers:
+            fetcher.abort()
+        raise
+    for table, (columns, _) in list(derived.items()):
+        add_derived(table, columns, [], final=True)
+    for _, fetcher in fetchers:
+        fetcher.close()
+    return result
+
+def occurrence_rows(client, endpoint, items, horizon, touched=None):
+    """
+    `occurrences_table` rows for the series among `items` whose updated_at
+    changed since they were last expanded, or that `horizon` cut short.
+    Occurrences a series no longer has (fewer repeats, archived or deleted
+    series) are written with is_deleted = 1. The utilisation keys of the
+    regenerated series, old and new, are added to `touched` (a TouchedDays).
+    """
+    ids = [safe_int(item.get("id")) for item in items]
+    # series id -> (series_updated_at, series_complete, last occurrence number, utilisation keys)
+    expanded = expanded_series(client, endpoint, ids) if ids and hasattr(client, "query") else {}
+    expanded_at = datetime.datetime.now(datetime.timezone.utc)
+    rows = []
+    for series_id, item in zip(ids, items):
+        updated_at = parse_datetime(item.get("updated_at")) or EPOCH
+        previous = expanded.get(series_id)
+        if previous and previous[1] and previous[0] == truncate_to_millis(updated_at):
+            continue
+        business_id = linked_id(item, "business")
+        practitioner_id = linked_id(item, "practitioner")
+        first_row = len(rows)
+        repeat_rule = item.get("repeat_rule") or {}
+        occurrences, complete = expand_series(
+            parse_datetime(item.get("starts_at")),
+            parse_datetime(item.get("ends_at")),
+            BUSINESS_TIME_ZONES.zone(business_id),
+            safe_str(repeat_rule.get("repeat_type")),
+            safe_int(repeat_rule.get("number_of_repeats")),
+            safe_int(repeat_rule.get("repeating_interval")) or 1,
+            horizon,
+        )
+        deleted = 1 if item.get("archived_at") or item.get("deleted_at") else 0
+        for number, starts_at, ends_at in occurrences:
+            rows.append((series_id, number, safe_str(CLIENT_INSTANCE), practitioner_id, business_id,
+                         starts_at, ends_at, *BUSINESS_TIME_ZONES.local_parts(starts_at, business_id),
+                         updated_at, int(complete), expanded_at, deleted))
+        for number in range(len(occurrences), previous[2] + 1 if previous else 0):
+            rows.append((series_id, number, safe_str(CLIENT_INSTANCE), practitioner_id, business_id,
+                         None, None, None, 0, 0, updated_at, int(complete), expanded_at, 1))
+        if touched is not None:
+            touched.add((row[3], row[4], row[7]) for row in rows[first_row:])
+            touched.add(previous[3] if previous else ())
+    return rows
+
+def expanded_series(client, endpoint, ids):
+    """
+    State of the last expansion of each series in `ids` that has one.
+    """
+    result = client.query(f"""
+    SELECT series_id, argMax(series_updated_at, expanded_at), argMax(series_complete, expanded_at), max(occurrence),
+           groupUniqArrayIf((practitioner_id, business_id, local_date), local_date IS NOT NULL)
+    FROM {endpoint.occurrences_table}
+    WHERE series_id IN %(ids)s
+    GROUP BY series_id
+    """, parameters={"ids": tuple(ids)})
+    return {
+        series_id: (truncate_to_millis(updated_at), complete, last, [tuple(key) for key in keys])
+        for series_id, updated_at, complete, last, keys in result.result_rows
+    }
+
+def appointment_days(client, endpoint, items):
+    """
+    Utilisation keys of the appointments in `items` that are new or whose
+    updated_at changed, both as fetched and as currently stored (an
+    appointment may have moved to another day).
+    """
+    if not items:
+        return []
+    result = client.query(f"""
+    SELECT id, practitioner_id, business_id, local_date, updated_at
+    FROM {endpoint.table}
+    WHERE id IN %(ids)s
+    """, parameters={"ids": tuple(safe_int(item.get("id")) for item in items)})
+    stored = {}  # id -> [(key, updated_at)] for every stored version
+    for appointment_id, practitioner_id, business_id, local_date, updated_at in result.result_rows:
+        stored.setdefault(appointment_id, []).append(
+            ((practitioner_id, business_id, local_date), truncate_to_millis(updated_at)))
+    keys = []
+    for item in items:
+        versions = stored.get(safe_int(item.get("id")), [])
+        updated_at = truncate_to_millis(parse_datetime(item.get("updated_at")))
+        if updated_at is not None and any(version == updated_at for _, version in versions):
+            continue
+        business_id = linked_id(item, "business")
+        local_date = BUSINESS_TIME_ZONES.local_parts(parse_datetime(item.get("starts_at")), business_id)[0]
+        keys.append((linked_id(item, "practitioner"), business_id, local_date))
+        keys.extend(key for key, _ in versions)
+    return keys
+
+def refresh_utilisation(client, keys):
+    """
+    Recompute UTILISATION_TABLE for `keys` ((practitioner_id, business_id,
+    local_date) tuples) from the stored block occurrences and appointments.
+    Keys that no longer have any intervals get a row of zeros.
+    """
+    sources = []
+    for endpoint in ENDPOINTS:
+        if endpoint.name not in UTILISATION_SOURCES:
+            continue
+        table = endpoint.occurrences_table if endpoint.occurrences else endpoint.table
+        live = "is_deleted = 0" if endpoint.occurrences else \
+            "cancelled_at IS NULL AND deleted_at IS NULL AND archived_at IS NULL"
+        flush_table(client, table)
+        sources.append((UTILISATION_SOURCES[endpoint.name], table, live))
+    keys = sorted(keys)
+    computed_at = datetime.datetime.now(datetime.timezone.utc)
+    for chunk_start in range(0, len(keys), UTILISATION_KEYS_PER_QUERY):
+        chunk = keys[chunk_start:chunk_start + UTILISATION_KEYS_PER_QUERY]
+        intervals = {key: [] for key in chunk}
+        for kind, table, live in sources:
+            result = client.query(f"""
+            SELECT practitioner_id, business_id, local_date, starts_at, ends_at
+            FROM {table} FINAL
+            WHERE {live} AND (practitioner_id, business_id, local_date) IN %(keys)s
+            """, parameters={"keys": tuple(chunk)})
+            for practitioner_id, business_id, local_date, starts_at, ends_at in result.result_rows:
+                intervals[(practitioner_id, business_id, local_date)].append(
+                    (kind, as_utc(starts_at), as_utc(ends_at)))
+        rows = []
+        for (practitioner_id, business_id, local_date), day_intervals in intervals.items():
+            minutes = sweep(day_intervals, *day_bounds(local_date, BUSINESS_TIME_ZONES.zone(business_id)))
+            rows.append((
+                practitioner_id,
+                business_id,
+                local_date,
+                minutes["available"],
+                minutes["unavailable"],
+                minutes["booked"],
+                minutes["booked_available"],
+                sum(1 for kind, _, _ in day_intervals if kind == BOOKED),
+                computed_at,
+            ))
+        client.insert(table=UTILISATION_TABLE, data=rows, column_names=utilisation_cols)
+    log(logger, logging.INFO, "utilisation refreshed", days=len(keys))
+
+def load_business_time_zones(client):
+    """
+    Seed BUSINESS_TIME_ZONES from the businesses table, for runs that do not
+    fetch every business (incremental syncs, --check, --reconcile).
+    """
+    result = client.query(f"SELECT id, time_zone_identifier FROM {CLIENT_NAME}_cliniko_businesses FINAL")
+    for business_id, time_zone in result.result_rows:
+        BUSINESS_TIME_ZONES.set(business_id, time_zone)
+    log(logger, logging.DEBUG, "loaded business time zones", businesses=len(BUSINESS_TIME_ZONES))
+
+def load_dimensions(client):
+    """
+    A DimensionCache per ENRICHMENT_DIMENSIONS endpoint, read from ClickHouse
+    once that endpoint's queued inserts have landed, plus an empty one per
+    PAGE_DIMENSIONS endpoint for lookup_page_dimensions to fill.
+    """
+    dimensions = {}
+    for name, columns in ENRICHMENT_DIMENSIONS.items():
+        table = f"{CLIENT_NAME}_cliniko_{name}"
+        flush_table(client, table)
+        result = client.query(f"SELECT id, {', '.join(columns.values())} FROM {table} FINAL")
+        dimensions[name] = DimensionCache(columns).load(result.result_rows)
+    for name, (_, columns) in PAGE_DIMENSIONS.items():
+        dimensions[name] = DimensionCache(columns)
+    log(logger, logging.INFO, "loaded dimension caches", **{name: len(cache) for name, cache in dimensions.items()})
+    return dimensions
+
+def lookup_page_dimensions(client, dimensions, items):
+    """
+    Load the PAGE_DIMENSIONS records that `items` link to and `dimensions`
+    does not hold yet. Ids ClickHouse has no row for (their endpoint has not
+    synced them yet) go to the cache's `missing` set; see fill_patient_names.
+    """
+    for name, (field, columns) in PAGE_DIMENSIONS.items():
+        cache = dimensions[name]
+        ids = {linked_id(item, field) for item in items}
+        ids = [record_id for record_id in ids if record_id and record_id not in cache]
+        if not ids:
+            continue
+        result = client.query(
+            f"SELECT id, {', '.join(columns.values())} FROM {CLIENT_NAME}_cliniko_{name} FINAL WHERE id IN %(ids)s",
+            parameters={"ids": tuple(ids)}
+        )
+        cache.load(result.result_rows)
+        cache.missing.update([record_id for record_id in ids if record_id not in cache])
+
+def fill_patient_names(client, endpoints, dimensions):
+    """
+    Rewrite the enriched rows of `endpoints` that were written with an empty
+    patient_name because their patient was not in ClickHouse yet, now that
+    the patients endpoint has had its turn. `dimensions` is the run's LoadOnce.
+    """
+    if not dimensions.loaded or not dimensions()["patients"].missing:
+        return
+    missing = tuple(dimensions()["patients"].missing)
+    _, columns = PAGE_DIMENSIONS["patients"]
+    flush_table(client, f"{CLIENT_NAME}_cliniko_patients")
+    for endpoint in endpoints:
+        for enriched in endpoint.enriched:
+            if "patient_name" not in enriched.columns:
+                continue
+            flush_table(client, enriched.table)
+            select = ", ".join("p.name" if column == "patient_name" else f"e.{column}" for column in enriched.columns)
+            client.command(f"""
+            INSERT INTO {enriched.table} ({', '.join(enriched.columns)})
+            SELECT {select}
+            FROM {enriched.table} AS e FINAL
+            INNER JOIN (
+                SELECT id, {columns["name"]} AS name
+                FROM {CLIENT_NAME}_cliniko_patients FINAL
+                WHERE id IN %(ids)s
+            ) AS p ON e.patient_id = p.id
+            WHERE e.patient_id IN %(ids)s AND e.patient_name = '' AND p.name != ''
+            """, parameters={"ids": missing})
+    log(logger, logging.INFO, "filled missing patient names", patients=len(missing))
+
+def subresource_fetcher(client, sessions, endpoint, subresource):
+    """
+    SubresourceFetcher for `subresource` of `endpoint`'s records. The parent
+    cache needs a client that can query; other clients (BulkFileWriter)
+    fetch every parent.
+    """
+    key = f"{endpoint.name}/{subresource.name}"
+    cacheable = hasattr(client, "query")
+
+    def fetch(parent_id):
+        url = f"{endpoint.url}/{parent_id}/{subresource.name}?{urlencode({'per_page': SUBRESOURCE_PER_PAGE})}"
+        records = []
+        with sessions.session() as session:
+            while url:
+                data = fetch_json(session, url, missing_ok=True)
+                if data is None:
+                    # The parent was deleted after it was listed, so it has no children left
+                    log(logger, logging.WARNING, "sub-resource parent not found", endpoint=endpoint.name,
+                        subresource=subresource.name, parent_id=parent_id)
+                    return []
+                records.extend(page_items(data) or [])
+                url = data.get("links", {}).get("next")
+        return records
+
+    def insert(rows):
+        client.insert(table=subresource.table, data=rows, column_names=subresource.columns)
+
+    return SubresourceFetcher(
+        key,
+        cached=(lambda parents: cached_parents(client, key, parents)) if cacheable else (lambda parents: set()),
+        fetch=fetch,
+        transform=lambda parent_id, record: subresource.transform(record, endpoint.name, parent_id),
+        insert=insert,
+        mark=(lambda parents: mark_parents_fetched(client, key, parents)) if cacheable else (lambda parents: None),
+        flush=lambda: flush_table(client, subresource.table),
+        batch_size=BATCH_SIZE,
     )
-    communications_url = f"{URL_SHARD}/communications"
-    communication_cols = [
-        "id",
-        "client_instance",
-        "archived_at",
-        "category",
-        "category_code",
-        "confidential",
-        "content",
-        "created_at",
-        "direction_code",
-        "direction_description",
-        "from_address",
-        "to_address",
-        "comm_type",
-        "comm_type_code",
-        "updated_at"
-    ]
-    fetch_and_insert_data(
-        session,
-        client,
-        communications_url,
-        transform_communication,
-        f"{CLIENT_NAME}_cliniko_communications",
-        communication_cols
+
+def cached_parents(client, key, parents):
+    """
+    Ids among `parents` ((id, updated_at) pairs) whose sub-resource `key` was
+    fetched when the parent had the same updated_at.
+    """
+    result = client.query(f"""
+    SELECT parent_id, argMax(parent_updated_at, fetched_at)
+    FROM {SUBRESOURCE_CACHE_TABLE}
+    WHERE subresource = %(key)s AND parent_id IN %(ids)s
+    GROUP BY parent_id
+    """, parameters={"key": key, "ids": tuple(parent_id for parent_id, _ in parents)})
+    fetched_for = {parent_id: truncate_to_millis(updated_at) for parent_id, updated_at in result.result_rows}
+    return {
+        parent_id for parent_id, updated_at in parents
+        if updated_at is not None and fetched_for.get(parent_id) == truncate_to_millis(updated_at)
+    }
+
+def mark_parents_fetched(client, key, parents):
+    fetched_at = datetime.datetime.now(datetime.timezone.utc)
+    client.insert(
+        table=SUBRESOURCE_CACHE_TABLE,
+        data=[(key, parent_id, updated_at, fetched_at) for parent_id, updated_at in parents],
+        column_names=["subresource", "parent_id", "parent_updated_at", "fetched_at"],
     )
-    businesses_url = f"{URL_SHARD}/businesses"
-    business_cols = [
-        "id",
-        "client_instance",
-        "additional_information",
-        "additional_invoice_information",
-        "address_1",
-        "address_2",
-        "business_name",
-        "business_registration_name",
-        "business_registration_value",
-        "city",
-        "country",
-        "created_at",
-        "deleted_at",
-        "display_name",
-        "email_reply_to",
-        "label",
-        "post_code",
-        "show_in_online_bookings",
-        "state",
-        "time_zone",
-        "time_zone_identifier",
-        "updated_at",
-        "website_address"
-    ]
-    fetch_and_insert_data(
-        session,
-        client,
-        businesses_url,
-        transform_business,
-        f"{CLIENT_NAME}_cliniko_businesses",
-        business_cols
+
+def load_watermarks(client):
+    """
+    Watermark per endpoint from this tenant's last successful runs: every
+    record updated before it has been synced (see record_sync_run).
+    """
+    result = client.query(f"""
+    SELECT endpoint, max(watermark_after)
+    FROM {SYNC_RUNS_TABLE}
+    WHERE tenant = %(tenant)s AND outcome = 'success'
+    GROUP BY endpoint
+    """, parameters={"tenant": CLIENT_NAME})
+    return {endpoint: as_utc(watermark) for endpoint, watermark in result.result_rows if watermark is not None}
+
+def record_sync_run(client, run_id, endpoint, stats, started_at, watermark_before, outcome, error=""):
+    """
+    Append one row to the sync run ledger. A failed run keeps the previous
+    watermark, since the rows it did fetch are not an updated_at-ordered prefix.
+
+    A successful run moves the watermark to its start minus WATERMARK_OVERLAP,
+    not to the latest updated_at it saw: the listing is walked by id, so a
+    record updated mid-walk behind the cursor was missed even though later
+    ones were fetched. The latest updated_at inserted caps it, in case
+    Cliniko's clock is behind ours.
+    """
+    watermark_after = watermark_before
+    if outcome == "success" and stats["max_updated_at"] is not None:
+        candidate = min(started_at - WATERMARK_OVERLAP, stats["max_updated_at"])
+        watermark_after = max(filter(None, (watermark_before, candidate)))
+    row = (
+        run_id,
+        CLIENT_NAME,
+        CLIENT_INSTANCE,
+        endpoint.name,
+        started_at,
+        datetime.datetime.now(datetime.timezone.utc),
+        stats["pages"],
+        stats["rows"],
+        stats["bytes"],
+        stats["retries"],
+        stats["rate_limited"],
+        watermark_before,
+        watermark_after,
+        outcome,
+        error,
     )
-    appointments_url = f"{URL_SHARD}/appointments"
-    individual_appointment_cols = [
-        "appointment_type_id",
-        "archived_at",
-        "business_id",
-        "cancelled_at",
-        "cancellation_reason",
-        "cancellation_reason_description",
-        "created_at",
-        "deleted_at",
-        "did_not_arrive",
-        "ends_at",
-        "id",
-        "patient_id",
-        "practitioner_id",
-        "repeated_from_id",
-        "starts_at",
-        "updated_at"
+    client.insert(table=SYNC_RUNS_TABLE, data=[row], column_names=sync_run_cols)
+
+def reload_endpoint_dictionary(client, endpoint):
+    """
+    Reload the dictionary backed by `endpoint` once its rows have landed.
+    """
+    if not ENABLE_DICTIONARIES or endpoint.name not in DICTIONARY_ENDPOINTS:
+        return
+    flush_table(client, endpoint.table)
+    client.command(f"SYSTEM RELOAD DICTIONARY {endpoint.table}_dict")
+    log(logger, logging.INFO, "reloaded dictionary", dictionary=f"{endpoint.table}_dict")
+
+def optimize_tables(client):
+    log(logger, logging.INFO, "triggering deduplication merge")
+    tables = [table for endpoint in ENDPOINTS for table in endpoint_tables(endpoint)]
+    for table in dict.fromkeys(tables):
+        client.command(f"OPTIMIZE TABLE {table} FINAL")
+
+def main(client_factory=None, session=None, stats=None):
+    """
+    Full sync of every endpoint, SYNC_WORKERS at a time. `client_factory` and
+    `session` (a session or SessionPool) default to the production
+    ClickHouse/Cliniko connections; the benchmark harness swaps in local
+    ones. Per-endpoint stats (including time spent inside ClickHouse
+    inserts) are written into `stats` when a dict is passed.
+    """
+    metrics_server = METRICS.serve(METRICS_PORT) if METRICS_PORT else None
+    session = session or SessionPool(make_cliniko_session)
+    client = make_insert_pool(client_factory)
+    ensure_schema(client)
+    profiler = SyncProfiler(PROFILE_DIR) if PROFILE_DIR else None
+    sync_endpoints(session, client, stats=stats, profiler=profiler, workers=SYNC_WORKERS)
+    # Wait for the insert pool to drain before merging
+    client.flush()
+    client.log_stats()
+    if stats is not None:
+        table_stats = client.table_stats()
+        for endpoint in ENDPOINTS:
+            if endpoint.name in stats:
+                stats[endpoint.name]["insert_seconds"] = table_stats.get(endpoint.table, {}).get("seconds", 0.0)
+    optimize_tables(client)
+    client.close()
+    if METRICS_SUMMARY_PATH:
+        METRICS.write_summary(METRICS_SUMMARY_PATH)
+        log(logger, logging.INFO, "metrics summary written", path=METRICS_SUMMARY_PATH)
+    if metrics_server:
+        metrics_server.shutdown()
+    log(logger, logging.INFO, "done")
+
+@contextmanager
+def run_lock(path=None):
+    """
+    Non-blocking per-tenant lock file. Yields False when another sync holds it.
+    """
+    import fcntl
+
+    with open(path or RUN_LOCK_PATH, "w") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def tenant_phase_offset():
+    """
+    Stable per-tenant delay before the first daemon cycle.
+    """
+    if not DAEMON_JITTER_SECONDS:
+        return 0.0
+    return zlib.crc32(CLIENT_NAME.encode("utf-8")) % (DAEMON_JITTER_SECONDS * 1000) / 1000.0
+
+def next_run_time(planned, finished, interval):
+    """
+    Next slot on the endpoint's `interval` grid after `finished`, plus jitter.
+    Slots missed while a run overran are skipped, not queued up.
+    """
+    missed = max(0, int((finished - planned) // interval))
+    jitter = random.uniform(0, min(DAEMON_JITTER_SECONDS, interval * 0.1))
+    return planned + (missed + 1) * interval + jitter
+
+def run_daemon(client_factory=None, session=None, stop=None):
+    """
+    Long-running scheduler: syncs each endpoint incrementally on its own
+    interval (ENDPOINT_SYNC_INTERVALS), reusing pooled HTTP sessions and one
+    ClickHouse insert pool across cycles. Runs until `stop` is set, SIGTERM
+    or Ctrl-C. A cycle that finds the run lock taken is skipped.
+    """
+    stop = stop or threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    metrics_server = METRICS.serve(METRICS_PORT) if METRICS_PORT else None
+    session = session or SessionPool(make_cliniko_session)
+    client = make_insert_pool(client_factory)
+    ensure_schema(client)
+    endpoints = [endpoint for endpoint in ENDPOINTS if endpoint.enabled]
+    first_run = time.monotonic() + tenant_phase_offset()
+    next_due = {endpoint.name: first_run for endpoint in endpoints}
+    log(logger, logging.INFO, "daemon started", endpoints=len(endpoints), first_run_in=first_run - time.monotonic())
+    try:
+        while not stop.is_set():
+            now = time.monotonic()
+            due = [endpoint for endpoint in endpoints if next_due[endpoint.name] <= now]
+            if not due:
+                stop.wait(min(next_due.values()) - now)
+                continue
+            with run_lock() as acquired:
+                if not acquired:
+                    log(logger, logging.WARNING, "another sync holds the run lock, skipping cycle",
+                        endpoints=",".join(endpoint.name for endpoint in due))
+                else:
+                    try:
+                        sync_endpoints(session, client, endpoints=due, incremental=True, workers=SYNC_WORKERS)
+                        client.flush()
+                    except (Exception, SystemExit) as e:
+                        # Already recorded in the run ledger; retry on the next slot
+                        log(logger, logging.ERROR, "sync cycle failed", error=repr(e))
+            finished = time.monotonic()
+            for endpoint in due:
+                interval = ENDPOINT_SYNC_INTERVALS.get(endpoint.name, DEFAULT_SYNC_INTERVAL_SECONDS)
+                next_due[endpoint.name] = next_run_time(next_due[endpoint.name], finished, interval)
+            if METRICS_SUMMARY_PATH:
+                METRICS.write_summary(METRICS_SUMMARY_PATH)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+        if metrics_server:
+            metrics_server.shutdown()
+        log(logger, logging.INFO, "daemon stopped")
+
+def export_bulk_files(directory, fmt=None):
+    """
+    First half of a bulk backfill: fetch and transform every endpoint into
+    compressed files under `directory`, one sub-directory per table.
+    No ClickHouse connection is needed.
+    """
+    session = make_cliniko_session()
+    profiler = SyncProfiler(PROFILE_DIR) if PROFILE_DIR else None
+    with BulkFileWriter(directory, fmt=fmt, column_types=ddl_column_types(schema_statements())) as writer:
+        sync_endpoints(session, writer, reload_dictionaries=False, profiler=profiler, record_runs=False)
+    log(logger, logging.INFO, "bulk files written", directory=directory)
+
+def load_bulk_files(directory):
+    """
+    Second half of a bulk backfill: create the tables and load every file
+    under `directory` with one large insert per file.
+    """
+    client = make_clickhouse_client()
+    ensure_schema(client)
+    load_bulk_directory(client, directory)
+    optimize_tables(client)
+    client.close()
+    log(logger, logging.INFO, "done")
+
+def window_url(endpoint, field, start, end, per_page=BACKFILL_PER_PAGE):
+    """
+    List URL for the records of `endpoint` with `field` in [start, end).
+    """
+    params = [
+        ("q[]", f"{field}:>={format_timestamp(start)}"),
+        ("q[]", f"{field}:<{format_timestamp(end)}"),
+        ("per_page", per_page),
     ]
-    fetch_and_insert_data(
-        session,
-        client,
-        appointments_url,
-        transform_individual_appointment,
-        f"{CLIENT_NAME}_cliniko_appointments",
-        individual_appointment_cols
+    return f"{endpoint.url}?{urlencode(params)}"
+
+def plan_backfill(session, endpoint, field):
+    """
+    Windows covering every record of `endpoint`, from the oldest `field`
+    value up to now. `field` must be one of the endpoint's columns.
+    """
+    oldest = fetch_json(session, f"{endpoint.url}?{urlencode({'sort': field, 'order': 'asc', 'per_page': 1})}")
+    items = page_items(oldest) or []
+    start = parse_datetime(items[0].get(field)) if items else None
+    if start is None:
+        return []
+    end = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0) + datetime.timedelta(seconds=1)
+
+    def count(window_start, window_end):
+        data = fetch_json(session, window_url(endpoint, field, window_start, window_end, per_page=1))
+        return data.get("total_entries", 0)
+
+    return plan_windows(start, end, count, BACKFILL_MAX_WINDOW_ROWS, BACKFILL_MIN_WINDOW)
+
+def backfill_endpoint(sessions, client, endpoint, checkpoint, field=BACKFILL_WINDOW_FIELD, workers=BACKFILL_WORKERS,
+                      dimensions=None, touched=None):
+    """
+    Sync `endpoint` window by window, resuming from `checkpoint`. Returns the
+    merged fetch stats of the windows synced in this call, and the time the
+    backfill of the endpoint started (see BackfillCheckpoint.started_at), also
+    when it started in an earlier call. Endpoints without a `field` column are
+    windowed on BACKFILL_WINDOW_FIELD instead.
+    A window only counts as done once its rows are inserted.
+    """
+    if field not in endpoint.columns:
+        log(logger, logging.INFO, "endpoint has no backfill field, using the default", endpoint=endpoint.name,
+            field=field, default=BACKFILL_WINDOW_FIELD)
+        field = BACKFILL_WINDOW_FIELD
+    key = f"{endpoint.name}:{field}"
+    windows = checkpoint.plan(key)
+    if windows is None:
+        planned_at = datetime.datetime.now(datetime.timezone.utc)
+        with sessions.session() as session:
+            windows = checkpoint.save_plan(key, plan_backfill(session, endpoint, field), planned_at)
+
+    def sync_window(window):
+        url = window_url(endpoint, field, parse_timestamp(window["start"]), parse_timestamp(window["end"]))
+        failed = failed_batches(client, endpoint)
+        with sessions.session() as session:
+            stats = sync_endpoint(session, client, endpoint, url=url, sessions=sessions, dimensions=dimensions,
+                                  touched=touched)
+        flush_endpoint(client, endpoint)
+        # Windows share the endpoint's tables, so another window's flush may have
+        # raised this window's insert error; any failure meanwhile fails it too
+        if failed_batches(client, endpoint) != failed:
+            raise RuntimeError(f"inserts into {endpoint.name} tables failed during the window")
+        return stats
+
+    total = new_fetch_stats()
+    for stats in run_windows(key, windows, sync_window, checkpoint, workers):
+        merge_fetch_stats(total, stats)
+    return total, checkpoint.started_at(key)
+
+def backfill(client_factory=None, session=None, endpoints=None, field=BACKFILL_WINDOW_FIELD, workers=BACKFILL_WORKERS):
+    """
+    Initial load of a tenant: every endpoint is synced as concurrent
+    `field` windows (see cliniko_backfill). Endpoints run one after another
+    in dependency order, each writing a sync_runs row like a normal sync.
+    """
+    sessions = session or SessionPool(make_cliniko_session)
+    client = make_insert_pool(client_factory)
+    ensure_schema(client)
+    checkpoint = BackfillCheckpoint(BACKFILL_CHECKPOINT_PATH)
+    run_id = uuid.uuid4()
+    watermarks = load_watermarks(client)
+    load_business_time_zones(client)
+    dimensions = LoadOnce(functools.partial(load_dimensions, client))
+    touched = TouchedDays()
+    selected = {endpoint.name: endpoint for endpoint in endpoints or ENDPOINTS if endpoint.enabled}
+    order = topological_order({
+        name: tuple(need for need in endpoint.depends_on if need in selected) for name, endpoint in selected.items()
+    })
+    try:
+        for endpoint in (selected[name] for name in order):
+            started_at = datetime.datetime.now(datetime.timezone.utc)
+            try:
+                stats, backfill_started_at = backfill_endpoint(sessions, client, endpoint, checkpoint, field,
+                                                               workers, dimensions, touched)
+            except BaseException as e:
+                record_sync_run(client, run_id, endpoint, new_fetch_stats(), started_at,
+                                watermarks.get(endpoint.name), "failed", repr(e))
+                raise
+            # A resumed backfill holds windows fetched (and records created) since the
+            # plan of an earlier call, so the watermark must not pass that plan
+            record_sync_run(client, run_id, endpoint, stats, min(filter(None, (started_at, backfill_started_at))),
+                            watermarks.get(endpoint.name), "success")
+            reload_endpoint_dictionary(client, endpoint)
+        fill_patient_names(client, selected.values(), dimensions)
+    finally:
+        # Windows finished before a failure are not fetched again on resume
+        if touched:
+            refresh_utilisation(client, touched.keys)
+    client.flush()
+    optimize_tables(client)
+    client.close()
+    log(logger, logging.INFO, "done")
+
+def fetch_ids(session, endpoint, ids, url=None):
+    """
+    Add the id of every record listed at `url` (default: the endpoint) to
+    `ids`, walking by id cursor without transforming or inserting anything.
+    """
+    base_url = url or endpoint.url
+    next_url = keyset_url(base_url, 0)
+    while next_url:
+        data = fetch_json(session, next_url)
+        items = page_items(data) or []
+        page_ids = [safe_int(item.get("id")) for item in items]
+        ids.update(page_ids)
+        next_url = keyset_url(base_url, max(page_ids)) if page_ids and data.get("links", {}).get("next") else None
+
+def clickhouse_ids(client, endpoint, up_to):
+    """
+    Ascending ids in `endpoint`'s table up to `up_to`, skipping tombstoned ones.
+    """
+    last = -1
+    while True:
+        rows = client.query(f"""
+        SELECT id FROM {endpoint.table}
+        WHERE id > %(last)s AND id <= %(up_to)s
+          AND id NOT IN (SELECT id FROM {TOMBSTONES_TABLE} WHERE entity = %(entity)s)
+        GROUP BY id
+        ORDER BY id
+        LIMIT {RECONCILE_ID_PAGE}
+        """, parameters={"last": last, "up_to": up_to, "entity": endpoint.name}).result_rows
+        if not rows:
+            return
+        for (record_id,) in rows:
+            yield record_id
+        last = rows[-1][0]
+
+def reconcile_endpoint(session, client, endpoint, dimensions=None, touched=None):
+    """
+    Refresh archived/deleted records of `endpoint` (with their derived
+    tables, like a sync), then tombstone ids that ClickHouse holds but
+    Cliniko no longer returns. Utilisation days either step affects are
+    added to `touched`. Returns the number of tombstoned ids.
+    """
+    ids = IdBitmap()
+    fetch_ids(session, endpoint, ids)
+    for field in RECONCILE_FILTER_FIELDS:
+        if field in endpoint.columns:
+            url = f"{endpoint.url}?{urlencode({'q[]': f'{field}:>1970-01-01T00:00:00Z'})}"
+            sync_endpoint(session, client, endpoint, url=url, dimensions=dimensions, touched=touched, ids=ids)
+    if not len(ids):
+        # An empty listing is far more likely an API problem than every record being deleted
+        log(logger, logging.WARNING, "no ids returned, skipping reconciliation", endpoint=endpoint.name)
+        return 0
+    # Ids above the highest one listed may belong to records created after the walk
+    stored = 0
+    missing = []
+    for record_id in clickhouse_ids(client, endpoint, ids.max()):
+        stored += 1
+        if record_id not in ids:
+            missing.append(record_id)
+    fields = {"endpoint": endpoint.name, "cliniko_ids": len(ids), "clickhouse_ids": stored,
+              "missing": len(missing), "bitmap_bytes": ids.nbytes()}
+    if len(missing) > max(RECONCILE_MAX_DELETE_FRACTION * stored, RECONCILE_GUARD_MIN_IDS):
+        log(logger, logging.ERROR, "too many missing ids, not tombstoning", **fields)
+        return 0
+    log(logger, logging.INFO, "reconciled", **fields)
+    if not missing:
+        return 0
+    detected_at = datetime.datetime.now(datetime.timezone.utc)
+    client.insert(
+        table=TOMBSTONES_TABLE,
+        data=[(endpoint.name, record_id, detected_at) for record_id in missing],
+        column_names=["entity", "id", "detected_at"]
     )
-    group_appointments_url = f"{URL_SHARD}/group_appointments"
-    group_appointment_cols = [
-        "id",
-        "client_instance",
-        "archived_at",
-        "created_at",
-        "updated_at",
-        "starts_at",
-        "ends_at",
-        "notes",
-        "telehealth_url",
-        "max_attendees"
-    ]
-    # Uncomment the following lines if you need to fetch group appointments:
-    # fetch_and_insert_data(
-    #     session,
-    #     client,
-    #     group_appointments_url,
-    #     transform_group_appointment,
-    #     f"{CLIENT_NAME}_cliniko_group_appointments",
-    #     group_appointment_cols
-    # )
-    print("Triggering deduplication merge")
-    client.command(f"OPTIMIZE TABLE {CLIENT_NAME}_cliniko_appointment_types FINAL")
-    client.command(f"OPTIMIZE TABLE {CLIENT_NAME}_cliniko_bookings FINAL")
-    client.command(f"OPTIMIZE TABLE {CLIENT_NAME}_cliniko_availability_blocks FINAL")
-    client.command(f"OPTIMIZE TABLE {CLIENT_NAME}_cliniko_unavailable_blocks FINAL")
-    client.command(f"OPTIMIZE TABLE {CLIENT_NAME}_cliniko_practitioners FINAL")
-    client.command(f"OPTIMIZE TABLE {CLIENT_NAME}_cliniko_practitioner_reference_numbers FINAL")
-    client.command(f"OPTIMIZE TABLE {CLIENT_NAME}_cliniko_invoices FINAL")
-    client.command(f"OPTIMIZE TABLE {CLIENT_NAME}_cliniko_invoice_items FINAL")
-    client.command(f"OPTIMIZE TABLE {CLIENT_NAME}_cliniko_patients FINAL")
-    client.command(f"OPTIMIZE TABLE {CLIENT_NAME}_cliniko_communications FINAL")
-    client.command(f"OPTIMIZE TABLE {CLIENT_NAME}_cliniko_businesses FINAL")
-    client.command(f"OPTIMIZE TABLE {CLIENT_NAME}_cliniko_appointments FINAL")
-    client.command(f"OPTIMIZE TABLE {CLIENT_NAME}_cliniko_group_appointments FINAL")
-    print("Done")
-    
+    for i in range(0, len(missing), RECONCILE_MUTATION_CHUNK):
+        mark_deleted(client, endpoint, missing[i:i + RECONCILE_MUTATION_CHUNK], touched)
+    return len(missing)
+
+def mark_deleted(client, endpoint, ids, touched=None):
+    """
+    Set deleted_at on the hard-deleted `ids` in `endpoint`'s table and its
+    enriched tables (and in its daily aggregate), and write is_deleted rows for
+    the occurrences of deleted series. The utilisation days they held are added
+    to `touched`.
+    """
+    source = touched is not None and endpoint.name in UTILISATION_SOURCES
+    if source and not endpoint.occurrences:
+        flush_table(client, endpoint.table)
+        result = client.query(f"""
+        SELECT DISTINCT practitioner_id, business_id, local_date
+        FROM {endpoint.table}
+        WHERE id IN %(ids)s
+        """, parameters={"ids": tuple(ids)})
+        touched.add(result.result_rows)
+    chunk = ",".join(str(record_id) for record_id in ids)
+    for table in (endpoint,) + endpoint.enriched:
+        if "deleted_at" not in table.columns:
+            continue
+        flush_table(client, table.table)
+        # Synchronous, so the utilisation refresh afterwards sees the deletions
+        client.command(
+            f"ALTER TABLE {table.table} UPDATE deleted_at = now64(3) "
+            f"WHERE id IN ({chunk}) AND deleted_at IS NULL",
+            settings={"mutations_sync": 1}
+        )
+    aggregate = daily_aggregate_selects().get(endpoint.table) if ENABLE_MATERIALIZED_VIEWS else None
+    if aggregate:
+        # A mutation bypasses the materialized view, so feed it the deleted rows
+        target, select = aggregate
+        client.command(f"INSERT INTO {target} SELECT * FROM ({select}) WHERE id IN ({chunk})")
+    if endpoint.occurrences:
+        flush_table(client, endpoint.occurrences_table)
+        result = client.query(f"""
+        SELECT {", ".join(occurrence_cols[:-2])}
+        FROM {endpoint.occurrences_table} FINAL
+        WHERE series_id IN %(ids)s AND is_deleted = 0
+        """, parameters={"ids": tuple(ids)})
+        expanded_at = datetime.datetime.now(datetime.timezone.utc)
+        rows = [(*row, expanded_at, 1) for row in result.result_rows]
+        if rows:
+            client.insert(table=endpoint.occurrences_table, data=rows, column_names=occurrence_cols)
+        if source:
+            touched.add((row[3], row[4], row[7]) for row in rows)
+
+def reconcile(client_factory=None, session=None, endpoints=None):
+    """
+    Hard-delete reconciliation for every enabled endpoint (see reconcile_endpoint).
+    """
+    session = session or make_cliniko_session()
+    client = make_insert_pool(client_factory)
+    ensure_schema(client)
+    load_business_time_zones(client)
+    dimensions = LoadOnce(functools.partial(load_dimensions, client))
+    touched = TouchedDays()
+    try:
+        for endpoint in endpoints or ENDPOINTS:
+            if endpoint.enabled:
+                reconcile_endpoint(session, client, endpoint, dimensions, touched)
+        fill_patient_names(client, endpoints or ENDPOINTS, dimensions)
+    finally:
+        if touched:
+            refresh_utilisation(client, touched.keys)
+    client.close()
+    log(logger, logging.INFO, "done")
+
+def id_range_url(endpoint, low, high, **params):
+    """
+    List URL for the records of `endpoint` with low <= id < high.
+    """
+    query = [("q[]", f"id:>={low}"), ("q[]", f"id:<{high}")] + list(params.items())
+    return f"{endpoint.url}?{urlencode(query)}"
+
+def truncate_to_millis(value):
+    value = as_utc(value)
+    return value.replace(microsecond=value.microsecond // 1000 * 1000) if value else None
+
+def cliniko_range_summary(session, endpoint, low, high):
+    """
+    (count, max(updated_at)) of Cliniko's records with low <= id < high, in
+    one request: total_entries of the newest-first listing plus its first record.
+    """
+    data = fetch_json(session, id_range_url(endpoint, low, high, sort="updated_at", order="desc", per_page=1))
+    items = page_items(data) or []
+    latest = parse_datetime(items[0].get("updated_at")) if items else None
+    return data.get("total_entries", len(items)), truncate_to_millis(latest)
+
+def listed_by_default(endpoint):
+    """
+    SQL condition for the rows Cliniko's default listing of `endpoint` returns:
+    archived and deleted records (RECONCILE_FILTER_FIELDS) are left out.
+    """
+    conditions = [f"{field} IS NULL" for field in RECONCILE_FILTER_FIELDS if field in endpoint.columns]
+    return " AND ".join(conditions) or "1"
+
+def clickhouse_range_summaries(client, endpoint, low, high, step):
+    """
+    (count, max(updated_at)) per `step`-wide bucket of [low, high), keyed by
+    bucket number, over the rows Cliniko's default listing would return.
+    Tombstoned ids are left out, and each id counts once in its latest version.
+    """
+    rows = client.query(f"""
+    SELECT intDiv(id - %(low)s, %(step)s) AS bucket, count(), max(updated_at)
+    FROM {endpoint.table} FINAL
+    WHERE id >= %(low)s AND id < %(high)s AND {listed_by_default(endpoint)}
+      AND id NOT IN (SELECT id FROM {TOMBSTONES_TABLE} WHERE entity = %(entity)s)
+    GROUP BY bucket
+    """, parameters={"low": low, "high": high, "step": step, "entity": endpoint.name}).result_rows
+    return {bucket: (count, truncate_to_millis(latest)) for bucket, count, latest in rows}
+
+def id_bounds(session, client, endpoint):
+    """
+    [low, high) covering every id on either side, or None when both are empty.
+    """
+    ids = []
+    for order in ("asc", "desc"):
+        data = fetch_json(session, f"{endpoint.url}?{urlencode({'sort': 'id', 'order': order, 'per_page': 1})}")
+        ids += [safe_int(item.get("id")) for item in page_items(data) or []]
+    count, min_id, max_id = client.query(f"SELECT count(), min(id), max(id) FROM {endpoint.table}").result_rows[0]
+    if count:
+        ids += [min_id, max_id]
+    return (min(ids), max(ids) + 1) if ids else None
+
+def check_endpoint(session, client, endpoint, repair=True, dimensions=None, touched=None):
+    """
+    Compare `endpoint` with its table range by range, recursing only into id
+    ranges whose (count, max(updated_at)) differ, and re-sync the differing
+    leaf ranges when `repair` is set (with their sub-resource, enriched and
+    occurrence rows; see sync_endpoint). Rows that only exist in ClickHouse
+    are reported; removing them is --reconcile's job.
+    """
+    summary = {"endpoint": endpoint.name, "ranges": 0, "differing": 0, "refetched": 0, "extra_rows": 0}
+    bounds = id_bounds(session, client, endpoint)
+    if bounds is None:
+        return summary
+    low, high = bounds
+    summary["ranges"] += 1
+    remote = cliniko_range_summary(session, endpoint, low, high)
+    local = clickhouse_range_summaries(client, endpoint, low, high, high - low).get(0, (0, None))
+    pending = [] if remote == local else [(low, high, remote, local)]
+    leaves = []
+    while pending:
+        low, high, remote, local = pending.pop()
+        if remote[0] <= CHECK_LEAF_ROWS or high - low <= CHECK_FANOUT:
+            leaves.append((low, high, remote, local))
+            continue
+        step = -(-(high - low) // CHECK_FANOUT)
+        local_buckets = clickhouse_range_summaries(client, endpoint, low, high, step)
+        for bucket, sub_low in enumerate(range(low, high, step)):
+            sub_high = min(high, sub_low + step)
+            summary["ranges"] += 1
+            sub_remote = cliniko_range_summary(session, endpoint, sub_low, sub_high)
+            sub_local = local_buckets.get(bucket, (0, None))
+            if sub_remote != sub_local:
+                pending.append((sub_low, sub_high, sub_remote, sub_local))
+    for low, high, remote, local in leaves:
+        summary["differing"] += 1
+        summary["extra_rows"] += max(0, local[0] - remote[0])
+        log(logger, logging.DEBUG, "range differs", endpoint=endpoint.name, low=low, high=high,
+            cliniko_rows=remote[0], clickhouse_rows=local[0])
+        if repair and remote[0]:
+            stats = sync_endpoint(session, client, endpoint, url=id_range_url(endpoint, low, high),
+                                  dimensions=dimensions, touched=touched)
+            summary["refetched"] += stats["rows"]
+    log(logger, logging.INFO, "range check finished", **summary)
+    return summary
+
+def check(client_factory=None, session=None, endpoints=None, repair=True):
+    """
+    Range-checksum every enabled endpoint (see check_endpoint).
+    """
+    session = session or make_cliniko_session()
+    client = make_insert_pool(client_factory)
+    ensure_schema(client)
+    load_business_time_zones(client)
+    dimensions = LoadOnce(functools.partial(load_dimensions, client))
+    touched = TouchedDays()
+    try:
+        summaries = [check_endpoint(session, client, endpoint, repair, dimensions, touched)
+                     for endpoint in endpoints or ENDPOINTS if endpoint.enabled]
+        fill_patient_names(client, endpoints or ENDPOINTS, dimensions)
+    finally:
+        if touched:
+            refresh_utilisation(client, touched.keys)
+    client.close()
+    log(logger, logging.INFO, "done")
+    return summaries
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Sync Cliniko data into ClickHouse.")
+    parser.add_argument("--bulk-export", metavar="DIR",
+                        help="write transformed rows to compressed files in DIR instead of inserting")
+    parser.add_argument("--bulk-load", metavar="DIR",
+                        help="bulk-load files previously written with --bulk-export")
+    parser.add_argument("--bulk-format", choices=BULK_FORMATS,
+                        help="file format for --bulk-export (default: parquet when pyarrow is installed)")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="serve Prometheus metrics on this local port while syncing")
+    parser.add_argument("--metrics-summary", default=METRICS_SUMMARY_PATH, metavar="PATH",
+                        help="write a JSON metrics summary here after the run ('' to skip)")
+    parser.add_argument("--profile", default=PROFILE_DIR, metavar="DIR",
+                        help="write per-endpoint cProfile (.prof/.txt) and collapsed-stack (.collapsed) files to DIR")
+    parser.add_argument("--backfill", action="store_true",
+                        help="initial load: sync every endpoint as concurrent, checkpointed time windows")
+    parser.add_argument("--backfill-field", default=BACKFILL_WINDOW_FIELD,
+                        help="timestamp field the backfill windows are cut on (e.g. starts_at)")
+    parser.add_argument("--backfill-workers", type=int, default=BACKFILL_WORKERS)
+    parser.add_argument("--reconcile", action="store_true",
+                        help="refresh archived/deleted records and tombstone ids hard-deleted in Cliniko")
+    parser.add_argument("--check", action="store_true",
+                        help="compare ClickHouse with Cliniko by id-range checksums and re-fetch differing ranges")
+    parser.add_argument("--check-only", action="store_true", help="like --check, but only report differences")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running and sync each endpoint incrementally on its own interval")
+    args = parser.parse_args()
+    PROFILE_DIR = args.profile
+    METRICS_PORT = args.metrics_port
+    METRICS_SUMMARY_PATH = args.metrics_summary
+    if args.bulk_export:
+        export_bulk_files(args.bulk_export, fmt=args.bulk_format)
+    if args.bulk_load:
+        load_bulk_files(args.bulk_load)
+    if args.backfill or args.reconcile or args.check or args.check_only:
+        with run_lock() as acquired:
+            if not acquired:
+                log(logger, logging.WARNING, "another sync holds the run lock, exiting")
+            elif args.backfill:
+                backfill(field=args.backfill_field, workers=args.backfill_workers)
+            elif args.reconcile:
+                reconcile()
+            else:
+                check(repair=not args.check_only)
+    elif args.daemon:
+        run_daemon()
+    elif not (args.bulk_export or args.bulk_load):
+        with run_lock() as acquired:
+            if acquired:
+                main()
+            else:
+                log(logger, logging.WARNING, "another sync holds the run lock, exiting")
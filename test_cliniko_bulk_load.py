@@ -0,0 +1,29 @@
+import glob
+import os
+
+import pytest
+
+from cliniko_bulk_load import BulkFileWriter, ddl_column_types
+from cliniko_projection import ColumnProjection, text_hash
+
+PATIENTS_DDL = """
+    CREATE TABLE IF NOT EXISTS acme_cliniko_patients (
+        id          Int64,
+        notes       String,
+        updated_at  Nullable(DateTime64(3, 'UTC'))
+    ) ENGINE = ReplacingMergeTree(id)
+    ORDER BY id
+"""
+
+def test_parquet_export_keeps_hashes_past_the_signed_range(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    notes = next(f"note {n}" for n in range(1000) if text_hash(f"note {n}") >= 2 ** 63)
+    projection = ColumnProjection(["id", "notes", "updated_at"], {"notes": "hash"})  # as in the lean profile
+    types = ddl_column_types([projection.statement(PATIENTS_DDL)])
+    assert types["acme_cliniko_patients"]["notes_hash"] == "UInt64"
+
+    with BulkFileWriter(str(tmp_path), fmt="parquet", column_types=types) as writer:
+        writer.insert("acme_cliniko_patients", [projection((1, notes, None))], projection.columns)
+
+    table = pq.read_table(glob.glob(os.path.join(tmp_path, "acme_cliniko_patients", "*.parquet"))[0])
+    assert table.column("notes_hash").to_pylist() == [text_hash(notes)]